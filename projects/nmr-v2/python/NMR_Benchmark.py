@@ -0,0 +1,262 @@
+"""
+Reproducible benchmarks of the host-side processing of nmr-v2 acquisitions.
+
+Every benchmark runs on synthetic files written by NMR_Simulator (same .bin / .csv
+layout as the board) over a grid of realistic sizes, and reports for each point
+the wall time (best and median of `repeat` runs, after one warm-up run) and the
+peak Python/numpy memory allocated during one extra run traced with tracemalloc
+(memory-mapped file pages are not counted). Results are written as JSON so two
+runs can be compared:
+
+    python NMR_Benchmark.py --output bench.json
+    python NMR_Benchmark.py --preset quick --only fft,sum_tf --output new.json --compare bench.json
+
+Benchmarks (the open_file steps of NMRApp, in order):
+  open_file_bin, open_file_csv : load + accumulate one file      (FIDs x samples)
+  accumulate                   : accumulate() of loaded FIDs     (FIDs x samples)
+  filter                       : butter_bandpass_filter of one trace, then
+                                 bandpass_filter of a sweep stack (steps x samples)
+  fft                          : batch_spectrum of a sweep        (steps x samples)
+  sum_tf                       : SpectrumStitcher over a sweep    (steps x samples)
+  figure                       : min/max-LTTB decimation + FID/TF plotly figures (steps x samples)
+Points larger than --max-samples (total float samples in memory) are reported as skipped.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import scipy
+
+import NMR_Library as nmr
+import NMR_Spectrum as spectrum
+import NMR_Downsample as downsample
+from NMR_Simulator import SimulatedSample
+
+PRESETS = {
+    "quick": {"fids": [1, 10], "samples": [16384, 131072], "steps": [1, 10]},
+    "full": {"fids": [1, 10, 100, 1000], "samples": [16384, 131072, 1048576], "steps": [1, 10, 100, 500]},
+}
+DECIMATION = 64
+LARMOR = 13.9e6
+STEP_FREQ = 2000.0
+
+def measure(run, repeat=3):
+    """
+    Time run() `repeat` times after a warm-up call, then trace one more call with tracemalloc.
+    Returns a dict: time_min, time_median, times (seconds), peak_memory (bytes).
+    """
+    run()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {"time_min": min(times), "time_median": statistics.median(times), "times": times, "peak_memory": peak}
+
+class Workspace:
+    """Synthetic measurement files, generated once per size in a temporary directory."""
+    def __init__(self, root=None, seed=0):
+        self._tmp = tempfile.TemporaryDirectory(prefix="nmr-bench-") if root is None else None
+        self.root = root if root is not None else self._tmp.name
+        self.sample = SimulatedSample(larmor=LARMOR + 1000, seed=seed)
+        self.files = {}
+
+    def bin_file(self, n_fid, dsize):
+        key = ("bin", n_fid, dsize)
+        if key not in self.files:
+            path = os.path.join(self.root, f"fid_{n_fid}x{dsize}.bin")
+            self.sample.write_bin(path, n_fid, dsize, DECIMATION, LARMOR, self.sample.t90)
+            self.files[key] = path
+        return self.files[key]
+
+    def csv_file(self, n_fid, dsize):
+        key = ("csv", n_fid, dsize)
+        if key not in self.files:
+            path = os.path.join(self.root, f"fid_{n_fid}x{dsize}.csv")
+            raw = self.sample.fids(n_fid, dsize, DECIMATION, LARMOR, self.sample.t90)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(f"{dsize},{DECIMATION},{n_fid},0,0,14\n")
+                np.savetxt(f, raw / nmr.ADC_SCALE, fmt="%.6f", delimiter=",")
+            self.files[key] = path
+        return self.files[key]
+
+    def sweep(self, n_steps, dsize):
+        """Time axis and accumulated traces (n_steps, dsize) of a synthetic sweep."""
+        time_array = nmr.time_axis(dsize, DECIMATION)
+        fid = self.sample.clean_signal(dsize, DECIMATION, LARMOR, self.sample.t90)
+        traces = np.tile(fid, (n_steps, 1)) + self.sample.rng.normal(0.0, 0.01, (n_steps, dsize))
+        return time_array, traces
+
+    def cleanup(self):
+        if self._tmp is not None:
+            self._tmp.cleanup()
+            self._tmp = None
+
+def bench_open_file_bin(ws, n_fid, dsize):
+    path = ws.bin_file(n_fid, dsize)
+    return lambda: nmr.open_file_bin(path, nombre_de_FID=-1)
+
+def bench_open_file_csv(ws, n_fid, dsize):
+    path = ws.csv_file(n_fid, dsize)
+    return lambda: nmr.open_file_csv(path, nombre_de_FID=-1)
+
+def bench_accumulate(ws, n_fid, dsize):
+    _, voltage, _ = nmr.open_file_bin(ws.bin_file(n_fid, dsize), nombre_de_FID=-1)
+    voltage = np.asarray(voltage.raw, np.float64) / nmr.ADC_SCALE     # FIDs already in memory, like open_file_csv
+    return lambda: nmr.accumulate(voltage, nb_accumulated=-1)
+
+def bench_filter(ws, n_steps, dsize):
+    time_array, traces = ws.sweep(n_steps, dsize)
+    fs = 1 / (time_array[1] - time_array[0])
+    if n_steps == 1:
+        return lambda: nmr.butter_bandpass_filter(traces[0], 40e3, 60e3, fs, order=5)
+    return lambda: nmr.bandpass_filter(traces, 40e3, 60e3, fs, order=5)
+
+def bench_fft(ws, n_steps, dsize):
+    time_array, traces = ws.sweep(n_steps, dsize)
+    dt = time_array[1] - time_array[0]
+    return lambda: spectrum.batch_spectrum(traces, dt, n_fft="fast", workers=-1)
+
+def bench_sum_tf(ws, n_steps, dsize):
+    time_array, traces = ws.sweep(n_steps, dsize)
+    freq, mags = spectrum.batch_spectrum(traces, time_array[1] - time_array[0], n_fft="fast")
+    start = LARMOR - 50000
+    def run():
+        stitcher = spectrum.SpectrumStitcher.for_sweep(freq, start, STEP_FREQ, n_steps)
+        stitcher.add_batch(freq, mags, start + STEP_FREQ * np.arange(n_steps))
+        return stitcher.result()
+    return run
+
+def bench_figure(ws, n_steps, dsize):
+    import plotly.graph_objects as go
+    time_array, traces = ws.sweep(n_steps, dsize)
+    freq, mags = spectrum.batch_spectrum(traces, time_array[1] - time_array[0], n_fft="fast")
+    def run():
+        fig1, fig2 = go.Figure(), go.Figure()
+        for i in range(n_steps):
+            time_ds, volt_ds = downsample.minmax_lttb(time_array, traces[i])
+            freq_ds, mag_ds = downsample.minmax_lttb(freq + i * STEP_FREQ, mags[i])
+            fig1.add_trace(go.Scattergl(x=time_ds, y=volt_ds, mode='lines', showlegend=False))
+            fig2.add_trace(go.Scattergl(x=freq_ds, y=mag_ds, mode='lines', showlegend=False))
+        return fig1, fig2
+    return run
+
+# name -> (factory(workspace, count, dsize) returning the function to time, grid axis of count)
+BENCHMARKS = {
+    "open_file_bin": (bench_open_file_bin, "fids"),
+    "open_file_csv": (bench_open_file_csv, "fids"),
+    "accumulate": (bench_accumulate, "fids"),
+    "filter": (bench_filter, "steps"),
+    "fft": (bench_fft, "steps"),
+    "sum_tf": (bench_sum_tf, "steps"),
+    "figure": (bench_figure, "steps"),
+}
+CSV_MAX_SAMPLES = 1 << 23      # text files grow ~10 bytes/sample: keep the CSV points reasonable
+
+def run_benchmarks(preset="full", only=None, repeat=3, max_samples=1 << 27, workspace=None, on_result=None):
+    """
+    Run the benchmarks of `only` (default: all) over the size grid of `preset`.
+    Returns the list of result rows (dicts: benchmark, params, samples, time/memory fields or skipped).
+    """
+    grid = PRESETS[preset] if isinstance(preset, str) else preset
+    ws = workspace if workspace is not None else Workspace()
+    rows = []
+    try:
+        for name in (only or BENCHMARKS):
+            factory, axis = BENCHMARKS[name]
+            limit = min(max_samples, CSV_MAX_SAMPLES) if name == "open_file_csv" else max_samples
+            for count in grid[axis]:
+                for dsize in grid["samples"]:
+                    row = {"benchmark": name, "params": {axis: count, "samples": dsize}, "samples": count * dsize}
+                    if count * dsize > limit:
+                        row["skipped"] = f"{count * dsize} samples > limit {limit}"
+                    else:
+                        row.update(measure(factory(ws, count, dsize), repeat))
+                        row["throughput"] = row["samples"] / row["time_min"] if row["time_min"] > 0 else None
+                    rows.append(row)
+                    if on_result is not None:
+                        on_result(row)
+    finally:
+        if workspace is None:
+            ws.cleanup()
+    return rows
+
+def environment():
+    """Versions and machine description stored with the results."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {"date": datetime.datetime.now().isoformat(timespec="seconds"), "commit": commit,
+            "python": platform.python_version(), "numpy": np.__version__, "scipy": scipy.__version__,
+            "platform": platform.platform(), "processor": platform.processor(), "cpu_count": os.cpu_count()}
+
+def compare(rows, baseline_rows, threshold=0.1):
+    """
+    Compare result rows with a previous run.
+    Returns a list of (benchmark, params, time_ratio, memory_ratio, verdict) where the ratios are
+    new / baseline and verdict is "slower"/"faster"/"" beyond the relative threshold.
+    """
+    baseline = {(r["benchmark"], json.dumps(r["params"], sort_keys=True)): r for r in baseline_rows if "skipped" not in r}
+    report = []
+    for row in rows:
+        old = baseline.get((row["benchmark"], json.dumps(row["params"], sort_keys=True)))
+        if old is None or "skipped" in row:
+            continue
+        time_ratio = row["time_min"] / old["time_min"] if old["time_min"] > 0 else float("inf")
+        memory_ratio = row["peak_memory"] / old["peak_memory"] if old["peak_memory"] > 0 else float("inf")
+        verdict = "slower" if time_ratio > 1 + threshold else "faster" if time_ratio < 1 - threshold else ""
+        report.append((row["benchmark"], row["params"], time_ratio, memory_ratio, verdict))
+    return report
+
+def _format_row(row):
+    params = " ".join(f"{key}={value}" for key, value in row["params"].items())
+    if "skipped" in row:
+        return f"{row['benchmark']:<14} {params:<28} skipped ({row['skipped']})"
+    return f"{row['benchmark']:<14} {params:<28} {row['time_min'] * 1e3:10.2f} ms  {row['peak_memory'] / 2**20:9.1f} MiB"
+
+def main():
+    parser = argparse.ArgumentParser(description="nmr-v2 host processing benchmarks")
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="full")
+    parser.add_argument("--only", help="comma separated benchmarks (" + ",".join(BENCHMARKS) + ")")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-samples", type=int, default=1 << 27, help="skip points with more samples in memory")
+    parser.add_argument("--output", help="JSON file for the results")
+    parser.add_argument("--compare", help="previous JSON results to compare with")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative change reported as slower/faster")
+    args = parser.parse_args()
+
+    only = args.only.split(",") if args.only else None
+    unknown = set(only or []) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(sorted(unknown))}")
+    rows = run_benchmarks(args.preset, only, args.repeat, args.max_samples, on_result=lambda row: print(_format_row(row), flush=True))
+    results = {"environment": environment(), "preset": args.preset, "repeat": args.repeat,
+               "max_samples": args.max_samples, "results": rows}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=1)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"\nComparison with {args.compare} (commit {baseline['environment'].get('commit')}):")
+        for name, params, time_ratio, memory_ratio, verdict in compare(rows, baseline["results"], args.threshold):
+            params = " ".join(f"{key}={value}" for key, value in params.items())
+            print(f"{name:<14} {params:<28} time x{time_ratio:5.2f}  memory x{memory_ratio:5.2f}  {verdict}")
+
+if __name__ == "__main__":
+    main()
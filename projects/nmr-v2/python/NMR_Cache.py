@@ -0,0 +1,138 @@
+"""
+Cache of intermediate processing products (accumulated trace, filtered trace, spectrum).
+
+Entries are keyed by the source file signature (path, size, mtime, or a content
+hash) plus the processing stage and its parameters, so changing a display-only
+option reuses everything computed before while editing/replacing a file or
+changing a filter setting invalidates only what depends on it. Entries live in
+an in-memory LRU and in .npz files on disk, both bounded in size.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+
+def file_signature(path, hash_content=False):
+    """
+    Identity of a source file: absolute path, size and mtime, or the SHA-1 of its
+    content when hash_content is True (survives copies/renames, costs a full read).
+    """
+    if hash_content:
+        digest = hashlib.sha1()
+        with open(path, mode='rb') as file:
+            for block in iter(lambda: file.read(1 << 20), b""):
+                digest.update(block)
+        return {"sha1": digest.hexdigest()}
+    stat = os.stat(path)
+    return {"path": os.path.abspath(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+class ProcessingCache:
+    """
+    Two-level (memory + disk) cache of dicts of numpy arrays.
+    Parameters:
+      cache_dir        : directory of the .npz files (None = memory only)
+      max_memory_bytes : size bound of the in-memory LRU
+      max_disk_bytes   : size bound of cache_dir; oldest-used files are deleted first
+      hash_content     : key files by content hash instead of path/size/mtime
+    Usage:
+      entry = cache.get_or_compute(path, "acc", {}, lambda: {"time": t, "voltage_acc": v})
+    """
+    def __init__(self, cache_dir=None, max_memory_bytes=512 * 2**20, max_disk_bytes=2 * 2**30, hash_content=False):
+        self.cache_dir = cache_dir
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.hash_content = hash_content
+        self.memory = OrderedDict()
+        self.memory_bytes = 0
+        self._lock = threading.Lock()
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, path, stage, params):
+        """Hex key of (file signature, stage, params); params must be JSON-serializable."""
+        blob = json.dumps([file_signature(path, self.hash_content), stage, params], sort_keys=True, default=float)
+        return hashlib.sha1(blob.encode()).hexdigest()
+
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, key + ".npz")
+
+    def _remember(self, key, entry):
+        nbytes = sum(value.nbytes for value in entry.values())
+        with self._lock:
+            if key in self.memory:
+                self.memory_bytes -= self.memory.pop(key)[1]
+            self.memory[key] = (entry, nbytes)
+            self.memory_bytes += nbytes
+            while self.memory_bytes > self.max_memory_bytes and len(self.memory) > 1:
+                self.memory_bytes -= self.memory.popitem(last=False)[1][1]
+
+    def get(self, path, stage, params):
+        """Cached dict of arrays for (path, stage, params), or None."""
+        key = self.key(path, stage, params)
+        with self._lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                return self.memory[key][0]
+        if self.cache_dir is None:
+            return None
+        disk_path = self._disk_path(key)
+        try:
+            with np.load(disk_path) as data:
+                entry = {name: data[name] for name in data.files}
+        except (OSError, ValueError):
+            return None
+        os.utime(disk_path)   # mark as recently used for the disk eviction
+        self._remember(key, entry)
+        return entry
+
+    def put(self, path, stage, params, entry):
+        """
+        Store a dict of arrays for (path, stage, params) in memory and on disk.
+        The arrays are copied: an entry never aliases a caller's buffer (a view into a
+        larger stack, or shared memory released after the call), so it cannot change
+        under the cache nor keep the whole buffer alive.
+        """
+        entry = {name: np.array(value, copy=True) for name, value in entry.items()}
+        key = self.key(path, stage, params)
+        self._remember(key, entry)
+        if self.cache_dir is not None:
+            tmp_path = self._disk_path(key) + ".tmp"
+            with open(tmp_path, mode='wb') as file:
+                np.savez(file, **entry)
+            os.replace(tmp_path, self._disk_path(key))
+            self._evict_disk()
+        return entry
+
+    def get_or_compute(self, path, stage, params, compute):
+        """Cached entry, or compute() -> dict of arrays stored and returned."""
+        entry = self.get(path, stage, params)
+        if entry is None:
+            entry = self.put(path, stage, params, compute())
+        return entry
+
+    def _evict_disk(self):
+        files = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".npz"):
+                stat = os.stat(os.path.join(self.cache_dir, name))
+                files.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in files)
+        for _, size, name in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        with self._lock:
+            self.memory.clear()
+            self.memory_bytes = 0
+        if self.cache_dir is not None:
+            for name in os.listdir(self.cache_dir):
+                if name.endswith(".npz"):
+                    os.remove(os.path.join(self.cache_dir, name))
@@ -0,0 +1,149 @@
+"""
+Adaptive calibration of the 90 degree pulse length (nutation curve).
+
+The signal amplitude after a pulse of length t follows |sin(pi/2 * t / t90)|:
+a first maximum at t90 and a null at t180 = 2 * t90. A linear P90 sweep spends
+most of its acquisitions on uninformative lengths. P90Calibration starts from
+a few lengths around the current guess, fits the nutation model after every
+new point and places the next measurements where they constrain t90 the most:
+on both sides of the predicted null (the sharp |sin| minimum) and at the
+predicted maximum. It stops once the relative uncertainty on t90 is below
+rel_tol, and reports t90 and t180 with their standard errors.
+"""
+import numpy as np
+from scipy.optimize import curve_fit
+
+def nutation_model(t, amplitude, t90, floor):
+    """Peak amplitude after a pulse of length t: |A sin(pi/2 t/t90)| on top of a noise floor (added in quadrature)."""
+    return np.sqrt((amplitude * np.sin(0.5 * np.pi * t / t90)) ** 2 + floor ** 2)
+
+def fit_nutation(durations, amplitudes, t90_guess=None):
+    """
+    Least-squares fit of nutation_model.
+    Returns:
+      params : dict amplitude, t90, floor, t90_err, t180, t180_err
+    Raises RuntimeError when the fit does not converge.
+    """
+    durations = np.asarray(durations, np.float64)
+    amplitudes = np.asarray(amplitudes, np.float64)
+    # |sin| has a period of 2*t90: lengths spaced by more than t90 cannot tell t90 from its aliases
+    low, high = np.diff(np.concatenate([[0.0], np.unique(durations)])).max(), durations.max() * 2
+    if t90_guess is None:
+        # several lobes may have been measured: start from the best t90 of a log grid
+        grid = np.geomspace(low, high, 200)
+        errors = [np.sum((nutation_model(durations, amplitudes.max(), t90, amplitudes.min()) - amplitudes) ** 2) for t90 in grid]
+        t90_guess = grid[int(np.argmin(errors))]
+    p0 = (amplitudes.max(), np.clip(t90_guess, low, high), max(amplitudes.min(), 1e-12))
+    bounds = ((0, low, 0), (np.inf, high, np.inf))
+    popt, pcov = curve_fit(nutation_model, durations, amplitudes, p0=p0, bounds=bounds, maxfev=5000)
+    perr = np.sqrt(np.abs(np.diag(pcov))) if np.all(np.isfinite(pcov)) else np.full(3, np.inf)
+    amplitude, t90, floor = popt
+    return {"amplitude": float(amplitude), "t90": float(t90), "floor": float(floor), "t90_err": float(perr[1]),
+            "t180": float(2 * t90), "t180_err": float(2 * perr[1])}
+
+DEFAULT_MAX_ACQUISITIONS = 12      # initial points plus at least one adaptive round (3 lengths)
+
+class P90Calibration:
+    """
+    Adaptive nutation measurement.
+    Parameters:
+      acquire          : acquire(duration_seconds) -> peak amplitude of the accumulation
+      t90_guess        : current estimate of the 90 degree pulse length (seconds)
+      rel_tol          : stop when t90_err / t90 <= rel_tol, after at least one adaptive round
+      max_acquisitions : acquisition budget
+      initial_points   : lengths measured first, spread over 0.3..2.6 x t90_guess
+      min_duration     : shortest pulse the board can produce (seconds)
+      stop_event       : threading.Event aborting between acquisitions
+      on_step          : optional callback(entry, fit) after each acquisition (fit may be None)
+    run() returns a dict: t90, t90_err, t180, t180_err, converged, acquisitions, points (durations, amplitudes).
+    """
+    def __init__(self, acquire, t90_guess, rel_tol=0.01, max_acquisitions=DEFAULT_MAX_ACQUISITIONS, initial_points=7,
+                 min_duration=1e-7, stop_event=None, on_step=None):
+        self.acquire = acquire
+        self.t90_guess = t90_guess
+        self.rel_tol = rel_tol
+        self.max_acquisitions = max_acquisitions
+        self.initial_points = initial_points
+        self.min_duration = min_duration
+        self.stop_event = stop_event
+        self.on_step = on_step
+        self.durations = []
+        self.amplitudes = []
+
+    def _precise(self, fit):
+        return fit is not None and 0 < fit["t90_err"] <= self.rel_tol * fit["t90"]
+
+    def _stopped(self):
+        return len(self.durations) >= self.max_acquisitions or (self.stop_event is not None and self.stop_event.is_set())
+
+    def _measure(self, duration):
+        duration = max(float(duration), self.min_duration)
+        amplitude = float(self.acquire(duration))
+        self.durations.append(duration)
+        self.amplitudes.append(amplitude)
+        fit = self._fit()
+        if self.on_step is not None:
+            self.on_step({"duration": duration, "amplitude": amplitude}, fit)
+        return fit
+
+    def _fit(self):
+        if len(self.durations) < 4:
+            return None
+        try:
+            return fit_nutation(self.durations, self.amplitudes)
+        except (RuntimeError, ValueError):
+            return None
+
+    def _next_durations(self, fit):
+        """Next lengths: both sides of the predicted null, then the predicted maximum."""
+        t90, t180 = fit["t90"], fit["t180"]
+        half_width = min(max(3 * fit["t180_err"], 0.02 * t180), 0.3 * t180)
+        return [t180 - half_width, t180 + half_width, t90]
+
+    def run(self):
+        self.durations = []
+        self.amplitudes = []
+        fit = None
+        for duration in np.linspace(0.3, 2.6, self.initial_points) * self.t90_guess:
+            if self._stopped():
+                break
+            fit = self._measure(duration)
+        converged = False
+        rounds = 0
+        while not self._stopped():
+            if rounds and self._precise(fit):
+                converged = True
+                break
+            if fit is None:
+                # not enough structure yet: extend the range beyond the longest length measured
+                candidates = [max(self.durations) * 1.3]
+            else:
+                candidates = self._next_durations(fit)
+            for duration in candidates:
+                if self._stopped():
+                    break
+                fit = self._measure(duration)
+            rounds += 1
+        converged = converged or (rounds > 0 and self._precise(fit))
+        result = {"t90": None, "t90_err": None, "t180": None, "t180_err": None} if fit is None else \
+            {key: fit[key] for key in ("t90", "t90_err", "t180", "t180_err")}
+        result.update(converged=bool(converged), acquisitions=len(self.durations),
+                      points=(np.array(self.durations), np.array(self.amplitudes)))
+        return result
+
+class SimulatedNutation:
+    """
+    Synthetic nutation measurement for testing: nutation_model(t, amplitude, t90, 0) plus
+    Rician-like noise (magnitude of the signal plus complex Gaussian noise of std noise).
+    """
+    def __init__(self, t90, amplitude=1.0, noise=0.02, seed=0):
+        self.t90 = t90
+        self.amplitude = amplitude
+        self.noise = noise
+        self.rng = np.random.default_rng(seed)
+        self.calls = 0
+
+    def __call__(self, duration):
+        self.calls += 1
+        signal = self.amplitude * np.sin(0.5 * np.pi * duration / self.t90)
+        return float(np.abs(signal + self.rng.normal(0, self.noise) + 1j * self.rng.normal(0, self.noise)))
@@ -0,0 +1,235 @@
+"""
+Versioned chunked container for a whole sweep (one file, .nmrc).
+
+Layout:
+  prefix  : 16 bytes "<4sHHQ" = magic b"NMRC", format version, flags (0), offset of the index
+  chunks  : the FIDs of every step, cut in blocks of at most chunk_fids FIDs, each block
+            stored as raw little-endian bytes, optionally byte-shuffled and zlib-compressed
+  index   : UTF-8 JSON written at the end by close(): sweep metadata, and for every step
+            its metadata (Larmor frequency, pulse length, echo time, dt, ...), dtype,
+            shape and the (offset, size) of each chunk
+
+Any step or FID is read by seeking to the chunks that hold it, without touching
+the rest of the file. Raw int16 ADC blocks and complex baseband blocks (see
+NMR_DDC) are both stored as-is; an index offset of 0 marks a file whose writer
+did not close it.
+"""
+import json
+import struct
+import threading
+import zlib
+import numpy as np
+
+import NMR_Library as nmr
+
+MAGIC = b"NMRC"
+VERSION = 1
+PREFIX = struct.Struct("<4sHHQ")
+COMPRESSIONS = (None, "zlib")
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+def _encode(block, compression, shuffle, level):
+    data = block.tobytes()
+    if compression is None:
+        return data
+    if shuffle and block.itemsize > 1:
+        # group the k-th byte of every sample together: the slowly varying high bytes compress far better
+        data = np.frombuffer(data, dtype=np.uint8).reshape(-1, block.itemsize).T.tobytes()
+    return zlib.compress(data, level)
+
+def _decode(data, chunk, dtype, dsize):
+    if chunk["compression"] == "zlib":
+        data = zlib.decompress(data)
+        if chunk["shuffle"] and dtype.itemsize > 1:
+            data = np.frombuffer(data, dtype=np.uint8).reshape(dtype.itemsize, -1).T.tobytes()
+    return np.frombuffer(data, dtype=dtype).reshape(chunk["n_fid"], dsize)
+
+class SweepWriter:
+    """
+    Write the steps of a sweep into one container file.
+    Parameters:
+      path        : output file
+      metadata    : JSON-serializable dict describing the whole sweep (mode, ip, ...)
+      compression : None or "zlib" (lossless)
+      shuffle     : byte-shuffle compressed chunks (better ratio on int16/complex samples)
+      level       : zlib level
+      chunk_fids  : FIDs per chunk, the granularity of random access
+    add_step may be called from several threads (e.g. the processing workers of a
+    sweep): chunks are compressed in the calling thread, only the writes are serialized,
+    and steps are stored in the order they were added.
+    Usage:
+      with SweepWriter("sweep.nmrc", {"mode": "SweepFreq"}, compression="zlib") as writer:
+          writer.add_step(raw, {"larmor_Frequency_Hertz": 13.9e6, "dt": 16e-9})
+    """
+    def __init__(self, path, metadata=None, compression="zlib", shuffle=True, level=6, chunk_fids=64):
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"compression must be one of {COMPRESSIONS}, got {compression!r}")
+        self.path = path
+        self.metadata = dict(metadata or {})
+        self.compression = compression
+        self.shuffle = shuffle
+        self.level = level
+        self.chunk_fids = chunk_fids
+        self.steps = []
+        self._lock = threading.Lock()
+        self._file = open(path, mode='wb')
+        self._file.write(PREFIX.pack(MAGIC, VERSION, 0, 0))
+
+    def add_step(self, fids, metadata=None):
+        """
+        Append one step. fids : (n_fid, dsize) array, np.memmap or nmr.ScaledFIDs (its raw
+        int16 samples are stored and its scale is recorded as "scale"). Returns the step index.
+        """
+        metadata = dict(metadata or {})
+        if isinstance(fids, nmr.ScaledFIDs):
+            metadata.setdefault("scale", fids.scale)
+            fids = fids.raw
+        fids = np.asarray(fids)
+        if fids.ndim == 1:
+            fids = fids[np.newaxis]
+        dtype = fids.dtype.newbyteorder('<') if fids.dtype.byteorder == '>' else fids.dtype
+        encoded = []
+        for start in range(0, len(fids), self.chunk_fids):
+            block = np.ascontiguousarray(fids[start:start + self.chunk_fids], dtype=dtype)
+            encoded.append((start, len(block), _encode(block, self.compression, self.shuffle, self.level)))
+        with self._lock:
+            chunks = []
+            for start, n_fid, data in encoded:
+                chunks.append({"fid_start": start, "n_fid": n_fid, "offset": self._file.tell(), "nbytes": len(data),
+                               "compression": self.compression, "shuffle": self.shuffle})
+                self._file.write(data)
+            self.steps.append({"metadata": metadata, "dtype": dtype.str, "n_fid": len(fids), "dsize": fids.shape[1], "chunks": chunks})
+            return len(self.steps) - 1
+
+    def add_bin_file(self, file_path, metadata=None):
+        """
+        Append the FIDs of an nmr-v2 .bin file as one step. The .bin header fields (decimation,
+        gain) are stored with the step metadata, together with dt and the ADC scale, so
+        read_step gives volts exactly like open_file_bin. Returns the step index.
+        """
+        header, raw = nmr.map_file_bin(file_path)
+        metadata = dict(metadata or {})
+        metadata.update(decimation=header["decimation"], gain=header["gain"],
+                        dt=header["decimation"] / nmr.SAMPLING_RATE, scale=nmr.ADC_SCALE)
+        return self.add_step(raw, metadata)
+
+    def close(self):
+        """Write the index and its offset; the file is readable only after this."""
+        with self._lock:
+            if self._file is None:
+                return
+            index_offset = self._file.tell()
+            index = {"version": VERSION, "metadata": self.metadata, "steps": self.steps}
+            self._file.write(json.dumps(index, default=_json_default).encode("utf-8"))
+            self._file.seek(0)
+            self._file.write(PREFIX.pack(MAGIC, VERSION, 0, index_offset))
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class SweepReader:
+    """
+    Random access to the steps and FIDs of a container file.
+    Attributes:
+      metadata : sweep metadata dict
+      steps    : list of per-step index entries (metadata, dtype, n_fid, dsize, chunks)
+    """
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, mode='rb')
+        magic, version, _, index_offset = PREFIX.unpack(self._file.read(PREFIX.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not an NMR container file")
+        if version > VERSION:
+            raise ValueError(f"container version {version} is newer than supported ({VERSION})")
+        if index_offset == 0:
+            raise ValueError(f"{path} was not closed properly (no index)")
+        self._file.seek(index_offset)
+        index = json.loads(self._file.read().decode("utf-8"))
+        self.version = version
+        self.metadata = index["metadata"]
+        self.steps = index["steps"]
+
+    def __len__(self):
+        return len(self.steps)
+
+    def step_metadata(self, step):
+        return self.steps[step]["metadata"]
+
+    def _read_chunk(self, entry, chunk):
+        self._file.seek(chunk["offset"])
+        return _decode(self._file.read(chunk["nbytes"]), chunk, np.dtype(entry["dtype"]), entry["dsize"])
+
+    def read_fids(self, step, start=0, stop=None):
+        """Raw FIDs start:stop of a step, reading only the chunks that hold them."""
+        entry = self.steps[step]
+        start, stop, _ = slice(start, stop).indices(entry["n_fid"])
+        out = np.empty((max(stop - start, 0), entry["dsize"]), dtype=np.dtype(entry["dtype"]))
+        for chunk in entry["chunks"]:
+            lo = max(start, chunk["fid_start"])
+            hi = min(stop, chunk["fid_start"] + chunk["n_fid"])
+            if lo < hi:
+                block = self._read_chunk(entry, chunk)
+                out[lo - start:hi - start] = block[lo - chunk["fid_start"]:hi - chunk["fid_start"]]
+        return out
+
+    def read_fid(self, step, fid):
+        """One raw FID of a step."""
+        return self.read_fids(step, fid, fid + 1)[0]
+
+    def read_step(self, step):
+        """All FIDs of a step, as nmr.ScaledFIDs when a scale was recorded, else the stored array."""
+        return self._scaled(step, self.read_fids(step))
+
+    def iter_blocks(self, step):
+        """Yield the FIDs of a step chunk by chunk (as read_step), e.g. for nmr.accumulate_fids."""
+        entry = self.steps[step]
+        for chunk in entry["chunks"]:
+            yield self._scaled(step, self._read_chunk(entry, chunk))
+
+    def _scaled(self, step, raw):
+        scale = self.step_metadata(step).get("scale")
+        return nmr.ScaledFIDs(raw, scale) if scale is not None else raw
+
+    def time_axis(self, step):
+        """Time axis (seconds) of a step from its "dt" (and optional "t0", baseband steps) metadata."""
+        metadata = self.step_metadata(step)
+        return np.arange(self.steps[step]["dsize"]) * metadata["dt"] + metadata.get("t0", 0.0)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def pack_bin_files(path, steps, metadata=None, compression="zlib", chunk_fids=64):
+    """
+    Pack the .bin files of a sweep into one container.
+    Parameters:
+      path     : output container file
+      steps    : list of dicts with a "file" key (path of the step's .bin file) plus the
+                 step metadata (larmor_Frequency_Hertz, excitation_duration_seconds, ...)
+      metadata : sweep metadata
+    The .bin files are left in place (see SweepWriter.add_bin_file). During an
+    acquisition, add each step as it is processed rather than packing afterwards.
+    """
+    with SweepWriter(path, metadata, compression=compression, chunk_fids=chunk_fids) as writer:
+        for step in steps:
+            writer.add_bin_file(step["file"], {key: value for key, value in step.items() if key != "file"})
+    return path
@@ -0,0 +1,189 @@
+"""
+Host-side digital downconverter (DDC) for raw nmr-v2 FIDs.
+
+The board records the RF signal itself at 125 MHz / decimation, so a FID at the
+Larmor frequency needs ~10^5 real samples although the NMR line is only a few
+kHz wide. The DDC mixes each FID with a numerically controlled oscillator (NCO)
+at the Larmor frequency, low-pass filters it with the same chain as the
+pulsed_nmr FPGA design (CIC decimator followed by a CIC-compensating FIR
+designed like projects/pulsed_nmr/filters/fir_0.r) and keeps one complex
+baseband sample every cic_decimation * fir_decimation input samples (100 by default).
+
+Both filter stages run as polyphase decimators (scipy.signal.upfirdn) over a
+whole (n_fid, dsize) block at once; stacks and files are processed block by block.
+
+The nmr-v2 records hold the line at the intermediate frequency (IF_OFFSET_HZ for a
+line at the excitation frequency), so that is where the NCO sits by default.
+downconvert_step gives a baseband step ready for NMR_Container.SweepWriter.add_step:
+the acquisition UI uses it to store sweeps with ~100x fewer samples (~25x fewer
+bytes than the int16 records, as complex64), and open_file reads such steps back
+(NMR_Spectrum.baseband_spectrum).
+"""
+import functools
+import numpy as np
+from scipy import signal
+
+import NMR_Library as nmr
+from NMR_Tracking import IF_OFFSET_HZ
+
+def cic_taps(decimation, delay=1, stages=6):
+    """
+    Impulse response of a CIC decimator (stages cascaded moving sums of
+    decimation*delay samples), normalized to unit DC gain.
+    """
+    boxcar = np.ones(decimation * delay)
+    taps = np.ones(1)
+    for _ in range(stages):
+        taps = np.convolve(taps, boxcar)
+    return taps / taps.sum()
+
+@functools.lru_cache(maxsize=16)
+def design_cic_compensator(decimation, delay=1, stages=6, fc=0.247, htbw=0.007, ripple=2**-16):
+    """
+    Kaiser-window FIR that low-passes the CIC output and flattens its passband droop
+    (python port of projects/pulsed_nmr/filters/fir_0.r).
+    Parameters:
+      decimation, delay, stages : CIC parameters R, M, N
+      fc     : cutoff frequency, in units of the CIC output rate
+      htbw   : half transition bandwidth, same units
+      ripple : pass/stop band deviation (1/2^16 as in fir_0.r)
+    Returns:
+      taps : read-only float64 array normalized to unit DC gain
+    """
+    numtaps, beta = signal.kaiserord(-20 * np.log10(ripple), 4 * htbw)
+    step = 0.001
+    fp = np.arange(0.0, fc - htbw + step / 2, step)
+    fs = np.append(np.arange(fc + htbw, 0.5, step), 0.5)
+    gain_pass = np.ones(len(fp))
+    x = fp[1:]
+    gain_pass[1:] = np.abs(delay * decimation * np.sin(np.pi * x / decimation) / np.sin(np.pi * delay * x)) ** stages
+    taps = signal.firwin2(numtaps, np.concatenate([fp, fs]), np.concatenate([gain_pass, np.zeros(len(fs))]),
+                          window=('kaiser', beta), fs=1.0)
+    taps /= taps.sum()
+    taps.flags.writeable = False
+    return taps
+
+class DigitalDownconverter:
+    """
+    NCO mixing + CIC + compensating FIR decimation of real FIDs to complex baseband.
+    Parameters:
+      f_nco          : NCO frequency in Hz, a frequency of the recorded signal (IF_OFFSET_HZ
+                       for nmr-v2 records); a line at f_nco + df comes out at +df
+      dt             : sampling step of the input FIDs in seconds
+      cic_decimation : CIC decimation factor R
+      cic_stages     : number of CIC stages N
+      cic_delay      : CIC differential delay M
+      fir_decimation : decimation of the compensating FIR stage
+    Attributes:
+      decimation : total decimation factor
+      dt_out     : sampling step of the baseband output
+      delay      : group delay of the filter chain in seconds, removed from the output
+    The output is scaled by 2 so that its magnitude is the amplitude of the RF signal.
+    """
+    def __init__(self, f_nco, dt, cic_decimation=50, cic_stages=6, cic_delay=1, fir_decimation=2):
+        self.f_nco = f_nco
+        self.dt = dt
+        self.cic_decimation = cic_decimation
+        self.fir_decimation = fir_decimation
+        self.cic = cic_taps(cic_decimation, cic_delay, cic_stages)
+        self.fir = design_cic_compensator(cic_decimation, cic_delay, cic_stages)
+        self.decimation = cic_decimation * fir_decimation
+        self.dt_out = dt * self.decimation
+        delay_samples = (len(self.cic) - 1) / 2 + cic_decimation * (len(self.fir) - 1) / 2
+        self.delay = delay_samples * dt
+        self._first = int(np.ceil(delay_samples / self.decimation))   # first output at t >= 0
+        self._delay_samples = delay_samples
+        self._lo = None
+
+    def output_length(self, dsize):
+        """Number of baseband samples kept for a FID of dsize samples."""
+        return max(int((dsize - 1 + self._delay_samples) // self.decimation) - self._first + 1, 0)
+
+    def time_axis(self, dsize):
+        """Time axis (seconds) of the baseband samples, aligned with the input time axis."""
+        k = np.arange(self._first, self._first + self.output_length(dsize))
+        return (k * self.decimation - self._delay_samples) * self.dt
+
+    def local_oscillator(self, dsize):
+        """exp(-2j*pi*f_nco*t) * 2 for one FID, computed once per record length."""
+        if self._lo is None or len(self._lo) != dsize:
+            self._lo = 2 * np.exp(-2j * np.pi * self.f_nco * self.dt * np.arange(dsize))
+        return self._lo
+
+    def process(self, block):
+        """
+        Downconvert a block of FIDs.
+        Parameters:
+          block : (n_fid, dsize) or (dsize,) array of volts, or nmr.ScaledFIDs (raw int16,
+                  scaled inside the mixing product without an intermediate volts copy)
+        Returns:
+          baseband : complex128 array (n_fid, n_out) or (n_out,)
+        """
+        if isinstance(block, nmr.ScaledFIDs):
+            raw = np.asarray(block.raw)
+            mixed = raw * (self.local_oscillator(raw.shape[-1]) / block.scale)
+        else:
+            block = np.asarray(block)
+            mixed = block * self.local_oscillator(block.shape[-1])
+        n_out = self.output_length(mixed.shape[-1])
+        baseband = signal.upfirdn(self.cic, mixed, down=self.cic_decimation, axis=-1)
+        baseband = signal.upfirdn(self.fir, baseband, down=self.fir_decimation, axis=-1)
+        return baseband[..., self._first:self._first + n_out]
+
+    def downconvert(self, fids, block_size=64, dtype=np.complex64):
+        """
+        Downconvert a stack of FIDs block by block into one preallocated array.
+        Parameters:
+          fids       : 2D array / np.memmap / ScaledFIDs (n_fid, dsize)
+          block_size : FIDs processed per block (bounds the float temporaries)
+          dtype      : dtype of the result (complex64 halves the storage)
+        Returns:
+          baseband : array (n_fid, n_out) of dtype
+        """
+        n_fid, dsize = fids.shape
+        out = np.empty((n_fid, self.output_length(dsize)), dtype=dtype)
+        start = 0
+        for block in nmr.iter_fid_blocks(fids, block_size):
+            out[start:start + len(block)] = self.process(block)
+            start += len(block)
+        return out
+
+def downconvert_file(pathFile_bin, larmor_Frequency_Hertz, block_size=64, **ddc_options):
+    """
+    Downconvert every FID of a .bin measurement file, reading it block by block from a memory map.
+    Parameters:
+      pathFile_bin           : path to binary file
+      larmor_Frequency_Hertz : NCO frequency
+      block_size             : FIDs read and processed per block
+      ddc_options            : cic_decimation, cic_stages, cic_delay, fir_decimation
+    Returns:
+      time     : baseband time axis in seconds
+      baseband : complex64 array (nombre_de_FID, n_out)
+      header   : dict from nmr.read_header_bin
+    """
+    header, raw = nmr.map_file_bin(pathFile_bin)
+    dt = header["decimation"] / nmr.SAMPLING_RATE
+    ddc = DigitalDownconverter(larmor_Frequency_Hertz, dt, **ddc_options)
+    baseband = ddc.downconvert(nmr.ScaledFIDs(raw), block_size)
+    return ddc.time_axis(header["dsize"]), baseband, header
+
+def downconvert_step(pathFile_bin, f_nco=IF_OFFSET_HZ, block_size=64, **ddc_options):
+    """
+    Baseband version of a .bin measurement file, as one container step.
+    Parameters:
+      pathFile_bin : path to binary file
+      f_nco        : NCO frequency (default: the IF of a line at the excitation frequency)
+      block_size, ddc_options : as downconvert_file
+    Returns:
+      baseband : complex64 array (nombre_de_FID, n_out), in volts
+      metadata : step metadata for SweepWriter.add_step: baseband=True, f_nco, dt and t0 of the
+                 baseband time axis, total ddc_decimation, and the .bin header decimation/gain
+    """
+    header, raw = nmr.map_file_bin(pathFile_bin)
+    dt = header["decimation"] / nmr.SAMPLING_RATE
+    ddc = DigitalDownconverter(f_nco, dt, **ddc_options)
+    baseband = ddc.downconvert(nmr.ScaledFIDs(raw), block_size)
+    time = ddc.time_axis(header["dsize"])
+    metadata = {"baseband": True, "f_nco": float(f_nco), "dt": ddc.dt_out, "t0": float(time[0]) if len(time) else 0.0,
+                "ddc_decimation": ddc.decimation, "decimation": header["decimation"], "gain": header["gain"]}
+    return baseband, metadata
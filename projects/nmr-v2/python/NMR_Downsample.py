@@ -0,0 +1,80 @@
+"""
+Bounded-size downsampling of traces for static plots and HTML export.
+
+A 131072-sample FID drawn at full resolution is hundreds of times more points
+than a screen can show. minmax_lttb keeps the visual shape with a fixed number
+of points per trace: a min/max pre-selection keeps every peak, then
+Largest-Triangle-Three-Buckets (LTTB) picks the most significant of them.
+The Dash viewer (FigureResampler) still serves full resolution on zoom.
+"""
+import numpy as np
+
+DEFAULT_N_OUT = 2000    # points per trace in static figures
+
+def minmax_indices(y, n_out):
+    """
+    Indices of the min and max of y in n_out//2 equal buckets (sorted, first and last samples kept).
+    """
+    n = len(y)
+    if n <= n_out:
+        return np.arange(n)
+    buckets = max(n_out // 2, 1)
+    width = -(-n // buckets)    # ceil
+    padded = np.pad(np.asarray(y), (0, buckets * width - n), mode='edge').reshape(buckets, width)
+    starts = np.arange(buckets) * width
+    idx = np.concatenate([starts + padded.argmin(axis=1), starts + padded.argmax(axis=1), [0, n - 1]])
+    return np.unique(np.minimum(idx, n - 1))
+
+def lttb_indices(x, y, n_out, passes=2):
+    """
+    Largest-Triangle-Three-Buckets selection of n_out indices (first and last samples kept).
+    All buckets are evaluated at once with numpy (no Python loop over buckets): the
+    sequential anchor of LTTB (the point picked in the previous bucket) is replaced by the
+    previous bucket's average on the first pass, then by the previous pass's pick, `passes`
+    times. The result is one point per bucket chosen by triangle area, like LTTB, but not
+    always the same point as the sequential algorithm.
+    """
+    n = len(y)
+    if n <= n_out or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)   # n_out - 2 inner buckets
+    starts = edges[:-1]
+    stops = np.maximum(edges[1:], starts + 1)
+    counts = stops - starts
+    # bucket averages from cumulative sums; the point after the last bucket is the last sample
+    sum_x = np.concatenate([[0.0], np.cumsum(x)])
+    sum_y = np.concatenate([[0.0], np.cumsum(y)])
+    mean_x = (sum_x[stops] - sum_x[starts]) / counts
+    mean_y = (sum_y[stops] - sum_y[starts]) / counts
+    cx = np.append(mean_x[1:], x[-1])
+    cy = np.append(mean_y[1:], y[-1])
+    # (buckets, widest bucket) matrix of candidate indices, padding masked out
+    cols = starts[:, np.newaxis] + np.arange(counts.max())
+    valid = cols < stops[:, np.newaxis]
+    cols = np.minimum(cols, n - 1)
+    xs, ys = x[cols], y[cols]
+    rows = np.arange(len(cols))
+    ax = np.concatenate([[x[0]], mean_x[:-1]])
+    ay = np.concatenate([[y[0]], mean_y[:-1]])
+    for _ in range(max(passes, 1)):
+        area = np.abs((ax - cx)[:, np.newaxis] * (ys - ay[:, np.newaxis]) - (ax[:, np.newaxis] - xs) * (cy - ay)[:, np.newaxis])
+        area[~valid] = -1.0
+        picked = cols[rows, area.argmax(axis=1)]
+        ax = np.concatenate([[x[0]], x[picked[:-1]]])
+        ay = np.concatenate([[y[0]], y[picked[:-1]]])
+    return np.concatenate([[0], picked, [n - 1]])
+
+def minmax_lttb(x, y, n_out=DEFAULT_N_OUT, minmax_ratio=4):
+    """
+    Downsample (x, y) to at most n_out points: min/max pre-selection of n_out*minmax_ratio
+    points, then LTTB. Returns (x_out, y_out); short traces are returned unchanged.
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    if len(y) <= n_out:
+        return x, y
+    pre = minmax_indices(y, n_out * minmax_ratio)
+    keep = pre[lttb_indices(x[pre], y[pre], n_out)]
+    return x[keep], y[keep]
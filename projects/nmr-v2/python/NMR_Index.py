@@ -0,0 +1,262 @@
+"""
+Index (manifest) of the steps of a sweep folder.
+
+create_file_wdate makes one folder per sweep; every step is a file named
+<exp_name><index>. The index records, for each step, its file, acquisition
+parameters, byte size/mtime and summary statistics of its spectrum (peak
+frequency, peak amplitude, SNR), so that a sweep can be listed, filtered and
+opened without decoding every file, and steps are found by number instead of
+by string manipulation of the file name (which breaks at step 10).
+
+The index is an append-only JSON Lines file (index.jsonl): one "sweep" line with
+the sweep metadata, then one "step" line per step, appended as each step is
+processed during acquisition (O(1) per step; a later line for the same index
+replaces the earlier one). refresh() rebuilds it by scanning the folder,
+recomputing the summary only for the files that are new or changed.
+"""
+import json
+import os
+import re
+import threading
+import numpy as np
+
+import NMR_Pipeline as pipeline
+from NMR_Live import spectral_snr
+
+INDEX_FILE = "index.jsonl"
+STEP_FILE_PATTERN = re.compile(r"^(?P<name>\D.*?)(?P<index>\d+)$")
+
+def match_step_file(name, exp_name=None):
+    """
+    Step number of a file named <exp_name><index>, or None. With a known exp_name the
+    split is anchored on it (an exp_name ending in digits, e.g. "sample2_", stays whole);
+    otherwise STEP_FILE_PATTERN takes the trailing digits as the step number.
+    """
+    if exp_name is not None:
+        rest = name[len(exp_name):] if name.startswith(exp_name) else ""
+        return int(rest) if rest.isdigit() else None
+    match = STEP_FILE_PATTERN.match(name)
+    return int(match["index"]) if match else None
+
+def parse_folder_name(folder):
+    """
+    Sweep parameters encoded by run_acquisition in the folder name
+    (<prefix><nb_files>_<step_freq>_<larmor>_<date>_<time>), or {} if it does not match.
+    """
+    parts = os.path.basename(os.path.normpath(folder)).split('_')
+    try:
+        return {"mode": parts[0], "nb_files": int(parts[1]), "step_freq": float(parts[2]), "larmor_Frequency_Hertz": float(parts[3])}
+    except (IndexError, ValueError):
+        return {}
+
+def spectrum_summary(freq, mag):
+    """Summary statistics of a magnitude spectrum: peak frequency, peak amplitude and SNR."""
+    peak = int(np.argmax(mag))
+    return {"peak_frequency": float(freq[peak]), "peak_amplitude": float(mag[peak]), "snr": spectral_snr(mag)}
+
+class SweepIndex:
+    """
+    Manifest of one sweep folder.
+    Parameters:
+      folder   : sweep folder
+      metadata : sweep metadata (written as the first line of a new index)
+    Attributes:
+      metadata : dict
+      entries  : dict step index -> entry (file, size, mtime_ns, parameters, summary)
+    Usage:
+      sweep_index = SweepIndex.open(folder)                 # load + refresh, or build
+      paths = sweep_index.paths()                          # step files in step order
+      strong = sweep_index.select(lambda e: e["snr"] > 10)
+    """
+    def __init__(self, folder, metadata=None):
+        self.folder = folder
+        self.metadata = dict(metadata or {})
+        self.entries = {}
+        self._by_file = {}
+        self._lock = threading.Lock()
+
+    @property
+    def path(self):
+        return os.path.join(self.folder, INDEX_FILE)
+
+    def _append(self, record):
+        with open(self.path, mode='a', encoding='utf-8') as file:
+            file.write(json.dumps(record, default=float) + "\n")
+
+    def _set(self, entry):
+        previous = self.entries.get(entry["index"])
+        if previous is not None:
+            self._by_file.pop(previous["file"], None)
+        self.entries[entry["index"]] = entry
+        self._by_file[entry["file"]] = entry
+
+    def start(self):
+        """Create a new index file holding only the sweep metadata (called before the first step)."""
+        with self._lock:
+            self.entries.clear()
+            self._by_file.clear()
+            with open(self.path, mode='w', encoding='utf-8') as file:
+                file.write(json.dumps({"type": "sweep", **self.metadata}, default=float) + "\n")
+        return self
+
+    def add(self, index, file, params=None, summary=None):
+        """
+        Record one step and append it to the index file.
+        Parameters:
+          index   : step number
+          file    : step file name, relative to the folder
+          params  : acquisition parameters of the step (larmor_Frequency_Hertz, ...)
+          summary : dict from spectrum_summary (or None if not processed)
+        """
+        stat = os.stat(os.path.join(self.folder, file))
+        entry = {"index": int(index), "file": file, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        entry.update(params or {})
+        entry.update(summary or {})
+        with self._lock:
+            self._set(entry)
+            self._append({"type": "step", **entry})
+        return entry
+
+    def set_summary(self, index, summary):
+        """Add the spectrum summary of an already indexed step (refreshed with summarize=False) and append it."""
+        with self._lock:
+            entry = dict(self.entries[index], **summary)
+            self._set(entry)
+            self._append({"type": "step", **entry})
+        return entry
+
+    def save(self):
+        """Rewrite the index file from memory (compacts replaced lines)."""
+        with self._lock:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, mode='w', encoding='utf-8') as file:
+                file.write(json.dumps({"type": "sweep", **self.metadata}, default=float) + "\n")
+                for index in sorted(self.entries):
+                    file.write(json.dumps({"type": "step", **self.entries[index]}, default=float) + "\n")
+            os.replace(tmp_path, self.path)
+
+    @classmethod
+    def load(cls, folder):
+        """Read index.jsonl of a folder (later step lines replace earlier ones)."""
+        sweep_index = cls(folder)
+        with open(sweep_index.path, encoding='utf-8') as file:
+            for line in file:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue    # line truncated by an interrupted write
+                kind = record.pop("type", "step")
+                if kind == "sweep":
+                    sweep_index.metadata = record
+                else:
+                    sweep_index._set(record)
+        return sweep_index
+
+    def refresh(self, exp_name=None, summarize=True):
+        """
+        Bring the index in line with the folder: add step files that are missing, recompute
+        entries whose file changed (size/mtime), drop entries whose file disappeared.
+        Parameters:
+          exp_name  : only index files named <exp_name><index> (None = the exp_name of the
+                      sweep metadata if recorded, else all step-like files)
+          summarize : compute the spectrum summary of new/changed files (decodes them)
+        Returns the number of entries added or updated.
+        """
+        if not self.metadata:
+            self.metadata = parse_folder_name(self.folder)
+        if exp_name is None:
+            exp_name = self.metadata.get("exp_name")
+        found = {}
+        with os.scandir(self.folder) as it:
+            for dir_entry in it:
+                index = match_step_file(dir_entry.name, exp_name)
+                if index is not None and dir_entry.is_file():
+                    found[dir_entry.name] = (index, dir_entry.stat())
+        changed = 0
+        for name, (index, stat) in found.items():
+            entry = self._by_file.get(name)
+            if entry is not None and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+                continue
+            params = {}
+            if "larmor_Frequency_Hertz" in self.metadata:
+                params["larmor_Frequency_Hertz"] = self.metadata["larmor_Frequency_Hertz"] + index * self.metadata.get("step_freq", 0)
+            summary = None
+            if summarize:
+                try:
+                    result = pipeline.process_file(os.path.join(self.folder, name))
+                    summary = spectrum_summary(result["freq"], result["mag"])
+                except (OSError, ValueError):
+                    summary = {"error": "unreadable"}
+            stat_entry = {"index": index, "file": name, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+            stat_entry.update(params)
+            stat_entry.update(summary or {})
+            with self._lock:
+                self._set(stat_entry)
+            changed += 1
+        for name in [name for name in self._by_file if name not in found]:
+            with self._lock:
+                entry = self._by_file.pop(name)
+                self.entries.pop(entry["index"], None)
+            changed += 1
+        if changed or not os.path.exists(self.path):
+            self.save()
+        return changed
+
+    @classmethod
+    def open(cls, folder, exp_name=None, summarize=True, step_file=None):
+        """
+        Load the folder's index if it exists, then refresh it (builds it from scratch otherwise).
+        step_file (the name of one step file, e.g. the one picked by the user) gives the exp_name
+        when neither exp_name nor the index metadata does.
+        """
+        sweep_index = cls.load(folder) if os.path.exists(os.path.join(folder, INDEX_FILE)) else cls(folder)
+        if exp_name is None and "exp_name" not in sweep_index.metadata and step_file is not None:
+            match = STEP_FILE_PATTERN.match(step_file)
+            exp_name = match["name"] if match else None
+        sweep_index.refresh(exp_name, summarize)
+        return sweep_index
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        """Entries in step order."""
+        for index in self.indices():
+            yield self.entries[index]
+
+    def indices(self):
+        return sorted(self.entries)
+
+    def step(self, index):
+        """Entry of a step (O(1))."""
+        return self.entries[index]
+
+    def step_frequency(self, entry):
+        """
+        Excitation frequency (Hz) of a step: the one recorded for it, else the sweep start
+        plus its step number times the step (not its position in the list, so gaps are kept).
+        """
+        if "larmor_Frequency_Hertz" in entry:
+            return float(entry["larmor_Frequency_Hertz"])
+        return float(self.metadata.get("larmor_Frequency_Hertz", 0)) + entry["index"] * float(self.metadata.get("step_freq", 0))
+
+    def by_file(self, name):
+        """Entry of a step file name (O(1)), or None."""
+        return self._by_file.get(name)
+
+    def paths(self, entries=None):
+        """Full paths of the step files, in step order (or of the given entries)."""
+        entries = self if entries is None else entries
+        return [os.path.join(self.folder, entry["file"]) for entry in entries]
+
+    def select(self, predicate=None, **equal):
+        """Entries in step order matching predicate(entry) and every key=value given."""
+        return [entry for entry in self
+                if all(entry.get(key) == value for key, value in equal.items())
+                and (predicate is None or predicate(entry))]
+
+    def between(self, key, low, high):
+        """Entries in step order with low <= entry[key] <= high (e.g. "peak_frequency")."""
+        return self.select(lambda entry: key in entry and low <= entry[key] <= high)
@@ -10,10 +10,12 @@ import datetime                  # duplicate import (harmless, but redundant)
 import tkinter as tk             # simple file dialog GUI
 from tkinter import filedialog
 from scipy.signal import freqz   # not used in current code, left for future filtering work
-from scipy.signal import butter, lfilter
+from scipy.signal import butter, sosfilt, sosfiltfilt
 from scipy.interpolate import interp1d
 import struct                    # binary unpacking for .bin reader
+import functools                 # memoized filter designs
 import plotly.graph_objects as go
+import NMR_Spectrum as spectrum     # batched rfft spectra
 
 # Constants used across the module
 SAMPLING_RATE = 125e+6          # device sampling rate in Hz (important for time axis)
@@ -22,7 +24,10 @@ USERNAME = "root"               # credential present here; avoid committing secr
 PASSWORD = "root"
 REMOTE_PATH = "Pitaya-Tests/" 
 REMOTE_FOLDER = "Pitaya-Tests"
+STREAM_PROGRAM = "Acquisition_stream.exe"   # src-C/Acquisition_stream.c, CLI of Acquisition_axi.exe + stream port
 SAMPLING_RATE = 125e+6          # repeated definition (same value); redundant but harmless
+ADC_SCALE = 8190                # int16 sample -> volts divisor (PIN LOW convention in this project)
+BIN_HEADER_SIZE = 16            # nmr-v2 .bin header: 4 x int32 (dsize, decimation, nombre_de_FID, gain)
 
 # Default remote host settings (used by functions that create SSH/SFTP clients elsewhere)
 hostName = "169.254.215.235"
@@ -36,166 +41,427 @@ def butter_bandpass(lowcut, highcut, fs, order=5):
       lowcut, highcut : passband edges in Hz
       fs              : sampling frequency in Hz
       order           : filter order
+    Prefer design_bandpass_sos for filtering: (b, a) is numerically unstable for
+    kHz-wide passbands at MHz sampling rates.
     """
     return butter(order, [lowcut, highcut], fs=fs, btype='band')
 
-def butter_bandpass_filter(data, lowcut, highcut, fs, order=5):
+@functools.lru_cache(maxsize=64)
+def design_bandpass_sos(lowcut, highcut, fs, order=5):
+    """
+    Memoized Butterworth bandpass design in second-order sections.
+    Returns an (n_sections, 6) array shared by all callers with the same
+    (lowcut, highcut, fs, order); do not modify it in place.
+    """
+    return butter(order, [lowcut, highcut], fs=fs, btype='band', output='sos')
+
+def bandpass_filter(data, lowcut, highcut, fs, order=5, zero_phase=False, axis=-1):
+    """
+    Apply a Butterworth bandpass filter (second-order sections) to `data`.
+    Parameters:
+      data       : 1D trace or N-D stack of traces (e.g. (n_fid, dsize)), filtered along `axis` in one call
+      zero_phase : filter forward and backward (sosfiltfilt): no phase shift, squared magnitude response
+    Returns the filtered signal (same shape as input).
+    Stacked traces must really have the same length: the backward pass of zero_phase runs
+    through any zero-padding, so a padded trace is not filtered like the trace alone.
+    """
+    sos = design_bandpass_sos(float(lowcut), float(highcut), float(fs), int(order))
+    if zero_phase:
+        return sosfiltfilt(sos, data, axis=axis)
+    return sosfilt(sos, data, axis=axis)
+
+def butter_bandpass_filter(data, lowcut, highcut, fs, order=5, zero_phase=False):
     """
     Apply a Butterworth bandpass filter to `data`.
     Returns the filtered signal (same shape as input).
+    Uses the cached second-order-sections design (see bandpass_filter).
+    """
+    return bandpass_filter(data, lowcut, highcut, fs, order=order, zero_phase=zero_phase)
+
+# Baseline windows as (start, stop) fractions of the record, used by subtract_baseline
+BASELINE_WINDOWS = {
+    "tail": (0.5, 0.98),   # historical accumulate(): mean of the 50%..98% tail
+    "full": (0.0, 1.0),    # historical open_file_bin(): mean of the whole record
+}
+
+def subtract_baseline(voltage_acc, baseline="tail"):
     """
-    b, a = butter_bandpass(lowcut, highcut, fs, order=order)
-    y = lfilter(b, a, data)
-    return y
+    Center an accumulated trace by subtracting its mean over a window.
+    Parameters:
+      voltage_acc : 1D array
+      baseline    : "tail", "full", a (start, stop) pair of record fractions, or None (no correction)
+    Returns:
+      the baseline-centered trace (new array)
+    """
+    if baseline is None:
+        return voltage_acc
+    start, stop = BASELINE_WINDOWS[baseline] if isinstance(baseline, str) else baseline
+    dsize = len(voltage_acc)
+    moyenne = np.mean(voltage_acc[int(dsize*start):int(dsize*stop)])
+    return voltage_acc - moyenne
+
+def _block_dsize(fids):
+    """Samples per FID of a block (2D array, ScaledFIDs, single 1D FID or list of 1D FIDs)."""
+    if isinstance(fids, ScaledFIDs):
+        return fids.raw.shape[-1]
+    if isinstance(fids, np.ndarray):
+        return fids.shape[-1]
+    if len(fids) and np.ndim(fids[0]) == 0:
+        return len(fids)    # a single FID given as a list of samples
+    sizes = {len(fid) for fid in fids}
+    if len(sizes) > 1:
+        raise ValueError(f"FIDs of different lengths in one block: {sorted(sizes)}")
+    return sizes.pop() if sizes else 0
+
+def _as_block(fids):
+    """Return (2D array, scale) for a block of FIDs; ScaledFIDs are reduced on their raw int16 samples."""
+    if isinstance(fids, ScaledFIDs):
+        return fids.raw, 1.0 / fids.scale
+    _block_dsize(fids)
+    block = np.asarray(fids)
+    if block.ndim == 1:
+        block = block[np.newaxis, :]
+    return block, 1.0
+
+class FIDAccumulator:
+    """
+    Streaming sum of FIDs fed as successive 2D blocks (n_fid_in_block, dsize).
+    The selection is expressed on the global FID index, so the result is the same
+    whether the FIDs arrive as one block or as many chunks (e.g. files larger than RAM).
+    Parameters:
+      select : None (all FIDs), int N (first N; -1 means all), slice, or boolean mask over FIDs
+      n_fid  : total number of FIDs, only needed to resolve negative slice bounds
+    Example:
+      acc = FIDAccumulator(select=slice(0, None, 2))
+      for block in iter_fid_blocks(raw, 64):
+          acc.add(block)
+      voltage_acc = acc.result(baseline="tail")
+    """
+    def __init__(self, select=None, n_fid=None):
+        if select is None or (isinstance(select, (int, np.integer)) and select < 0):
+            select = slice(None)
+        elif isinstance(select, (int, np.integer)):
+            select = slice(0, int(select))
+        elif isinstance(select, slice):
+            if select.step is not None and select.step <= 0:
+                raise ValueError("FID selection slice must have a positive step")
+            if n_fid is not None:
+                select = slice(*select.indices(n_fid))
+            elif (select.start or 0) < 0 or (select.stop or 0) < 0:
+                raise ValueError("negative slice bounds need n_fid")
+        else:
+            select = np.asarray(select, dtype=bool)
+        self.select = select
+        self.total = None
+        self.dsize = None   # samples per FID, fixed by the first block
+        self.count = 0      # number of FIDs summed so far
+        self.position = 0   # global index of the next incoming FID
+
+    def _local_rows(self, n):
+        """Rows of the incoming block (global indices position..position+n) that are selected."""
+        start = self.position
+        if isinstance(self.select, slice):
+            first = self.select.start or 0
+            stop = self.select.stop if self.select.stop is not None else start + n
+            step = self.select.step or 1
+            if first < start:
+                first += -(-(start - first) // step) * step
+            return slice(first - start, max(min(stop, start + n) - start, 0), step)
+        mask = self.select[start:start + n]
+        if len(mask) < n:
+            mask = np.concatenate([mask, np.zeros(n - len(mask), dtype=bool)])
+        return mask
+
+    def add(self, fids):
+        """
+        Add a block of FIDs (2D array, ScaledFIDs or single 1D FID) to the running sum.
+        Raises ValueError if its FIDs do not have the length of the previous blocks.
+        """
+        block, scale = _as_block(fids)
+        if self.dsize is None:
+            self.dsize = block.shape[1]
+        elif block.shape[1] != self.dsize:
+            raise ValueError(f"block of {block.shape[1]} samples per FID, previous blocks have {self.dsize}")
+        n = block.shape[0]
+        rows = block[self._local_rows(n)]
+        self.position += n
+        if len(rows) == 0:
+            return
+        if self.total is None:
+            # complex baseband FIDs (NMR_DDC) are summed as complex128
+            self.total = np.zeros(self.dsize, dtype=np.result_type(block.dtype, np.float64))
+        partial = rows.sum(axis=0, dtype=self.total.dtype)
+        if scale != 1.0:
+            partial *= scale
+        self.total += partial
+        self.count += len(rows)
+
+    def result(self, baseline="tail", average=False):
+        """
+        Accumulated trace (sum, or mean if average=True) with the baseline window subtracted.
+        See subtract_baseline for the baseline options. A selection that matched no FID
+        gives a zero trace; ValueError is raised only if no block was added at all.
+        """
+        if self.dsize is None:
+            raise ValueError("no FID was accumulated")
+        if self.count == 0:
+            return np.zeros(self.dsize)
+        voltage_acc = self.total / self.count if average else self.total.copy()
+        return subtract_baseline(voltage_acc, baseline)
+
+def iter_fid_blocks(fids, block_size=64):
+    """
+    Yield successive (block_size, dsize) blocks of a 2D array, memmap, ScaledFIDs or list
+    of 1D FIDs without copying them. Raises ValueError if the FIDs differ in length.
+    """
+    dsize = None
+    for start in range(0, len(fids), block_size):
+        if isinstance(fids, ScaledFIDs):
+            block = ScaledFIDs(fids.raw[start:start + block_size], fids.scale)
+        else:
+            block = fids[start:start + block_size]
+        if dsize is None:
+            dsize = _block_dsize(block)
+        elif _block_dsize(block) != dsize:
+            raise ValueError(f"FIDs of {_block_dsize(block)} samples after FIDs of {dsize}")
+        yield block
+
+def accumulate_fids(fids, select=None, baseline="tail", average=False, n_fid=None):
+    """
+    Accumulate FIDs with one reduction per block.
+    Parameters:
+      fids     : 2D array / np.memmap / ScaledFIDs (n_fid, dsize), list of 1D FIDs,
+                 or an iterator of such blocks (chunked streaming)
+      select   : FIDs to use, see FIDAccumulator (None = all, int N = first N, slice, boolean mask)
+      baseline : "tail" (50..98% of the record), "full" (whole record), (start, stop) fractions or None
+      average  : return the mean instead of the sum
+      n_fid    : total FID count, only needed for negative slice bounds on an iterator
+    Returns:
+      voltage_acc : 1D float64 array
+    """
+    if isinstance(fids, (ScaledFIDs, np.ndarray, list, tuple)):
+        n_fid = len(fids) if n_fid is None else n_fid
+        blocks = [fids]
+    else:
+        blocks = fids
+    acc = FIDAccumulator(select=select, n_fid=n_fid)
+    for block in blocks:
+        acc.add(block)
+    return acc.result(baseline=baseline, average=average)
 
 def accumulate(voltage_matrix,nb_accumulated):
     """
     Sum (accumulate) a number of FID traces from voltage_matrix.
     Parameters:
-      voltage_matrix   : list or array-like of 1D arrays, one per FID
+      voltage_matrix   : list or array-like of 1D arrays, one per FID (or ScaledFIDs)
       nb_accumulated   : number of FIDs to accumulate; if -1 or >= available, all are used
     Returns:
       voltage_acc : 1D numpy array containing the accumulated and baseline-centered signal
-    Notes:
-      - voltage_matrix is expected to be indexable like voltage_matrix[0], voltage_matrix[1], ...
-      - There is a potential bug: the loop uses `voltage_matrix[:][i]`, which is equivalent to
-        `voltage_matrix[i]` for lists but can be confusing for numpy arrays. It currently sums
-        up to nb_accumulated-1 (exclusive of the last index) because range(nb_accumulated-1)
-        is used; that may be unintended.
-    """
-    dsize = len(voltage_matrix[0])
-    if ((nb_accumulated==-1) or (nb_accumulated>=len(voltage_matrix))):
-        nb_accumulated = len(voltage_matrix)
-
-    voltage_acc = np.zeros(dsize)
-
-    # Accumulate the requested number of FIDs.
-    # NOTE: range(nb_accumulated-1) excludes the last item — likely an off-by-one bug.
-    for i in range(nb_accumulated-1):
-        voltage_acc = voltage_acc + voltage_matrix[:][i]
-    
-    # Compute mean on a tail region and subtract to center the baseline.
-    # Uses indices from 50% to 98% of the record for baseline estimate.
-    moyenne = np.mean(voltage_acc[int((dsize*0.5)):int((dsize*0.98))])
-    voltage_acc = voltage_acc - moyenne
-    
-    return voltage_acc
+    The mean over 50% to 98% of the record is used as baseline (see accumulate_fids).
+    All nb_accumulated FIDs are summed (the previous loop dropped the last one);
+    nb_accumulated = 0 still gives a zero trace of the FID length.
+    """
+    return accumulate_fids(voltage_matrix, select=nb_accumulated, baseline="tail")
+
+def read_header_csv(pathFile_csv):
+    """
+    Read only the header line of a CSV measurement file.
+    CSV header expected: [dsize, decimation, nombre_de_FID, gain, offset, nb_bits]
+    Returns a dict with those keys.
+    """
+    with open(pathFile_csv, 'r', encoding='utf-8') as fichier_:
+        ligne_entete = next(csv.reader(fichier_))
+    return {
+        "dsize": int(ligne_entete[0]),
+        "decimation": int(ligne_entete[1]),
+        "nombre_de_FID": int(ligne_entete[2]),
+        "gain": float(ligne_entete[3]),
+        "offset": float(ligne_entete[4]),
+        "nb_bits": int(ligne_entete[5]),
+    }
+
+def load_file_csv(pathFile_csv, nombre_de_FID=-1):
+    """
+    Bulk-parse a CSV measurement file into one 2D array.
+    Parameters:
+      pathFile_csv   : path to CSV file
+      nombre_de_FID  : number of FID rows to read; if < 0, use value from file header
+    Returns:
+      header  : dict from read_header_csv
+      voltage : float64 array of shape (nombre_de_FID, dsize)
+    The numeric rows are parsed by numpy's C reader in one call instead of float() per sample.
+    """
+    header = read_header_csv(pathFile_csv)
+    if nombre_de_FID < 0:
+        nombre_de_FID = header["nombre_de_FID"]
+    voltage = np.loadtxt(pathFile_csv, delimiter=',', skiprows=1, max_rows=nombre_de_FID, ndmin=2, encoding='utf-8')
+    if voltage.shape[0] < nombre_de_FID:
+        raise ValueError(f"Unexpected file size: need {nombre_de_FID} FID rows, file has {voltage.shape[0]}")
+    if voltage.shape[1] != header["dsize"]:
+        raise ValueError(f"Unexpected row length: header says {header['dsize']} samples, rows have {voltage.shape[1]}")
+    return header, voltage
 
 def open_file_csv(pathFile_csv, nombre_de_FID):
     """
-    Read a CSV-format measurement file and return time axis, list of FID arrays, and accumulated signal.
+    Read a CSV-format measurement file and return time axis, FID arrays, and accumulated signal.
     CSV header expected: [dsize, decimation, nombre_de_FID, gain, offset, nb_bits]
     Parameters:
       pathFile_csv   : path to CSV file
       nombre_de_FID  : number of FIDs to read; if < 0, use value from file header
     Returns:
       time           : 1D numpy array of time values (seconds)
-      voltage        : list of numpy arrays, one per FID (float)
+      voltage        : 2D numpy array, one row per FID (float)
       voltage_acc    : accumulated and baseline-centered numpy array
+    For repeated opens, convert the file once with convert_csv_to_bin and use open_file_bin.
     """
-    voltage_acc = []
+    header, voltage = load_file_csv(pathFile_csv, nombre_de_FID)
 
-    with open(pathFile_csv, 'r', encoding='utf-8') as fichier_:
-        lecteur = csv.reader(fichier_)
+    # Build time axis using SAMPLING_RATE and decimation
+    time = time_axis(header["dsize"], header["decimation"])
 
-        # Read and parse the header
-        ligne_entete = next(lecteur)
-        dsize = int(ligne_entete[0])
-        decimation = int(ligne_entete[1])
-        if nombre_de_FID <0 : nombre_de_FID = int(ligne_entete[2])
-        gain = float(ligne_entete[3])
-        offset = float(ligne_entete[4])
-        nb_bits = int(ligne_entete[5])
+    # Accumulate all FIDs read and return results
+    voltage_acc = accumulate(voltage,nb_accumulated=len(voltage))
 
-        # Initialize containers
-        voltage = [[] for _ in range(nombre_de_FID)]
-        mean = []
-        voltage_acc = np.zeros(dsize)  # accumulator array
+    return time, voltage, voltage_acc
 
-        # Read each FID line and convert to floats
-        for j in range(nombre_de_FID):
-            ligne = next(lecteur)
+class ScaledFIDs:
+    """
+    Lazy volts view over a (n_fid, dsize) int16 block of raw ADC samples.
+    Nothing is converted up front: indexing returns float32 volts for the
+    requested FIDs only, so the block keeps behaving like the old list of
+    arrays (len(), voltage[j], iteration) without doubling memory.
+    Attributes:
+      raw   : underlying int16 array or np.memmap, shape (n_fid, dsize)
+      scale : divisor applied on access (ADC_SCALE by default)
+    """
+    def __init__(self, raw, scale=ADC_SCALE):
+        self.raw = raw
+        self.scale = scale
 
-            signal = []
+    @property
+    def shape(self):
+        return self.raw.shape
 
-            # The file already contains float values (as strings) so convert directly.
-            for val in ligne:
-                signal.append(float(val))
+    def __len__(self):
+        return self.raw.shape[0]
 
-            # Convert list to numpy array for later processing
-            signal = np.array(signal)
+    def __getitem__(self, index):
+        return self.raw[index].astype(np.float32) / self.scale
 
-            # Store the FID
-            voltage[j] = signal
+    def __iter__(self):
+        for j in range(len(self)):
+            yield self[j]
 
-    # Build time axis using SAMPLING_RATE and decimation
-    duree_mesure = (dsize * decimation) / SAMPLING_RATE 
-    time = np.linspace(0, duree_mesure, dsize, endpoint=False)
+    def __array__(self, dtype=None, copy=None):
+        volts = self.raw.astype(np.float32) / self.scale
+        return volts if dtype is None else volts.astype(dtype)
 
-    # Accumulate all FIDs (nombre_de_FID) and return results
-    voltage_acc = accumulate(voltage,nb_accumulated=nombre_de_FID)
+    def to_volts(self, dtype=np.float32):
+        """Convert the whole block to volts (allocates n_fid*dsize floats)."""
+        return np.asarray(self, dtype=dtype)
 
-    return time, voltage, voltage_acc
+def read_header_bin(pathFile_bin):
+    """
+    Read only the 16-byte nmr-v2 header of a .bin file.
+    Returns a dict with keys dsize, decimation, nombre_de_FID and gain.
+    """
+    with open(pathFile_bin, mode='rb') as file:
+        headerbin = file.read(BIN_HEADER_SIZE)
+    if len(headerbin) < BIN_HEADER_SIZE:
+        raise ValueError(f"Unexpected file size: header needs {BIN_HEADER_SIZE} bytes, file has {len(headerbin)} bytes")
+    dsize, decimation, nombre_de_FID, gain = struct.unpack("<iiii", headerbin)
+    return {"dsize": dsize, "decimation": decimation, "nombre_de_FID": nombre_de_FID, "gain": gain}
+
+def map_file_bin(pathFile_bin):
+    """
+    Memory-map a binary-format measurement file without reading or copying the samples.
+    Parameters:
+      pathFile_bin : path to binary file
+    Returns:
+      header : dict from read_header_bin
+      raw    : read-only np.memmap of int16, shape (nombre_de_FID, dsize)
+    The pages are loaded by the OS only when the samples are actually touched,
+    so slicing a few FIDs out of a large file stays cheap.
+    """
+    header = read_header_bin(pathFile_bin)
+    dsize = header["dsize"]
+    nombre_de_FID = header["nombre_de_FID"]
+
+    end = BIN_HEADER_SIZE + nombre_de_FID * dsize * 2
+    file_size = os.path.getsize(pathFile_bin)
+    if end > file_size:
+        raise ValueError(f"Unexpected file size: need bytes {BIN_HEADER_SIZE}:{end}, file has {file_size} bytes")
+
+    raw = np.memmap(pathFile_bin, dtype='<i2', mode='r', offset=BIN_HEADER_SIZE, shape=(nombre_de_FID, dsize))
+    return header, raw
+
+def time_axis(dsize, decimation):
+    """Time axis (seconds) of one FID from dsize/decimation/SAMPLING_RATE."""
+    duree_mesure = (dsize * decimation) / SAMPLING_RATE 
+    return np.linspace(0, duree_mesure, dsize, endpoint=False)
 
 def open_file_bin(pathFile_bin,nombre_de_FID):
     """
-    Read a binary-format measurement file and return time axis, list of FID arrays, and accumulated signal.
-    Binary header: first 16 bytes = 4 x 4-byte little-endian ints (dsize, decimation, nombre_de_FID, ...)
+    Read a binary-format measurement file and return time axis, FIDs, and accumulated signal.
+    Binary header: first 16 bytes = 4 x 4-byte little-endian ints (dsize, decimation, nombre_de_FID, gain)
     Following data: signed 16-bit int samples for each FID sequentially.
     Parameters:
       pathFile_bin   : path to binary file
       nombre_de_FID  : ignored; the value in the file header is used
     Returns:
-      time, voltage (list of arrays), voltage_acc (accumulated & baseline-centered)
-    """
-    voltage_acc = []
-
-    with open(pathFile_bin, mode='rb') as file: # open in binary mode
-        fileContent = file.read()
-
-        # Parse 16-byte header (4 little-endian ints)
-        headerbin = fileContent[0:16]
-        header = struct.unpack("iiii", headerbin)
-
-        # Extract fields from header
-        dsize           = header[0]  # samples per FID
-        decimation      = header[1]  # decimation factor
-        nombre_de_FID   = header[2]  # number of FIDs in file
-
-        # Prepare containers
-        voltage = [[] for _ in range(nombre_de_FID)]
-        mean = []
-        voltage_acc = np.zeros(dsize)  # accumulator
-
-        # For each FID, unpack int16 samples and scale to volts
-        for j in range(nombre_de_FID):
-            # Compute byte ranges for this FID (int16 -> 2 bytes per sample)
-            start = 16 + j * dsize*2
-            end = start + dsize*2
-            if end > len(fileContent):
-                raise ValueError(f"Unexpected file size: need bytes {start}:{end}, file has {len(fileContent)} bytes")
-            
-            # Unpack little-endian signed 16-bit integers
-            values = struct.unpack("<" + "h" * dsize, fileContent[start:end])
-
-            signal = np.array(values,dtype=np.int16)
-            # Convert integer samples to voltages (scaling chosen for this device)
-            signal = signal.astype(np.float32)/8190  # PIN LOW convention in this project
-
-            # Store and accumulate
-            voltage[j] = signal
-            voltage_acc += signal
+      time, voltage (ScaledFIDs, indexable like a list of float32 arrays), voltage_acc (accumulated & baseline-centered)
+    The samples are memory-mapped (see map_file_bin); only the accumulation reads them.
+    """
+    header, raw = map_file_bin(pathFile_bin)
+    voltage = ScaledFIDs(raw)
 
-    # Time axis from dsize/decimation/SAMPLING_RATE
-    duree_mesure = (dsize * decimation) / SAMPLING_RATE 
-    time = np.linspace(0, duree_mesure, dsize, endpoint=False)
+    # Accumulate in one reduction over the int16 block and subtract the whole-record mean
+    voltage_acc = accumulate_fids(voltage, baseline="full")
 
-    # Subtract mean baseline from accumulated signal
-    moyenne = np.mean(voltage_acc)
-    voltage_acc = voltage_acc - moyenne
+    # Time axis from dsize/decimation/SAMPLING_RATE
+    time = time_axis(header["dsize"], header["decimation"])
 
     return time, voltage, voltage_acc
 
+def write_file_bin(pathFile_bin, raw, decimation, gain=0):
+    """
+    Write int16 FIDs in the nmr-v2 binary layout (same bytes as build_file + add_to_file in src-C).
+    Parameters:
+      pathFile_bin : output path
+      raw          : int16 array-like of shape (nombre_de_FID, dsize)
+      decimation   : decimation factor stored in the header
+      gain         : gain value stored in the header (int)
+    """
+    raw = np.asarray(raw)
+    if raw.ndim == 1:
+        raw = raw[np.newaxis, :]
+    nombre_de_FID, dsize = raw.shape
+    with open(pathFile_bin, mode='wb') as file:
+        file.write(struct.pack("<iiii", dsize, int(decimation), nombre_de_FID, int(gain)))
+        file.write(np.ascontiguousarray(raw, dtype='<i2').tobytes())
+
+def volts_to_raw(voltage, scale=ADC_SCALE):
+    """Convert volts back to int16 ADC codes (rounded and clipped to the int16 range)."""
+    codes = np.rint(np.asarray(voltage, dtype=np.float64) * scale)
+    return np.clip(codes, -32768, 32767).astype(np.int16)
+
+def convert_csv_to_bin(pathFile_csv, pathFile_bin=None):
+    """
+    Rewrite a legacy CSV measurement into the nmr-v2 binary layout so later opens use open_file_bin.
+    Parameters:
+      pathFile_csv : path to CSV file
+      pathFile_bin : output path; defaults to the CSV path with a .bin extension
+    Returns:
+      the path of the written binary file
+    Samples are quantized back to int16 with the ADC_SCALE used by open_file_bin; the
+    CSV offset and nb_bits fields have no slot in the binary header and are dropped.
+    """
+    if pathFile_bin is None:
+        pathFile_bin = os.path.splitext(pathFile_csv)[0] + ".bin"
+    header, voltage = load_file_csv(pathFile_csv, nombre_de_FID=-1)
+    write_file_bin(pathFile_bin, volts_to_raw(voltage), header["decimation"], int(header["gain"]))
+    return pathFile_bin
+
 def create_file_wdate(nameFile):
     """
     Create a local measurements folder with a timestamped name under pitaya-rmn-project/python/mesures/.
@@ -208,20 +474,23 @@ def create_file_wdate(nameFile):
     os.makedirs(abs_path_local_file, exist_ok=True)
     return abs_path_local_file
 
-def run_acquisition_echo_command(samplesNb, dec,FidNb, FileName, larmorFrequency, excitationDuration, delayRepeat, echoTime, verbose=False):
+def run_acquisition_echo_command(samplesNb, dec,FidNb, FileName, larmorFrequency, excitationDuration, delayRepeat, echoTime, verbose=False, session=None, remote_file="mesure.bin"):
     """
-    Compose and run a remote acquisition command via an existing SSH client.
-    This function expects a global `client` paramiko.SSHClient to be already connected.
-    Parameters match the remote Acquisition_axi.exe command-line arguments.
+    Compose and run a remote acquisition command.
+    The command runs on `session` (a NMR_Session.PitayaSession, reused across runs); if
+    session is None, the module-level `client` paramiko.SSHClient must be already connected.
+    Parameters match the remote Acquisition_echo.exe command-line arguments.
+    remote_file is the file written under mesures/ on the board (one per step for pipelined sweeps).
     larmorfrequency in Hz
     excitation duration in seconds
     delayRepat in micro_seconds
     echoTime in micro_seconds
     """
-    filePath = "mesures/" + "mesure.bin"
+    filePath = "mesures/" + remote_file
     command = f"cd {REMOTE_FOLDER} && ./Acquisition_echo.exe {samplesNb} {dec} {FidNb} {filePath} {larmorFrequency} {excitationDuration} {delayRepeat} {echoTime}"
     print(command)
-    stdin, stdout, stderr = client.exec_command(command)
+    ssh = session if session is not None else client
+    stdin, stdout, stderr = ssh.exec_command(command)
     output = stdout.read().decode()
     errors = stderr.read().decode()
     # Errors are printed; output currently not used elsewhere.
@@ -231,15 +500,23 @@ def run_acquisition_echo_command(samplesNb, dec,FidNb, FileName, larmorFrequency
     if errors:
         print("[ERROR SHH]\n", errors)
 
-def run_acquisition_fid_command(samplesNb, dec,FidNb, FileName, larmorFrequency, excitationDuration, delayRepeat, verbose=False):
+def run_acquisition_fid_command(samplesNb, dec,FidNb, FileName, larmorFrequency, excitationDuration, delayRepeat, verbose=False, session=None, remote_file="mesure.bin", stream_port=None):
     """
-    Compose and run a remote acquisition command via an existing SSH client.
-    This function expects a global `client` paramiko.SSHClient to be already connected.
+    Compose and run a remote acquisition command.
+    The command runs on `session` (a NMR_Session.PitayaSession, reused across runs); if
+    session is None, the module-level `client` paramiko.SSHClient must be already connected.
     Parameters match the remote Acquisition_axi.exe command-line arguments.
-    """
-    filePath = "mesures/" + "mesure.bin"
-    command = f"cd {REMOTE_FOLDER} && ./Acquisition_axi.exe {samplesNb} {dec} {FidNb} {filePath} {larmorFrequency} {excitationDuration} {delayRepeat}"
-    stdin, stdout, stderr = client.exec_command(command)
+    remote_file is the file written under mesures/ on the board (one per step for pipelined sweeps).
+    stream_port, if given, runs STREAM_PROGRAM instead (same arguments plus the port): it pushes
+    each FID over TCP on that port (see src-C/Acquisition_stream.c and NMR_Stream) and writes no file.
+    """
+    filePath = "mesures/" + remote_file
+    program = "Acquisition_axi.exe" if stream_port is None else STREAM_PROGRAM
+    command = f"cd {REMOTE_FOLDER} && ./{program} {samplesNb} {dec} {FidNb} {filePath} {larmorFrequency} {excitationDuration} {delayRepeat}"
+    if stream_port is not None:
+        command += f" {int(stream_port)}"
+    ssh = session if session is not None else client
+    stdin, stdout, stderr = ssh.exec_command(command)
     output = stdout.read().decode()
     errors = stderr.read().decode()
     if verbose == True : 
@@ -247,29 +524,62 @@ def run_acquisition_fid_command(samplesNb, dec,FidNb, FileName, larmorFrequency,
     if errors:
         print("[ERROR SHH]\n", errors)
 
-def download_file_sftp(nameLocalFile,nameRemoteFolder,nameLocalFolder):
+def stop_remote_acquisition(session, program="Acquisition_axi.exe"):
+    """Kill an acquisition program still running on the board (e.g. a streamed accumulation stopped early)."""
+    return session.run(f"pkill -f {program}")
+
+def download_file_sftp(nameLocalFile,nameRemoteFolder,nameLocalFolder,session=None,remote_file="mesure.bin"):
     """
-    Download a remote file using an existing global SFTP client `sftp`.
+    Download the remote measurement file over SFTP.
     Parameters:
         nameLocalFile    : filename on the local side
         nameRemoteFolder : remote subfolder under REMOTE_PATH
         nameLocalFolder  : local directory to save into
-    To work the paramiko SFTP client `sftp` must be already connected.
-    to do so, use the all the connexion lines with the nmr. before
-    example : nmr.sftp = paramiko.SFTPClient.from_transport(transport)
-
+        session          : NMR_Session.PitayaSession whose transport carries the SFTP channel
+        remote_file      : remote file name inside nameRemoteFolder
+    Returns:
+        True when the file was downloaded and the local size matches the remote one, False otherwise
+        (the error is printed).
+    If session is None, the module-level paramiko SFTP client `sftp` must be already connected
+    (example : nmr.sftp = paramiko.SFTPClient.from_transport(transport)).
     """
-
-        
-    remote_path = REMOTE_PATH + nameRemoteFolder+'/' + "mesure.bin"
+    remote_path = REMOTE_PATH + nameRemoteFolder+'/' + remote_file
     local_path = os.path.join(nameLocalFolder, nameLocalFile)
     
     try:
-        sftp.get(remote_path, local_path)
+        client = session.sftp if session is not None else sftp
+        remote_size = client.stat(remote_path).st_size
+        if session is not None:
+            session.get(remote_path, local_path)
+        else:
+            sftp.get(remote_path, local_path)
+        local_size = os.path.getsize(local_path)
+        if local_size != remote_size:
+            print(f"Téléchargement incomplet de {nameLocalFile}: {local_size}/{remote_size} octets")
+            return False
+        return True
     except FileNotFoundError:
         print(f"Fichier non trouvé: {remote_path}")
     except Exception as e:
         print(f"Erreur lors du téléchargement de {nameLocalFile}: {e}")
+    return False
+
+def remove_remote_file(nameRemoteFolder, remote_file, session):
+    """Delete a measurement file on the board once it has been downloaded (keeps the SD card from filling up)."""
+    try:
+        session.sftp.remove(REMOTE_PATH + nameRemoteFolder + '/' + remote_file)
+    except FileNotFoundError:
+        pass
+
+def fetch_remote_file(nameLocalFile, nameRemoteFolder, nameLocalFolder, session, remote_file="mesure.bin"):
+    """
+    Download a measurement file and delete it from the board only once the download succeeded.
+    Returns the local path. Raises IOError when the download failed; the board copy is then kept.
+    """
+    if not download_file_sftp(nameLocalFile, nameRemoteFolder, nameLocalFolder, session=session, remote_file=remote_file):
+        raise IOError(f"download of {nameRemoteFolder}/{remote_file} failed, the file is kept on the board")
+    remove_remote_file(nameRemoteFolder, remote_file, session)
+    return os.path.join(nameLocalFolder, nameLocalFile)
 
 def plot_acc(graph_name, time_axis, voltage_matrix):
     """
@@ -362,25 +672,18 @@ def subpolts_acc(graph_name, time_axis, voltage_matrix, nb_of_accumulated):
 
 def plot_fourier_transform(graph_name, time, voltage):
     """
-    Compute and plot a simple (unshifted) FFT of a single voltage trace.
+    Compute and plot the one-sided FFT magnitude of a single voltage trace.
     - time : time axis (1D)
     - voltage : corresponding samples (1D)
-    The plot shows both positive and negative frequencies unless further filtered.
     """
     time = np.array(time)
     voltage = np.array(voltage)
 
-    # Sampling interval and frequency
+    # Sampling interval
     dt = time[1] - time[0]
-    fs = 1 / dt
 
-    # FFT
-    N = len(voltage)
-    fft_values = np.fft.fft(voltage)
-    freq = np.fft.fftfreq(N, dt)
-
-    # Magnitude (normalized)
-    magnitude = np.abs(fft_values) * 2 / N
+    # One-sided FFT magnitude (normalized by 2/N)
+    freq, magnitude = spectrum.batch_spectrum(voltage, dt)
 
     plt.figure(figsize=(10, 4))
     plt.plot(freq, magnitude)
@@ -391,7 +694,6 @@ def plot_fourier_transform(graph_name, time, voltage):
     plt.minorticks_on()
     plt.grid(which='minor', alpha=0.2)
     plt.grid(which='major', alpha=0.5)
-    # Note: consider plotting only positive frequencies (freq >= 0) for clarity.
 
 def open_file_dialog():
     """
@@ -406,25 +708,18 @@ def open_file_dialog():
 
 def plot_fourier_transform_plotly(graph_name, time, voltage):
     """
-    Compute and plot a simple (unshifted) FFT of a single voltage trace.
+    Compute and plot the one-sided FFT magnitude of a single voltage trace.
     - time : time axis (1D)
     - voltage : corresponding samples (1D)
-    The plot shows both positive and negative frequencies unless further filtered.
     """
     time = np.array(time)
     voltage = np.array(voltage)
 
-    # Sampling interval and frequency
+    # Sampling interval
     dt = time[1] - time[0]
-    fs = 1 / dt
-
-    # FFT
-    N = len(voltage)
-    fft_values = np.fft.fft(voltage)
-    freq = np.fft.fftfreq(N, dt)
 
-    # Magnitude (normalized)
-    magnitude = np.abs(fft_values) * 2 / N
+    # One-sided FFT magnitude (normalized by 2/N)
+    freq, magnitude = spectrum.batch_spectrum(voltage, dt)
 
     fig = go.Figure()
     fig.add_trace(go.Scattergl( #Scattergl to use opengl
@@ -437,5 +732,4 @@ def plot_fourier_transform_plotly(graph_name, time, voltage):
 
     fig.update_layout(title="TF")
 
-    fig.show_dash(mode='external')
-    # Note: consider plotting only positive frequencies (freq >= 0) for clarity.
\ No newline at end of file
+    fig.show_dash(mode='external')
\ No newline at end of file
@@ -0,0 +1,86 @@
+"""
+Live processing of an accumulation in progress.
+
+Every new FID costs O(dsize): it is added in place to a running sum. The mean,
+its spectrum and an SNR estimate are only recomputed when an update is
+published, and publications are rate-limited by wall-clock time, so the cost of
+the display does not depend on the acquisition rate.
+"""
+import threading
+import time
+import numpy as np
+
+import NMR_Library as nmr
+import NMR_Spectrum as spectrum
+
+def spectral_snr(mag):
+    """
+    Robust SNR estimate of a magnitude spectrum: (peak - median) / noise, where the
+    noise is the median absolute deviation scaled to a standard deviation.
+    """
+    median = np.median(mag)
+    noise = 1.4826 * np.median(np.abs(mag - median))
+    if noise == 0:
+        return np.inf
+    return float((np.max(mag) - median) / noise)
+
+class LiveAverager:
+    """
+    Running average of incoming FIDs with throttled spectrum/SNR updates.
+    Parameters:
+      dsize        : samples per FID
+      dt           : sampling step in seconds
+      min_interval : minimum time in seconds between two published updates
+      on_update    : callback(snapshot) receiving the dict built by snapshot()
+      scale        : factor applied to incoming samples (1/ADC_SCALE for raw int16 FIDs)
+      baseline     : baseline window of the mean, see nmr.subtract_baseline
+      snr_target   : when set, stop_event is set once the published SNR reaches it
+      stop_event   : threading.Event set by snr_target
+    """
+    def __init__(self, dsize, dt, min_interval=0.5, on_update=None, scale=1.0 / nmr.ADC_SCALE, baseline="full", snr_target=None, stop_event=None):
+        self.dt = dt
+        self.min_interval = min_interval
+        self.on_update = on_update
+        self.scale = scale
+        self.baseline = baseline
+        self.snr_target = snr_target
+        self.stop_event = stop_event
+        self.time = np.arange(dsize) * dt
+        self.total = np.zeros(dsize)
+        self.count = 0
+        self.last_snapshot = None
+        self._last_publish = -np.inf
+        self._lock = threading.Lock()
+
+    def add(self, fid):
+        """Add one FID to the running sum (O(dsize)); publishes an update if the interval has elapsed."""
+        with self._lock:
+            np.add(self.total, fid, out=self.total)
+            self.count += 1
+        now = time.monotonic()
+        if now - self._last_publish >= self.min_interval:
+            self._last_publish = now
+            self.publish()
+
+    def snapshot(self):
+        """Current running mean, its spectrum and SNR as a dict shaped like NMRApp.data_store."""
+        with self._lock:
+            if not self.count:
+                return None
+            mean = self.total * (self.scale / self.count)
+            count = self.count
+        voltage = nmr.subtract_baseline(mean, self.baseline)
+        freq, mag = spectrum.batch_spectrum(voltage, self.dt)
+        return {"time": self.time, "voltage": voltage, "freq": freq, "mag": mag, "iter": count, "snr": spectral_snr(mag)}
+
+    def publish(self):
+        """Build a snapshot, hand it to on_update and check the SNR target."""
+        snap = self.snapshot()
+        if snap is None:
+            return None
+        self.last_snapshot = snap
+        if self.on_update is not None:
+            self.on_update(snap)
+        if self.snr_target is not None and self.stop_event is not None and snap["snr"] >= self.snr_target:
+            self.stop_event.set()
+        return snap
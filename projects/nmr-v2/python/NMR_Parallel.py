@@ -0,0 +1,160 @@
+"""
+Process-pool processing of the files of a sweep.
+
+Every step file is decoded, accumulated, optionally band-pass filtered and
+transformed in a worker process, so a sweep uses all the cores of the machine
+instead of one. The output arrays (accumulated traces, filtered traces and
+spectra of all steps) are allocated once by the parent in shared memory; each
+worker writes its step into its own row and only returns the step number, so
+no array is pickled. Rows are indexed by step, which makes the result order
+deterministic whatever the completion order.
+
+Setting stop_event cancels every step not yet started; steps already running
+finish (one file each) and the result marks which rows are valid.
+"""
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from multiprocessing import shared_memory
+import numpy as np
+
+import NMR_Library as nmr
+import NMR_Spectrum as spectrum
+
+class SharedArray:
+    """numpy array in a named shared-memory block (created by the parent, attached by workers)."""
+    def __init__(self, shape, dtype=np.float64, name=None):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        nbytes = max(int(np.prod(self.shape)) * self.dtype.itemsize, 1)
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=nbytes if self.owner else 0)
+        self.array = np.ndarray(self.shape, dtype=self.dtype, buffer=self.shm.buf)
+
+    def spec(self):
+        """Picklable description (name, shape, dtype) used to attach in a worker."""
+        return self.shm.name, self.shape, self.dtype.str
+
+    @classmethod
+    def attach(cls, spec):
+        name, shape, dtype = spec
+        return cls(shape, dtype, name=name)
+
+    def close(self):
+        self.array = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+def _process_step(row, path, specs, filter_params, idx, n_fft):
+    """Worker: decode, accumulate, filter and FFT one step file into row `row` of the shared arrays."""
+    arrays = {key: SharedArray.attach(spec) for key, spec in specs.items()}
+    try:
+        header, raw = nmr.map_file_bin(path)
+        dt = header["decimation"] / nmr.SAMPLING_RATE
+        voltage_acc = nmr.accumulate_fids(nmr.ScaledFIDs(raw), baseline="full")
+        n = len(voltage_acc)
+        arrays["voltage_acc"].array[row, :n] = voltage_acc
+        if filter_params is not None:
+            voltage_acc = nmr.bandpass_filter(voltage_acc, filter_params["low"], filter_params["high"], fs=1/dt,
+                                              order=filter_params["order"], zero_phase=filter_params.get("zero_phase", False))
+            arrays["voltage"].array[row, :n] = voltage_acc
+        freq, mag = spectrum.batch_spectrum(voltage_acc[idx:], dt, n_fft=n_fft)
+        arrays["mag"].array[row] = mag
+        return row, n
+    finally:
+        for array in arrays.values():
+            array.close()
+
+class SweepResults:
+    """
+    Output of process_sweep: one row per step, in the order of the input paths.
+    Attributes:
+      time        : time axis of the longest record
+      voltage_acc : (n_steps, dsize) accumulated traces (zero-padded to the longest record)
+      voltage     : filtered traces (same array as voltage_acc when no filter was asked)
+      freq, mag   : frequency axis and (n_steps, n_freq) magnitude spectra of voltage[:, idx:]
+      lengths     : samples per step
+      done        : boolean mask of the steps actually processed (False after cancellation/error)
+      errors      : dict row -> exception of the failed steps
+    The arrays live in shared memory: call close() (or use a with block) once they are no longer used.
+    """
+    def __init__(self, shared, time, freq, lengths, done, errors):
+        self._shared = shared
+        self.time = time
+        self.voltage_acc = shared["voltage_acc"].array
+        self.voltage = shared["voltage"].array if "voltage" in shared else self.voltage_acc
+        self.freq = freq
+        self.mag = shared["mag"].array
+        self.lengths = lengths
+        self.done = done
+        self.errors = errors
+
+    def close(self):
+        self.voltage_acc = self.voltage = self.mag = None
+        for array in self._shared.values():
+            array.close()
+        self._shared = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def process_sweep(paths, filter_params=None, idx=0, n_fft="fast", workers=None, stop_event=None, on_result=None):
+    """
+    Decode/accumulate/filter/FFT the .bin files of a sweep in a process pool.
+    Parameters:
+      paths         : step files, in step order
+      filter_params : None or dict(low, high, order[, zero_phase]) for nmr.bandpass_filter
+      idx           : first sample used for the spectrum (cut of the beginning of the FID)
+      n_fft         : transform length rule of NMR_Spectrum.fft_length (common to all steps)
+      workers       : number of processes (None = os.cpu_count())
+      stop_event    : threading.Event; when set, the steps not yet started are cancelled
+      on_result     : optional callback(row) called in the parent as each step completes
+    Returns:
+      SweepResults (rows in the order of paths)
+    """
+    headers = [nmr.read_header_bin(path) for path in paths]
+    dsize = max(header["dsize"] for header in headers)
+    dt = headers[0]["decimation"] / nmr.SAMPLING_RATE
+    n_fft = spectrum.fft_length(dsize - idx, n_fft)
+    freq = spectrum.rfft_frequencies(n_fft, dt)
+    stop_event = stop_event if stop_event is not None else threading.Event()
+
+    shared = {"voltage_acc": SharedArray((len(paths), dsize)), "mag": SharedArray((len(paths), len(freq)))}
+    if filter_params is not None:
+        shared["voltage"] = SharedArray((len(paths), dsize))
+    try:
+        for array in shared.values():
+            array.array[:] = 0
+        specs = {key: array.spec() for key, array in shared.items()}
+        lengths = np.zeros(len(paths), dtype=np.int64)
+        done = np.zeros(len(paths), dtype=bool)
+        errors = {}
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+            pending = {executor.submit(_process_step, row, path, specs, filter_params, idx, n_fft): row
+                       for row, path in enumerate(paths)}
+            while pending:
+                finished, _ = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    row = pending.pop(future)
+                    if future.cancelled():
+                        continue
+                    try:
+                        _, lengths[row] = future.result()
+                        done[row] = True
+                    except Exception as e:
+                        errors[row] = e
+                        continue
+                    if on_result is not None:
+                        on_result(row)
+                if stop_event.is_set():
+                    for future in pending:
+                        future.cancel()
+    except BaseException:
+        for array in shared.values():
+            array.close()
+        raise
+    return SweepResults(shared, nmr.time_axis(dsize, headers[0]["decimation"]), freq, lengths, done, errors)
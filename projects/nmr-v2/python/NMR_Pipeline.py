@@ -0,0 +1,158 @@
+"""
+Pipelined execution of nmr-v2 sweeps.
+
+The board can only run one acquisition at a time, but nothing forces the host to
+wait for it: while step N+1 is being acquired, the file of step N is downloaded
+and decoded/FFT'd in worker threads. A bounded number of steps may be "in flight"
+(acquired but not processed yet), which keeps host memory bounded when the
+processing is slower than the board.
+
+Each step writes its own remote file (see remote_step_file) so a download still
+in progress cannot be overwritten by the next acquisition.
+"""
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import NMR_Library as nmr
+import NMR_Spectrum as spectrum
+
+def remote_step_file(index):
+    """Remote file name used by sweep step `index` (instead of the shared mesure.bin)."""
+    return f"mesure_{index}.bin"
+
+def sweep_steps(nb_files, larmor_Frequency_Hertz, excitation_duration_seconds, step_freq=0, step_p90=0, exp_name="Stepfreq"):
+    """
+    Parameters of every step of a linear sweep, as a list of dicts with keys
+    index, larmor_Frequency_Hertz, excitation_duration_seconds, remote_file and local_file.
+    """
+    return [{
+        "index": i,
+        "larmor_Frequency_Hertz": larmor_Frequency_Hertz + i * step_freq,
+        "excitation_duration_seconds": excitation_duration_seconds + i * step_p90,
+        "remote_file": remote_step_file(i),
+        "local_file": f"{exp_name}{i}",
+    } for i in range(nb_files)]
+
+def process_file(file_path):
+    """
+    Default processing of one downloaded step: decode, accumulate and compute the spectrum.
+    Returns a dict with time, voltage_acc, freq and mag.
+    """
+    time, voltage, voltage_acc = nmr.open_file_bin(file_path, nombre_de_FID=-1)
+    freq, mag = spectrum.batch_spectrum(voltage_acc, time[1] - time[0])
+    return {"time": time, "voltage_acc": voltage_acc, "freq": freq, "mag": mag}
+
+class StepError(RuntimeError):
+    """Failure of one sweep step; `step` is the step dict and the original exception is chained."""
+    def __init__(self, step, stage, error):
+        super().__init__(f"step {step.get('index')} : {stage} failed ({error})")
+        self.step = step
+        self.stage = stage
+        self.error = error
+
+class PipelinedSweep:
+    """
+    Run acquire -> download -> process for a list of steps, overlapping the stages.
+    Parameters:
+      acquire      : acquire(step) runs the acquisition of one step on the board (blocking)
+      download     : download(step) fetches the step's file and returns its local path
+      process      : process(step, local_path) -> result, run in a worker thread (None = no processing)
+      max_pending  : maximum number of steps acquired but not yet processed
+      workers      : number of processing threads
+      stop_event   : threading.Event; when set, no new acquisition is started
+      on_result    : optional callback(step, result) called from the worker thread when a step is done
+      keep_results : keep every result until the end of run(); with False, results are only passed
+                     to on_result and memory does not grow with the sweep length
+    run(steps) returns one result per acquired step, in step order (None for steps without processing
+    or whose download or processing failed), or the steps actually processed when keep_results is
+    False. Steps left out by stop_event are not in the list. A failed download or processing stops the
+    acquisitions (stop_event is left untouched) and run() raises StepError for the first failed step;
+    the steps completed are listed in `completed` and the results list is still kept in `results`.
+    """
+    def __init__(self, acquire, download, process=None, max_pending=2, workers=2, stop_event=None, on_result=None, keep_results=True):
+        self.acquire = acquire
+        self.download = download
+        self.process = process
+        self.max_pending = max_pending
+        self.workers = workers
+        self.stop_event = stop_event if stop_event is not None else threading.Event()
+        self.on_result = on_result
+        self.keep_results = keep_results
+        self.completed = []
+        self.results = []
+
+    def run(self, steps):
+        slots = threading.BoundedSemaphore(self.max_pending)
+        downloads = queue.Queue()
+        futures = []
+        errors = []
+        failed = threading.Event()     # internal: a step failed, no new acquisition
+        self.completed = []
+        self.results = []
+        acquired = 0
+        lock = threading.Lock()
+        order = {}      # id(step) -> position in the sweep
+
+        def finish(step, local_path):
+            try:
+                result = self.process(step, local_path) if self.process is not None else None
+                if self.on_result is not None:
+                    self.on_result(step, result)
+            except Exception as e:
+                errors.append(StepError(step, "processing", e))
+                failed.set()
+                return None
+            finally:
+                slots.release()
+            with lock:
+                self.completed.append(step)
+            return result if self.keep_results else step
+
+        def downloader(executor):
+            while True:
+                step = downloads.get()
+                if step is None:
+                    return
+                try:
+                    local_path = self.download(step)
+                except Exception as e:
+                    errors.append(StepError(step, "download", e))
+                    failed.set()        # before the slot is freed: no acquisition starts after a failure
+                    slots.release()
+                    continue
+                futures.append((order[id(step)], executor.submit(finish, step, local_path)))
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            thread = threading.Thread(target=downloader, args=(executor,), daemon=True)
+            thread.start()
+            try:
+                for position, step in enumerate(steps):
+                    order[id(step)] = position
+                    slots.acquire()   # blocks while max_pending steps are still downloading/processing
+                    if self.stop_event.is_set() or failed.is_set():
+                        slots.release()
+                        break
+                    try:
+                        self.acquire(step)
+                    except Exception:
+                        slots.release()
+                        raise
+                    acquired += 1
+                    downloads.put(step)
+            finally:
+                downloads.put(None)
+                thread.join()
+            # a step whose download failed keeps its slot (None)
+            results = [None] * acquired
+            for position, future in futures:
+                results[position] = future.result()
+
+        self.completed.sort(key=lambda step: order[id(step)])
+        self.results = results
+        if errors:
+            error = min(errors, key=lambda e: order[id(e.step)])
+            raise error from error.error
+        if not self.keep_results:
+            return [step for step in results if step is not None]
+        return results
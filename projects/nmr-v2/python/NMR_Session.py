@@ -0,0 +1,135 @@
+"""
+Persistent SSH/SFTP session to the Red Pitaya.
+
+A single authenticated paramiko Transport carries both the command channels
+(Acquisition_*.exe) and the SFTP channel used to fetch the measurement files.
+The session is meant to be created once and reused across acquisition runs:
+keep-alives hold the link open and a dropped connection is re-established on
+the next call.
+"""
+import socket
+import threading
+import paramiko
+
+class PitayaSession:
+    """
+    One authenticated SSH transport shared by exec and SFTP channels.
+    Parameters:
+      host      : board address
+      username  : SSH user
+      password  : SSH password
+      port      : SSH port (a local stand-in server can listen on any port)
+      keepalive : seconds between keep-alive packets (0 disables them)
+      timeout   : connection / authentication timeout in seconds
+    Usage:
+      session = PitayaSession("169.254.215.235")
+      nmr.run_acquisition_fid_command(..., session=session)
+      nmr.download_file_sftp(..., session=session)
+      session.close()
+    The live mode runs src-C/Acquisition_stream.exe, which is not part of the stock board
+    image: supports_streaming is False, the live mode must be enabled explicitly once that
+    program has been copied next to Acquisition_axi.exe.
+    """
+    supports_streaming = False
+
+    def __init__(self, host, username="root", password="root", port=22, keepalive=30, timeout=10):
+        self.host = host
+        self.username = username
+        self.password = password
+        self.port = port
+        self.keepalive = keepalive
+        self.timeout = timeout
+        self.transport = None
+        self._sftp = None
+        self._lock = threading.RLock()
+
+    def __enter__(self):
+        self.ensure_connected()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @property
+    def is_active(self):
+        return self.transport is not None and self.transport.is_active()
+
+    def matches(self, host, username, password, port=22):
+        """True if this session was opened with the same connection parameters."""
+        return (self.host, self.username, self.password, self.port) == (host, username, password, port)
+
+    def connect(self):
+        """(Re)open the transport and authenticate; any previous transport is closed first."""
+        with self._lock:
+            self.close()
+            sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            transport = paramiko.Transport(sock)
+            try:
+                transport.start_client(timeout=self.timeout)
+                transport.auth_password(self.username, self.password)
+            except Exception:
+                transport.close()
+                raise
+            if self.keepalive:
+                transport.set_keepalive(self.keepalive)
+            self.transport = transport
+
+    def ensure_connected(self):
+        """Reconnect if the transport was never opened or has dropped."""
+        with self._lock:
+            if not self.is_active:
+                self.connect()
+            return self.transport
+
+    def _retry(self, action):
+        """Run action(); on a dropped link reconnect once and run it again."""
+        try:
+            return action()
+        except (paramiko.SSHException, EOFError, OSError):
+            if self.is_active:
+                raise   # genuine error (e.g. missing remote file), not a lost connection
+            self.connect()
+            return action()
+
+    def exec_command(self, command, timeout=None):
+        """
+        Run a command on its own channel of the shared transport.
+        Returns (stdin, stdout, stderr) file objects like paramiko.SSHClient.exec_command.
+        """
+        def action():
+            channel = self.ensure_connected().open_session(timeout=self.timeout)
+            channel.settimeout(timeout)
+            channel.exec_command(command)
+            return channel.makefile_stdin("wb"), channel.makefile("r"), channel.makefile_stderr("r")
+        return self._retry(action)
+
+    def run(self, command, timeout=None):
+        """Run a command and wait for it; returns (output, errors) decoded as text."""
+        stdin, stdout, stderr = self.exec_command(command, timeout=timeout)
+        return stdout.read().decode(), stderr.read().decode()
+
+    @property
+    def sftp(self):
+        """SFTP client over the shared transport, reopened if the transport or channel closed."""
+        with self._lock:
+            self.ensure_connected()
+            channel = self._sftp.get_channel() if self._sftp is not None else None
+            if channel is None or channel.closed:
+                self._sftp = paramiko.SFTPClient.from_transport(self.transport)
+            return self._sftp
+
+    def get(self, remote_path, local_path):
+        """Download remote_path to local_path over SFTP."""
+        return self._retry(lambda: self.sftp.get(remote_path, local_path))
+
+    def close(self):
+        with self._lock:
+            if self._sftp is not None:
+                try:
+                    self._sftp.close()
+                except Exception:
+                    pass
+                self._sftp = None
+            if self.transport is not None:
+                self.transport.close()
+                self.transport = None
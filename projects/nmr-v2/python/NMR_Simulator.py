@@ -0,0 +1,241 @@
+"""
+Offline simulation of the nmr-v2 board.
+
+SimulatedSample produces realistic accumulations (line offset from the
+excitation frequency, T2* decay, optional spin echo, nutation and off-resonance
+excitation, white noise, ADC quantization at the /ADC_SCALE convention) as int16
+FIDs, written in the exact .bin layout of the board programs.
+
+FakeBoard stands in for NMR_Session.PitayaSession: it understands the
+Acquisition_axi.exe / Acquisition_stream.exe / Acquisition_echo.exe command lines built by
+run_acquisition_*_command (including the streaming port), writes the
+measurement file in a local directory laid out like the board, and serves it
+back through get() / sftp.get() / sftp.remove(). The whole host pipeline
+(acquisition, download, decoding, processing, viewer) can then be exercised and
+timed without a Red Pitaya, optionally in real time.
+"""
+import io
+import os
+import shlex
+import shutil
+import tempfile
+import threading
+import time
+import numpy as np
+
+import NMR_Library as nmr
+from NMR_Stream import FakeFIDStreamServer
+from NMR_Tracking import IF_OFFSET_HZ
+
+ADC_MIN, ADC_MAX = -8192, 8191     # 14-bit ADC range in int16 samples
+SIMULATED_HOST = "sim"             # host name that selects the simulated board (exact match only)
+
+class SimulatedSample:
+    """
+    Spin system and receiver model.
+    Parameters:
+      larmor               : resonance frequency (Hz)
+      t2_star              : FID / echo half-width decay time (s)
+      t2                   : echo amplitude decay time (s)
+      amplitude            : on-resonance, 90 degree signal amplitude (V)
+      noise                : white noise standard deviation per FID (V)
+      t90                  : 90 degree pulse length (s)
+      excitation_bandwidth : 1/e half-width of the excitation profile (Hz)
+      if_offset            : recorded frequency of a line at the excitation frequency
+                             (NMR_Tracking convention; None = absolute RF frequency)
+      seed                 : random seed
+    """
+    def __init__(self, larmor=13.9e6, t2_star=1e-3, t2=20e-3, amplitude=0.02, noise=0.05, t90=30e-6,
+                 excitation_bandwidth=20e3, if_offset=IF_OFFSET_HZ, seed=0):
+        self.larmor = larmor
+        self.t2_star = t2_star
+        self.t2 = t2
+        self.amplitude = amplitude
+        self.noise = noise
+        self.t90 = t90
+        self.excitation_bandwidth = excitation_bandwidth
+        self.if_offset = if_offset
+        self.rng = np.random.default_rng(seed)
+
+    def gain(self, larmorFrequency, excitationDuration):
+        """Signal amplitude (V) for an excitation at larmorFrequency lasting excitationDuration seconds."""
+        offset = self.larmor - larmorFrequency
+        nutation = np.abs(np.sin(0.5 * np.pi * excitationDuration / self.t90))
+        return self.amplitude * nutation * np.exp(-(offset / self.excitation_bandwidth) ** 2)
+
+    def line_frequency(self, larmorFrequency):
+        """Frequency of the line in the recorded signal."""
+        if self.if_offset is None:
+            return self.larmor
+        return self.if_offset + self.larmor - larmorFrequency
+
+    def clean_signal(self, dsize, decimation, larmorFrequency, excitationDuration, echoTime=None):
+        """
+        Noise-free signal of one FID (V). echoTime (seconds) gives a spin echo centered at
+        echoTime instead of a FID starting at t=0.
+        """
+        t = nmr.time_axis(dsize, decimation)
+        carrier = np.cos(2 * np.pi * self.line_frequency(larmorFrequency) * t)
+        if echoTime is None:
+            envelope = np.exp(-t / self.t2_star)
+        else:
+            envelope = np.exp(-np.abs(t - echoTime) / self.t2_star - echoTime / self.t2)
+        return self.gain(larmorFrequency, excitationDuration) * envelope * carrier
+
+    def fids(self, nombre_de_FID, dsize, decimation, larmorFrequency, excitationDuration, echoTime=None, block_size=16):
+        """
+        int16 FIDs (nombre_de_FID, dsize) quantized like the ADC: round(volts * ADC_SCALE), clipped
+        to 14 bits. The noise is drawn block by block, so only block_size FIDs of floats exist at once.
+        """
+        signal = self.clean_signal(dsize, decimation, larmorFrequency, excitationDuration, echoTime)
+        raw = np.empty((nombre_de_FID, dsize), dtype='<i2')
+        for start in range(0, nombre_de_FID, block_size):
+            block = self.rng.normal(0.0, self.noise, (min(block_size, nombre_de_FID - start), dsize))
+            block += signal
+            block *= nmr.ADC_SCALE
+            np.rint(block, out=block)
+            np.clip(block, ADC_MIN, ADC_MAX, out=block)
+            raw[start:start + len(block)] = block
+        return raw
+
+    def write_bin(self, pathFile_bin, nombre_de_FID, dsize, decimation, larmorFrequency, excitationDuration, echoTime=None, gain=0):
+        """Simulate an accumulation and write it as an nmr-v2 .bin file; returns the raw FIDs."""
+        raw = self.fids(nombre_de_FID, dsize, decimation, larmorFrequency, excitationDuration, echoTime)
+        nmr.write_file_bin(pathFile_bin, raw, decimation, gain)
+        return raw
+
+class _FakeSFTP:
+    """The part of paramiko.SFTPClient used by the library (get, stat, remove)."""
+    def __init__(self, board):
+        self.board = board
+
+    def get(self, remote_path, local_path):
+        if self.board.time_scale and self.board.download_rate:
+            time.sleep(os.path.getsize(self.board.local_path(remote_path)) / self.board.download_rate * self.board.time_scale)
+        shutil.copyfile(self.board.local_path(remote_path), local_path)
+
+    def stat(self, remote_path):
+        return os.stat(self.board.local_path(remote_path))
+
+    def remove(self, remote_path):
+        os.remove(self.board.local_path(remote_path))
+
+    def close(self):
+        pass
+
+class FakeBoard:
+    """
+    Stand-in for PitayaSession backed by a SimulatedSample.
+    Parameters:
+      sample        : SimulatedSample (a default one if None)
+      root          : directory playing the board's home directory (a temporary one if None)
+      time_scale    : 0 = as fast as possible, 1 = real acquisition/download durations, 0.1 = 10x faster...
+      download_rate : simulated SFTP throughput in bytes/s (used when time_scale > 0)
+    Attributes:
+      host     : address of the streaming server (local)
+      commands : command lines received
+    Usage:
+      board = FakeBoard(SimulatedSample(larmor=13.9e6 + 2000))
+      nmr.run_acquisition_fid_command(131072, 2, 100, "mesures.bin", 13.9e6, 30e-6, 1000, session=board)
+      nmr.download_file_sftp("Stepfreq0", "mesures", folder, session=board)
+    """
+    def __init__(self, sample=None, root=None, time_scale=0.0, download_rate=5e6):
+        self.sample = sample if sample is not None else SimulatedSample()
+        self._tmp = tempfile.TemporaryDirectory(prefix="fake-pitaya-") if root is None else None
+        self.root = root if root is not None else self._tmp.name
+        self.time_scale = time_scale
+        self.download_rate = download_rate
+        self.host = "127.0.0.1"
+        self.supports_streaming = True
+        self.commands = []
+        self._lock = threading.Lock()
+        os.makedirs(self.local_path(nmr.REMOTE_PATH + "mesures"), exist_ok=True)
+
+    # --- PitayaSession interface ---
+    @property
+    def is_active(self):
+        return True
+
+    def matches(self, host, username, password, port=22):
+        return host == SIMULATED_HOST
+
+    def ensure_connected(self):
+        return self
+
+    def connect(self):
+        pass
+
+    def local_path(self, remote_path):
+        """Local file standing for a path relative to the board's home directory."""
+        return os.path.join(self.root, os.path.normpath(remote_path))
+
+    def exec_command(self, command, timeout=None):
+        """Run an acquisition command line; returns (stdin, stdout, stderr) file objects."""
+        self.commands.append(command)
+        try:
+            output = self._run(command)
+            errors = ""
+        except (ValueError, IndexError) as e:
+            output, errors = "", f"{e}\n"
+        return io.BytesIO(), io.BytesIO(output.encode()), io.BytesIO(errors.encode())
+
+    def run(self, command, timeout=None):
+        stdin, stdout, stderr = self.exec_command(command, timeout)
+        return stdout.read().decode(), stderr.read().decode()
+
+    @property
+    def sftp(self):
+        return _FakeSFTP(self)
+
+    def get(self, remote_path, local_path):
+        return self.sftp.get(remote_path, local_path)
+
+    def close(self):
+        pass
+
+    def cleanup(self):
+        """Delete the temporary board directory (if the board created it)."""
+        if self._tmp is not None:
+            self._tmp.cleanup()
+            self._tmp = None
+
+    # --- board programs ---
+    def _run(self, command):
+        cwd = ""
+        for part in command.split("&&"):
+            args = shlex.split(part)
+            if not args:
+                continue
+            if args[0] == "cd":
+                cwd = args[1]
+            elif args[0].endswith("Acquisition_axi.exe"):
+                return self._acquire(cwd, args[1:], echo=False)
+            elif args[0].endswith(nmr.STREAM_PROGRAM):
+                return self._acquire(cwd, args[1:], echo=False, stream=True)
+            elif args[0].endswith("Acquisition_echo.exe"):
+                return self._acquire(cwd, args[1:], echo=True)
+            elif args[0] in ("pkill", "killall"):
+                return ""       # a streamed acquisition ends by itself once its client has gone
+            else:
+                raise ValueError(f"unknown command: {args[0]}")
+        return ""
+
+    def _acquire(self, cwd, args, echo, stream=False):
+        samplesNb, dec, FidNb = int(float(args[0])), int(args[1]), int(args[2])
+        filePath = args[3]
+        larmorFrequency, excitationDuration, delayRepeat = float(args[4]), float(args[5]), float(args[6])
+        echoTime = float(args[7]) * 1e-6 if echo else None
+        stream_port = int(args[7]) if stream else None
+        # duration of the real accumulation: record + pulse + repetition delay, per FID
+        period = samplesNb * dec / nmr.SAMPLING_RATE + excitationDuration + delayRepeat * 1e-6
+        raw = self.sample.fids(FidNb, samplesNb, dec, larmorFrequency, excitationDuration, echoTime)
+        if stream_port is not None:
+            server = FakeFIDStreamServer(raw, dec, port=stream_port, period=period * self.time_scale).start()
+            server.wait()
+            server.stop()
+            return f"{FidNb} FID streamed on port {stream_port}\n"
+        if self.time_scale:
+            time.sleep(FidNb * period * self.time_scale)
+        with self._lock:
+            nmr.write_file_bin(self.local_path(os.path.join(cwd, filePath)), raw, dec)
+        return f"{FidNb} FID written to {filePath}\n"
@@ -0,0 +1,182 @@
+"""
+Batched spectrum computation for nmr-v2 acquisitions.
+
+All steps of a sweep are stacked into one 2D array and transformed with a single
+real FFT (rfft) call, instead of one complex np.fft.fft per file. Frequency axes
+are cached since every step of a sweep shares the same length and sampling step.
+"""
+import functools
+import numpy as np
+from scipy import fft as sp_fft
+
+def fft_length(n, n_fft=None):
+    """
+    Length of the transform for records of n samples.
+    Parameters:
+      n     : number of samples in each record
+      n_fft : None (no padding), "fast" (zero-pad to the next fast FFT length),
+              or an explicit length (>= n to zero-pad, < n to truncate)
+    """
+    if n_fft is None:
+        return n
+    if n_fft == "fast":
+        return sp_fft.next_fast_len(n, real=True)
+    return int(n_fft)
+
+@functools.lru_cache(maxsize=32)
+def rfft_frequencies(n_fft, dt):
+    """
+    Cached one-sided frequency axis (Hz) of an rfft of length n_fft at sampling step dt.
+    The returned array is shared between callers and therefore read-only.
+    """
+    freq = sp_fft.rfftfreq(n_fft, dt)
+    freq.flags.writeable = False
+    return freq
+
+def stack_traces(traces, length=None):
+    """
+    Stack 1D traces into one (n_traces, length) float array.
+    Shorter traces are zero-padded and longer ones truncated; length defaults to the longest trace.
+    """
+    if isinstance(traces, np.ndarray) and traces.ndim == 2 and length in (None, traces.shape[1]):
+        return traces
+    if length is None:
+        length = max(len(trace) for trace in traces)
+    block = np.zeros((len(traces), length))
+    for i, trace in enumerate(traces):
+        n = min(len(trace), length)
+        block[i, :n] = trace[:n]
+    return block
+
+@functools.lru_cache(maxsize=32)
+def shifted_fft_frequencies(n_fft, dt):
+    """Cached two-sided ascending frequency axis (Hz) of an fft of length n_fft (read-only)."""
+    freq = sp_fft.fftshift(sp_fft.fftfreq(n_fft, dt))
+    freq.flags.writeable = False
+    return freq
+
+def _record_lengths(traces, n):
+    """Samples of each record (column vector) for the normalization of a stack of n-sample transforms."""
+    if isinstance(traces, np.ndarray):
+        return min(n, traces.shape[-1])
+    return np.minimum(n, [len(trace) for trace in traces])[:, np.newaxis]
+
+def batch_spectrum(traces, dt, n_fft=None, workers=None):
+    """
+    One-sided magnitude spectra of a stack of real traces in a single rfft call.
+    Parameters:
+      traces  : 2D array (n_steps, N), a list of 1D traces (stacked with stack_traces) or a single 1D trace;
+                traces of different lengths share the zero-padded grid but each is normalized by its own length
+      dt      : sampling step in seconds
+      n_fft   : zero-padding, see fft_length (None, "fast" or an explicit length)
+      workers : number of FFT worker threads (None = single thread, -1 = all cores)
+    Returns:
+      freq : 1D read-only array of frequencies (Hz), shared by all steps
+      mag  : magnitude spectra, shape (n_steps, n_fft//2 + 1), or 1D for a 1D input,
+             normalized by 2/N like the previous np.fft.fft based code
+    """
+    single = isinstance(traces, np.ndarray) and traces.ndim == 1
+    block = stack_traces(traces[np.newaxis, :] if single else traces)
+    n = fft_length(block.shape[-1], n_fft)
+    spectrum = sp_fft.rfft(block, n=n, axis=-1, workers=workers)
+    mag = np.abs(spectrum)
+    mag *= 2 / _record_lengths(traces, n)
+    freq = rfft_frequencies(n, float(dt))
+    return freq, (mag[0] if single else mag)
+
+def baseband_spectrum(traces, dt, f_center=0.0, n_fft=None, workers=None):
+    """
+    Two-sided magnitude spectra of complex baseband traces (see NMR_DDC) in a single fft call.
+    Parameters:
+      traces   : 2D complex array (n_steps, N), a list of 1D traces or a single 1D trace
+      dt       : sampling step in seconds
+      f_center : frequency of the baseband 0 Hz (the NCO frequency), added to the axis
+      n_fft, workers : as batch_spectrum
+    Returns:
+      freq : 1D ascending frequencies (Hz) around f_center, comparable with batch_spectrum's axis
+      mag  : magnitude spectra normalized by 1/N (the DDC output already carries the factor 2)
+    """
+    single = isinstance(traces, np.ndarray) and traces.ndim == 1
+    block = traces[np.newaxis, :] if single else traces
+    if not isinstance(block, np.ndarray) or block.ndim != 2:
+        length = max(len(trace) for trace in block)
+        stacked = np.zeros((len(block), length), dtype=np.complex128)
+        for i, trace in enumerate(block):
+            stacked[i, :len(trace)] = trace
+        block = stacked
+    n = fft_length(block.shape[-1], n_fft)
+    spectrum = sp_fft.fftshift(sp_fft.fft(block, n=n, axis=-1, workers=workers), axes=-1)
+    mag = np.abs(spectrum)
+    mag *= 1 / _record_lengths(traces, n)
+    freq = shifted_fft_frequencies(n, float(dt)) + f_center
+    return freq, (mag[0] if single else mag)
+
+class SpectrumStitcher:
+    """
+    Sum the offset spectra of a frequency sweep on one preallocated uniform frequency grid.
+    Each step is linearly interpolated onto the grid bins it covers and added in place,
+    so the cost per step is proportional to its own length and memory never grows.
+    Parameters:
+      f_min, f_max : bounds of the global grid (Hz)
+      df           : grid step (Hz)
+    Attributes:
+      freq   : global frequency grid
+      total  : summed magnitude per bin
+      counts : number of spectra that covered each bin (for normalization)
+    """
+    def __init__(self, f_min, f_max, df):
+        n = int(np.floor((f_max - f_min) / df + 0.5)) + 1
+        self.f_min = float(f_min)
+        self.df = float(df)
+        self.freq = self.f_min + self.df * np.arange(n)
+        self.total = np.zeros(n)
+        self.counts = np.zeros(n, dtype=np.int64)
+
+    @classmethod
+    def for_sweep(cls, freq, start_freq, step_freq, n_steps):
+        """
+        Grid covering every step of a sweep whose step i is offset by start_freq + i*step_freq.
+        freq is the (shared, ascending, uniform) frequency axis of one step; its spacing is kept.
+        """
+        return cls.for_offsets(freq, start_freq + step_freq * np.array([0, max(n_steps - 1, 0)]))
+
+    @classmethod
+    def for_offsets(cls, freq, offsets):
+        """Grid covering the axis freq shifted by each of the given offsets (steps in any order, with gaps)."""
+        offsets = np.asarray(offsets, dtype=np.float64)
+        return cls(freq[0] + offsets.min(), freq[-1] + offsets.max(), freq[1] - freq[0])
+
+    @classmethod
+    def for_spectra(cls, freqs, offsets):
+        """
+        Grid covering steps that each have their own axis (records of different lengths):
+        freqs[i] shifted by offsets[i], at the finest spacing of all the axes.
+        """
+        lows = [freq[0] + offset for freq, offset in zip(freqs, offsets)]
+        highs = [freq[-1] + offset for freq, offset in zip(freqs, offsets)]
+        return cls(min(lows), max(highs), min(freq[1] - freq[0] for freq in freqs))
+
+    def add(self, freq, mag, offset=0.0):
+        """Interpolate one spectrum (ascending freq + offset) onto the grid and add it in place."""
+        lo = freq[0] + offset
+        hi = freq[-1] + offset
+        i0 = max(int(np.ceil((lo - self.f_min) / self.df - 1e-9)), 0)
+        i1 = min(int(np.floor((hi - self.f_min) / self.df + 1e-9)), len(self.freq) - 1)
+        if i1 < i0:
+            return
+        self.total[i0:i1 + 1] += np.interp(self.freq[i0:i1 + 1] - offset, freq, mag)
+        self.counts[i0:i1 + 1] += 1
+
+    def add_batch(self, freq, mags, offsets):
+        """Add a stack of spectra (n_steps, n_bins) sharing the axis freq, step i shifted by offsets[i]."""
+        for mag, offset in zip(mags, offsets):
+            self.add(freq, mag, offset)
+
+    def result(self, normalize=False):
+        """
+        Return (freq, tf_sum). With normalize=True each bin is divided by its coverage count
+        (bins never covered stay at 0).
+        """
+        if not normalize:
+            return self.freq, self.total
+        return self.freq, np.divide(self.total, self.counts, out=np.zeros_like(self.total), where=self.counts > 0)
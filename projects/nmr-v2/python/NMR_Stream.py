@@ -0,0 +1,189 @@
+"""
+Streaming acquisition: FIDs pushed by the board over TCP as each shot completes.
+
+The stream carries exactly the bytes of an nmr-v2 .bin file (see build_file and
+add_to_file / send_header_to_socket and send_to_socket in src-C): the 16-byte
+header (dsize, decimation, nombre_de_FID, gain as little-endian int32) followed
+by nombre_de_FID blocks of dsize int16 samples. The receiver decodes it
+incrementally into a preallocated ring of FIDs and keeps a running sum, so the
+running average is available while the accumulation is still going on, and
+optionally tees the bytes to a local .bin file readable by open_file_bin.
+"""
+import socket
+import struct
+import threading
+import time
+import numpy as np
+
+import NMR_Library as nmr
+
+class FIDStreamReceiver:
+    """
+    Receive and decode a FID stream into a preallocated ring buffer.
+    Parameters:
+      host, port : address of the board-side (or fake) stream server
+      ring_size  : number of FIDs kept in the ring (older ones are overwritten)
+      on_fid     : optional callback(index, fid) called for every FID; fid is an int16
+                   view into the ring, valid until the slot is reused
+      save_path  : optional path of a .bin file receiving a copy of the stream
+      timeout    : socket timeout in seconds
+    Attributes after connect():
+      header : dict (dsize, decimation, nombre_de_FID, gain)
+      ring   : int16 array (ring_size, dsize)
+      count  : number of FIDs received
+      total  : float64 running sum of the raw samples
+    """
+    def __init__(self, host, port, ring_size=16, on_fid=None, save_path=None, timeout=10):
+        self.host = host
+        self.port = port
+        self.ring_size = ring_size
+        self.on_fid = on_fid
+        self.save_path = save_path
+        self.timeout = timeout
+        self.sock = None
+        self.header = None
+        self.ring = None
+        self.total = None
+        self.count = 0
+        self._file = None
+
+    def _recv_into(self, view):
+        """Fill a writable byte view from the socket (no intermediate bytes objects)."""
+        received = 0
+        while received < len(view):
+            n = self.sock.recv_into(view[received:])
+            if n == 0:
+                raise ConnectionError(f"stream closed after {self.count} FIDs")
+            received += n
+
+    def connect(self, wait=0.0):
+        """
+        Connect, read the header and allocate the ring.
+        wait : seconds during which a refused connection is retried (the board-side
+               program may not be listening yet right after it was launched)
+        """
+        deadline = time.monotonic() + wait
+        while True:
+            try:
+                self.sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+                break
+            except ConnectionRefusedError:
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.1)
+        headerbin = bytearray(nmr.BIN_HEADER_SIZE)
+        self._recv_into(memoryview(headerbin))
+        dsize, decimation, nombre_de_FID, gain = struct.unpack("<iiii", headerbin)
+        self.header = {"dsize": dsize, "decimation": decimation, "nombre_de_FID": nombre_de_FID, "gain": gain}
+        self.ring = np.zeros((self.ring_size, dsize), dtype='<i2')
+        self.total = np.zeros(dsize)
+        self.count = 0
+        if self.save_path is not None:
+            self._file = open(self.save_path, mode='wb')
+            self._file.write(headerbin)
+        return self.header
+
+    def receive_fid(self):
+        """Receive the next FID into the ring; returns (index, int16 view of the FID)."""
+        slot = self.count % self.ring_size
+        fid = self.ring[slot]
+        self._recv_into(memoryview(fid).cast('B'))
+        np.add(self.total, fid, out=self.total)
+        if self._file is not None:
+            self._file.write(fid.tobytes())
+        index = self.count
+        self.count += 1
+        if self.on_fid is not None:
+            self.on_fid(index, fid)
+        return index, fid
+
+    def run(self, stop_event=None):
+        """Receive FIDs until the header's nombre_de_FID is reached or stop_event is set; returns the count."""
+        if self.sock is None:
+            self.connect()
+        try:
+            while self.count < self.header["nombre_de_FID"]:
+                if stop_event is not None and stop_event.is_set():
+                    break
+                self.receive_fid()
+        finally:
+            self.close()
+        return self.count
+
+    def running_average(self, baseline="full"):
+        """Mean of the FIDs received so far, in volts, baseline-centered (see nmr.subtract_baseline)."""
+        if not self.count:
+            return None
+        return nmr.subtract_baseline(self.total / (self.count * nmr.ADC_SCALE), baseline)
+
+    def time_axis(self):
+        return nmr.time_axis(self.header["dsize"], self.header["decimation"])
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+class FakeFIDStreamServer:
+    """
+    Local stand-in for the board-side stream: serves one client the header and
+    the given int16 FIDs, optionally spaced by `period` seconds like real shots.
+    Parameters:
+      raw        : int16 array (nombre_de_FID, dsize)
+      decimation : decimation written in the header
+      port       : TCP port (0 = pick a free one, see .port after start())
+      period     : delay between FIDs in seconds
+    """
+    def __init__(self, raw, decimation=2, gain=0, host="127.0.0.1", port=0, period=0.0):
+        self.raw = np.ascontiguousarray(raw, dtype='<i2')
+        self.decimation = decimation
+        self.gain = gain
+        self.host = host
+        self.port = port
+        self.period = period
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind((self.host, self.port))
+        self._server.listen(1)
+        self.port = self._server.getsockname()[1]
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+        return self
+
+    def _serve(self):
+        try:
+            client, _ = self._server.accept()
+        except OSError:
+            return
+        with client:
+            nombre_de_FID, dsize = self.raw.shape
+            client.sendall(struct.pack("<iiii", dsize, self.decimation, nombre_de_FID, self.gain))
+            try:
+                for fid in self.raw:
+                    if self.period:
+                        time.sleep(self.period)
+                    client.sendall(fid.tobytes())
+            except OSError:
+                pass
+
+    def wait(self, timeout=None):
+        """Block until the client has been served (or timeout); returns True when done."""
+        if self._thread is not None:
+            self._thread.join(timeout)
+            return not self._thread.is_alive()
+        return True
+
+    def stop(self):
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+            self._thread = None
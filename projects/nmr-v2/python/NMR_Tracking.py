@@ -0,0 +1,170 @@
+"""
+Adaptive search of the Larmor frequency.
+
+A frequency sweep spends one full accumulation per step, most of them far from
+resonance. Once the line is visible in a spectrum, its position directly gives
+the offset between the excitation and the resonance, so the next excitation can
+be placed on it. LarmorSearch therefore:
+  1. coarse stage: probes the start frequency, then start +- k*coarse_step
+     (alternating outward) until a line is detected above snr_min;
+  2. fine stage: re-excites at the estimated resonance (spectral peak refined by
+     a parabolic fit of the log-magnitude) until the excitation is within
+     tolerance of the estimate.
+It needs a handful of acquisitions instead of a full sweep. SimulatedFIDSource
+provides a synthetic acquisition to test it without the board.
+
+Frequencies in the recorded spectrum are mapped to absolute frequencies with the
+same convention as NMRApp.open_file: absolute = f_excitation - if_offset + f_spectrum
+(if_offset=None for spectra already on an absolute axis).
+"""
+import numpy as np
+
+import NMR_Library as nmr
+import NMR_Spectrum as spectrum
+from NMR_Live import spectral_snr
+
+IF_OFFSET_HZ = 50e3     # record frequency of a line exactly at the excitation frequency (open_file convention)
+
+def parabolic_peak(freq, mag, index):
+    """
+    Sub-bin peak position and height from a parabola through the log-magnitude of
+    bins index-1, index, index+1 (exact for a Gaussian line, close for a Lorentzian).
+    """
+    if index <= 0 or index >= len(mag) - 1 or np.any(mag[index - 1:index + 2] <= 0):
+        return float(freq[index]), float(mag[index])
+    a, b, c = np.log(mag[index - 1:index + 2])
+    denom = a - 2 * b + c
+    delta = 0.0 if denom == 0 else 0.5 * (a - c) / denom
+    df = freq[index + 1] - freq[index]
+    return float(freq[index] + delta * df), float(np.exp(b - 0.25 * (a - c) * delta))
+
+class LarmorSearch:
+    """
+    Coarse-to-fine search of the resonance.
+    Parameters:
+      acquire          : acquire(f_excitation) -> (freq, mag) spectrum of one accumulation
+      tolerance        : stop when the excitation is within tolerance (Hz) of the estimate
+      coarse_step      : frequency step (Hz) of the coarse stage, ~ excitation bandwidth
+      max_span         : largest offset (Hz) probed from the start frequency by the coarse stage
+      max_acquisitions : total acquisition budget
+      snr_min          : spectral SNR above which a line is considered detected
+      if_offset        : see module docstring
+      band             : half-width (Hz) around if_offset where the line is searched (None = whole spectrum)
+      stop_event       : threading.Event aborting the search between acquisitions
+      on_step          : optional callback(entry) after each acquisition
+    run(f_start) returns a dict: frequency, converged, acquisitions, history (list of entries
+    with f_excitation, estimate, amplitude, snr, detected).
+    """
+    def __init__(self, acquire, tolerance=50.0, coarse_step=3000.0, max_span=100e3, max_acquisitions=12,
+                 snr_min=8.0, if_offset=IF_OFFSET_HZ, band=None, stop_event=None, on_step=None):
+        self.acquire = acquire
+        self.tolerance = tolerance
+        self.coarse_step = coarse_step
+        self.max_span = max_span
+        self.max_acquisitions = max_acquisitions
+        self.snr_min = snr_min
+        self.if_offset = if_offset
+        self.band = band
+        self.stop_event = stop_event
+        self.on_step = on_step
+        self.history = []
+
+    def measure(self, f_excitation):
+        """One acquisition at f_excitation; returns its history entry."""
+        freq, mag = self.acquire(f_excitation)
+        freq = np.asarray(freq)
+        mag = np.asarray(mag)
+        if self.band is not None:
+            center = self.if_offset if self.if_offset is not None else f_excitation
+            keep = np.abs(freq - center) <= self.band
+            freq, mag = freq[keep], mag[keep]
+        index = int(np.argmax(mag))
+        peak, amplitude = parabolic_peak(freq, mag, index)
+        estimate = peak if self.if_offset is None else f_excitation - self.if_offset + peak
+        snr = spectral_snr(mag)
+        entry = {"f_excitation": float(f_excitation), "estimate": estimate, "amplitude": amplitude,
+                 "snr": snr, "detected": snr >= self.snr_min}
+        self.history.append(entry)
+        if self.on_step is not None:
+            self.on_step(entry)
+        return entry
+
+    def _stopped(self):
+        return len(self.history) >= self.max_acquisitions or (self.stop_event is not None and self.stop_event.is_set())
+
+    def _coarse_frequencies(self, f_start):
+        yield f_start
+        k = 1
+        while k * self.coarse_step <= self.max_span:
+            yield f_start + k * self.coarse_step
+            yield f_start - k * self.coarse_step
+            k += 1
+
+    def run(self, f_start):
+        self.history = []
+        entry = None
+        # coarse stage: walk outward until the line shows up
+        for f_excitation in self._coarse_frequencies(f_start):
+            if self._stopped():
+                break
+            entry = self.measure(f_excitation)
+            if entry["detected"]:
+                break
+        converged = False
+        # fine stage: excite on the estimate until it no longer moves
+        while entry is not None and entry["detected"] and not self._stopped():
+            if abs(entry["estimate"] - entry["f_excitation"]) <= self.tolerance:
+                converged = True
+                break
+            previous = entry
+            entry = self.measure(previous["estimate"])
+            if not entry["detected"]:
+                entry = previous    # lost the line: keep the last good estimate
+                break
+        if entry is not None and not converged and entry["detected"]:
+            converged = abs(entry["estimate"] - entry["f_excitation"]) <= self.tolerance
+        detected = [e for e in self.history if e["detected"]]
+        best = detected[-1]["estimate"] if detected else None
+        return {"frequency": best, "converged": converged, "acquisitions": len(self.history), "history": self.history}
+
+class SimulatedFIDSource:
+    """
+    Synthetic accumulation for testing the search without the board: one damped line at
+    larmor, excited with a Gaussian profile of width excitation_bandwidth around the
+    excitation frequency, recorded at if_offset + (larmor - f_excitation), plus white noise.
+    Parameters:
+      larmor               : true resonance (Hz)
+      t2                   : decay time (s)
+      amplitude            : on-resonance amplitude (V)
+      noise                : noise standard deviation (V)
+      excitation_bandwidth : 1/e half-width of the excitation profile (Hz)
+      dsize, decimation    : record length and decimation (dt = decimation / SAMPLING_RATE)
+      seed                 : random seed
+    Attributes:
+      calls : number of acquisitions simulated
+    """
+    def __init__(self, larmor, t2=2e-3, amplitude=0.05, noise=0.02, excitation_bandwidth=20e3,
+                 dsize=16384, decimation=64, if_offset=IF_OFFSET_HZ, seed=0):
+        self.larmor = larmor
+        self.t2 = t2
+        self.amplitude = amplitude
+        self.noise = noise
+        self.excitation_bandwidth = excitation_bandwidth
+        self.if_offset = if_offset
+        self.time = nmr.time_axis(dsize, decimation)
+        self.dt = decimation / nmr.SAMPLING_RATE
+        self.rng = np.random.default_rng(seed)
+        self.calls = 0
+
+    def fid(self, f_excitation):
+        """Accumulated FID (volts) recorded when exciting at f_excitation."""
+        self.calls += 1
+        offset = self.larmor - f_excitation
+        line = offset + (self.if_offset if self.if_offset is not None else f_excitation)
+        gain = self.amplitude * np.exp(-(offset / self.excitation_bandwidth) ** 2)
+        signal = gain * np.cos(2 * np.pi * line * self.time) * np.exp(-self.time / self.t2)
+        return signal + self.rng.normal(0.0, self.noise, len(self.time))
+
+    def __call__(self, f_excitation):
+        """Spectrum (freq, mag) of the accumulation at f_excitation, usable as LarmorSearch.acquire."""
+        return spectrum.batch_spectrum(self.fid(f_excitation), self.dt)
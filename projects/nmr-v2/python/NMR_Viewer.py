@@ -0,0 +1,159 @@
+"""
+Single in-process Dash server for all interactive (FigureResampler) figures.
+
+Figures are registered by ID and served at http://host:port/<id>. One pair of
+callbacks (page routing + pattern-matched resampling on zoom) serves every
+figure, so opening more graphs does not start new servers or threads. The
+registered figures, which hold the full-resolution data, are kept in an LRU
+cache and the least recently viewed ones are evicted. Live figures are rebuilt
+by a callback on a timer (dcc.Interval) while their page is open, so a running
+accumulation is redrawn at a fixed rate whatever the acquisition rate.
+"""
+import itertools
+import socket
+import threading
+from collections import OrderedDict
+
+import dash
+from dash import dcc, html, Input, Output, State, MATCH
+from plotly_resampler import FigureResampler
+from werkzeug.serving import make_server
+
+class FigureServer:
+    """
+    Long-lived Dash server holding registered FigureResampler figures.
+    Parameters:
+      host, port  : address the server listens on; if the port is busy (or 0) a free one
+                    is picked when the server starts, see .port and url()
+      max_figures : number of figures kept; older ones are evicted (LRU)
+      config      : plotly config passed to every dcc.Graph
+    Usage:
+      viewer = FigureServer()
+      url = viewer.register(FigureResampler(go.Figure()), "FID")
+      webbrowser.open(url)
+    """
+    def __init__(self, host="127.0.0.1", port=8050, max_figures=8, config=None):
+        self.host = host
+        self.port = port
+        self.max_figures = max_figures
+        self.config = config if config is not None else {'scrollZoom': True}
+        self.figures = OrderedDict()
+        self.live = OrderedDict()      # fig_id -> (build_figure, interval in seconds)
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._server = None
+        self.app = dash.Dash(__name__, suppress_callback_exceptions=True)
+        self.app.layout = html.Div([dcc.Location(id="url"), html.Div(id="page")])
+        self.app.callback(Output("page", "children"), Input("url", "pathname"))(self._render_page)
+        self.app.callback(
+            Output({"type": "nmr-graph", "index": MATCH}, "figure", allow_duplicate=True),
+            Input({"type": "nmr-graph", "index": MATCH}, "relayoutData"),
+            State({"type": "nmr-graph", "index": MATCH}, "id"),
+            prevent_initial_call=True,
+        )(self._resample)
+        self.app.callback(
+            Output({"type": "nmr-live", "index": MATCH}, "figure"),
+            Input({"type": "nmr-live-timer", "index": MATCH}, "n_intervals"),
+            State({"type": "nmr-live", "index": MATCH}, "id"),
+            prevent_initial_call=True,
+        )(self._refresh_live)
+
+    def get(self, fig_id):
+        """Registered figure for fig_id (marked as recently used), or None if unknown/evicted."""
+        with self._lock:
+            figure = self.figures.get(fig_id)
+            if figure is not None:
+                self.figures.move_to_end(fig_id)
+            return figure
+
+    def _render_page(self, pathname):
+        fig_id = (pathname or "/").strip("/")
+        with self._lock:
+            live = self.live.get(fig_id)
+        if live is not None:
+            build_figure, interval = live
+            return html.Div([
+                dcc.Graph(id={"type": "nmr-live", "index": fig_id}, figure=build_figure() or {}, config=self.config, style={"height": "95vh"}),
+                dcc.Interval(id={"type": "nmr-live-timer", "index": fig_id}, interval=int(interval * 1000)),
+            ])
+        figure = self.get(fig_id)
+        if figure is None:
+            with self._lock:
+                links = [html.Li(dcc.Link(key, href=f"/{key}")) for key in reversed(self.figures)]
+            return html.Div([html.P(f"Figure '{fig_id}' introuvable (fermée ou trop ancienne)."), html.Ul(links)])
+        return dcc.Graph(id={"type": "nmr-graph", "index": fig_id}, figure=figure, config=self.config, style={"height": "95vh"})
+
+    def _resample(self, relayout_data, graph_id):
+        figure = self.get(graph_id["index"])
+        if not isinstance(figure, FigureResampler):
+            return dash.no_update      # evicted, or a plain plotly figure (already full resolution)
+        return figure.construct_update_data_patch(relayout_data)
+
+    def _refresh_live(self, n_intervals, graph_id):
+        with self._lock:
+            live = self.live.get(graph_id["index"])
+        figure = live[0]() if live is not None else None
+        return dash.no_update if figure is None else figure
+
+    def register_live(self, build_figure, name="live", interval=1.0):
+        """
+        Add a live figure and return its URL. build_figure() is called every `interval` seconds
+        while the page is open and returns a plotly figure, or None to keep the current one.
+        """
+        fig_id = f"{name}-{next(self._ids)}"
+        with self._lock:
+            self.live[fig_id] = (build_figure, interval)
+            while len(self.live) > self.max_figures:
+                self.live.popitem(last=False)
+        self.start()
+        return self.url(fig_id)
+
+    def register(self, figure, name="figure"):
+        """
+        Add a figure and return its URL: a FigureResampler is resampled on zoom, a plain
+        plotly figure is served as is.
+        The oldest figures beyond max_figures are evicted. Starts the server on first use.
+        """
+        fig_id = f"{name}-{next(self._ids)}"
+        with self._lock:
+            self.figures[fig_id] = figure
+            while len(self.figures) > self.max_figures:
+                self.figures.popitem(last=False)
+        self.start()
+        return self.url(fig_id)
+
+    def url(self, fig_id):
+        return f"http://{self.host}:{self.port}/{fig_id}"
+
+    def start(self):
+        """
+        Bind the server socket in the calling thread, then serve from a daemon thread; later
+        calls do nothing. A busy port falls back to a free one (self.port is updated), and any
+        other bind error is raised here instead of killing the server thread silently.
+        """
+        if self._thread is not None:
+            return
+        # bound here rather than by werkzeug, which exits the (server) thread on a busy port
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            listener.bind((self.host, self.port))
+        except OSError:
+            if self.port == 0:
+                listener.close()
+                raise
+            listener.bind((self.host, 0))
+        listener.listen(128)
+        self._server = make_server(self.host, 0, self.app.server, threaded=True, fd=listener.fileno())
+        listener.close()    # the server holds its own duplicate of the descriptor
+        self.port = self._server.port
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Shut the server down (a later register starts it again)."""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        self._thread = None
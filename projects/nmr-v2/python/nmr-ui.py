@@ -9,20 +9,36 @@ import json
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 from plotly_resampler import FigureResampler
-from scipy.interpolate import interp1d
 from tkinter import filedialog
 from tqdm import tqdm
-import random
 import webbrowser
+import itertools
 
 # Importation de votre librairie
 try:
     import NMR_Library as nmr
+    import NMR_Spectrum as spectrum
+    from NMR_Session import PitayaSession
+    import NMR_Pipeline as pipeline
+    import NMR_Stream as stream
+    import NMR_Live as live
+    import NMR_Downsample as downsample
+    import NMR_Viewer as viewer
+    from NMR_Cache import ProcessingCache
+    import NMR_Container as container
+    import NMR_Index as index
+    import NMR_Parallel as parallel
+    import NMR_Tracking as tracking
+    import NMR_Calibration as calibration
+    import NMR_Simulator as simulator
+    import NMR_DDC as ddc
 except ImportError:
     print("ATTENTION: NMR_Library non trouvé.")
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 CONFIG_FILE = os.path.join(BASE_DIR, "settings.json")
+CACHE_DIR = os.path.join(BASE_DIR, "cache")
+CONTAINER_FILE = "sweep.nmrc"      # conteneur de la sweep (toutes les étapes + métadonnées)
 
 class NMRApp:
     def __init__(self, root):
@@ -32,6 +48,10 @@ class NMRApp:
         
         self.is_running = False
         self.stop_event = threading.Event()
+        self.session = None # Session SSH/SFTP réutilisée d'une acquisition à l'autre
+        self.viewer = None  # Serveur Dash unique pour tous les graphes interactifs
+        # Cache des traitements (accumulation, filtrage, TF) par fichier et paramètres
+        self.cache = ProcessingCache(cache_dir=CACHE_DIR, max_memory_bytes=1024 * 2**20, max_disk_bytes=4 * 2**30)
         
         # Données partagées pour les graphiques
         self.data_store = {
@@ -78,6 +98,31 @@ class NMRApp:
         self.create_entry(param_frame, "excitation_duration_seconds", "Durée Excitation (s):", "30e-6", 1, 2)
         self.create_entry(param_frame, "fid_time", "Temps FID (s):", "5e6", 2, 2)
         self.create_entry(param_frame, "echo_time", "Echo Time (s):", "1",3,0)
+        self.create_entry(param_frame, "stream_port", "Port streaming (live):", "5000", 3, 2)
+        # Le mode live passe le port en argument supplémentaire : le programme de la carte doit le gérer
+        self.var_chk_btn_stream = tk.BooleanVar(value=False)
+        self.chk_btn_stream = ttk.Checkbutton(
+            param_frame, 
+            text="Acquisition_stream.exe installé sur la carte", 
+            variable=self.var_chk_btn_stream
+        )
+        self.chk_btn_stream.grid(column=3,row=4,sticky="ew", padx=5, pady=2)
+        # Copie de la sweep dans un conteneur .nmrc (en plus des .bin, qui restent les fichiers de travail)
+        self.var_chk_btn_container = tk.BooleanVar(value=False)
+        self.chk_btn_container = ttk.Checkbutton(
+            param_frame, 
+            text="Archiver la sweep en conteneur .nmrc", 
+            variable=self.var_chk_btn_container
+        )
+        self.chk_btn_container.grid(column=3,row=5,sticky="ew", padx=5, pady=2)
+        # Étapes du conteneur converties en bande de base complexe (NMR_DDC) : ~100x moins d'échantillons
+        self.var_chk_btn_baseband = tk.BooleanVar(value=False)
+        self.chk_btn_baseband = ttk.Checkbutton(
+            param_frame, 
+            text="Conteneur en bande de base (DDC)", 
+            variable=self.var_chk_btn_baseband
+        )
+        self.chk_btn_baseband.grid(column=3,row=6,sticky="ew", padx=5, pady=2)
 
         # --- FRAME FILTRE ET BALAYAGE --- 
         sweep_filter_frame = ttk.Frame(main_frame, padding="10")
@@ -90,6 +135,8 @@ class NMRApp:
         self.create_entry(sweep_frame, "step_p90", "Pas de P90 (s):", "0", 2)
         self.create_entry(sweep_frame, "exp_name", "Nom Expérience:", "Stepfreq", 3)
         self.create_entry(sweep_frame, "graph_start", "Début Graphe (ms):", "0", 4)
+        self.create_entry(sweep_frame, "snr_target", "SNR cible (0 = off):", "0", 5)
+        self.create_entry(sweep_frame, "larmor_tol", "Tolérance recherche Larmor (Hz):", "50", 6)
         # --- Section filtre Subframe --- 
         filter_frame = ttk.LabelFrame(sweep_filter_frame, text="4. Réglages du filtre", padding="5")
         filter_frame.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True,padx=2.5) 
@@ -125,6 +172,14 @@ class NMRApp:
             variable=self.var_chk_btn_filter
         )
         self.chk_btn_filter.grid(column=5,row=1,sticky="ew", padx=5, pady=2)
+        ## - zero phase filter -
+        self.var_chk_btn_zero_phase = tk.BooleanVar(value=False)
+        self.chk_btn_zero_phase = ttk.Checkbutton(
+            btn_frame, 
+            text="Filtre à phase nulle", 
+            variable=self.var_chk_btn_zero_phase
+        )
+        self.chk_btn_zero_phase.grid(column=7,row=2,sticky="ew", padx=5, pady=2)
         ## - dash -
         self.var_chk_btn_dash = tk.BooleanVar(value=False)
         self.chk_btn_dash = ttk.Checkbutton(
@@ -155,6 +210,10 @@ class NMRApp:
         self.btn_plot = ttk.Button(btn_frame, text="📁 OUVRIR GRAPHIQUES", 
                                    command=lambda: self.browse_open_file())
         self.btn_plot.pack(side=tk.BOTTOM,fill=tk.X, pady=5)
+
+        self.btn_live = ttk.Button(btn_frame, text="📈 AFFICHER LA MESURE EN COURS", 
+                                   command=lambda: self.show_plotly())
+        self.btn_live.pack(side=tk.BOTTOM,fill=tk.X, pady=5)
         
         self.btn_stop = ttk.Button(btn_frame, text="⏹ ARRÊTER", 
                                    command=self.stop_acquisition, state=tk.NORMAL)
@@ -176,6 +235,21 @@ class NMRApp:
                                     command=lambda: self.start_thread_acq(mode=2)) #Sweep P90 FID
         self.btn_sweep.pack(fill=tk.X, pady=5)
 
+        # Mode 6 = Accumulation en streaming avec moyenne glissante affichée en direct
+        self.btn_stream = ttk.Button(btn_fid_frame, text="▶ DÉMARRER FID SIMPLE (LIVE)", 
+                                     command=lambda: self.start_thread_acq(mode=6)) #Single FID live
+        self.btn_stream.pack(fill=tk.X, pady=5)
+
+        # Mode 7 = Recherche adaptative de la fréquence de Larmor (quelques acquisitions au lieu d'une sweep)
+        self.btn_search = ttk.Button(btn_fid_frame, text="▶ RECHERCHE AUTO LARMOR", 
+                                     command=lambda: self.start_thread_acq(mode=7)) #Larmor search
+        self.btn_search.pack(fill=tk.X, pady=5)
+
+        # Mode 8 = Calibration adaptative du P90 (remplace la sweep P90 linéaire)
+        self.btn_calib = ttk.Button(btn_fid_frame, text="▶ CALIBRATION AUTO P90", 
+                                    command=lambda: self.start_thread_acq(mode=8)) #P90 calibration
+        self.btn_calib.pack(fill=tk.X, pady=5)
+
         # --- Logs ---
         log_frame = ttk.LabelFrame(main_frame, text="Logs", padding="5")
         log_frame.pack(fill=tk.BOTH, expand=True)
@@ -229,8 +303,23 @@ class NMRApp:
 
     def on_close(self):
         self.save_settings()
+        if self.session is not None:
+            self.session.close()
         self.root.destroy()
 
+    def get_session(self, host, user, password):
+        """Retourne la session SSH ouverte, en la recréant si les identifiants ont changé."""
+        if self.session is None or not self.session.matches(host, user, password):
+            if self.session is not None:
+                self.session.close()
+            if host == simulator.SIMULATED_HOST:
+                # Carte simulée (hôte exactement "sim") : acquisitions synthétiques, sans Red Pitaya
+                self.session = simulator.FakeBoard()
+            else:
+                self.session = PitayaSession(host, username=user, password=password, port=22, timeout=10)
+        self.session.ensure_connected()
+        return self.session
+
     def start_thread_acq(self, mode):
          
         if self.is_running: return       
@@ -250,24 +339,16 @@ class NMRApp:
         t.daemon = True
         t.start()
 
-    def start_thread_dash(self, figure,port):
-        number_of_threads = len(threading.enumerate())
-        self.log(f"nombre de threads actifs: {number_of_threads}")
+    def get_viewer(self):
+        """Serveur Dash unique de l'application (démarré au premier graphe, réutilisé ensuite)."""
+        if self.viewer is None:
+            self.viewer = viewer.FigureServer(host="127.0.0.1", port=8050, max_figures=8, config={'scrollZoom': True})
+        return self.viewer
 
-   
-        self.is_running = True
-        self.stop_event.clear()
-        self.log(f"Affichage sur http://127.0.0.1:{port}/")
-        # La virgule est importante pour créer un tuple
-        t = threading.Thread(target=self.dash_launcher, args=(figure,port))
-        t.daemon = True
-        t.start()
-        webbrowser.open(f'http://127.0.1:{port}/', new=0, autoraise=True)
-
-    def dash_launcher(self,figure,port):
-        config = {'scrollZoom': True}
-        figure.show_dash(mode='external',port=port,config=config)
-        return
+    def show_dash_figure(self, figure, name):
+        url = self.get_viewer().register(figure, name)
+        self.log(f"Affichage sur {url}")
+        webbrowser.open(url, new=0, autoraise=True)
 
     def stop_acquisition(self):
         if self.is_running:
@@ -348,7 +429,7 @@ class NMRApp:
                 case 2 :
                     # MODE SWEEP P90 : On utilise les champs "Nb Fichiers" et "Stepp90"
                     nb_files = int(p['nb_files'])
-                    step_p90 = float(p['step_freq'])
+                    step_p90 = float(p['step_p90'])
                     exp_prefix = "SweepP90_"
                     self.log(">>> Mode: P90 Sweep FID")
                 case 3 :
@@ -374,10 +455,26 @@ class NMRApp:
                 case 5 :
                     # MODE SWEEP P90 ECHO : On utilise les champs "Nb Fichiers" et "Stepp90"
                     nb_files = int(p['nb_files'])
-                    step_p90 = float(p['step_freq'])
+                    step_p90 = float(p['step_p90'])
                     exp_prefix = "SweepP90_"
                     echo = True
                     self.log(">>> Mode: Frequency Sweep with echo")
+                case 6 :
+                    # MODE LIVE : une accumulation reçue FID par FID sur un socket
+                    nb_files = 1
+                    exp_prefix = "SingleLive_"
+                    self.log(">>> Mode: Accumulation FID en direct (streaming)")
+                case 7 :
+                    # MODE RECHERCHE LARMOR : "Pas de Fréquence" sert de pas grossier
+                    nb_files = 1
+                    step_freq = float(p['step_freq'])
+                    exp_prefix = "SearchLarmor_"
+                    self.log(">>> Mode: Recherche automatique de la fréquence de Larmor")
+                case 8 :
+                    # MODE CALIBRATION P90 : "Nb Fichiers" = nombre maximal d'acquisitions
+                    nb_files = int(p['nb_files'])
+                    exp_prefix = "CalibP90_"
+                    self.log(">>> Mode: Calibration adaptative du P90 (nutation)")
             if echo == True :
                 meas_time = (sample_Amount * decimation) / 125e6 + echo_time_us*3e-6 + excitation_duration_seconds*3
             else : 
@@ -389,63 +486,214 @@ class NMRApp:
             # Connexion
             
             self.log(f"Connexion à {HOST}...")
-            nmr.client = paramiko.SSHClient()
-            nmr.client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            nmr.client.connect(HOST, username=USER, password=PASS, port=22,timeout=10)
-            
-            if not nmr.client.get_transport(): 
-                return
-            
-            transport = paramiko.Transport((HOST, 22))
-            transport.connect(username=USER, password=PASS)
-            nmr.sftp = paramiko.SFTPClient.from_transport(transport)
+            session = self.get_session(HOST, USER, PASS)
             
             nameLocalFolder = nmr.create_file_wdate(exp_prefix+str(nb_files)+"_"+str(step_freq)+"_"+str(larmor_Frequency_Hertz))
             
-            #progress_bar = tqdm(total=nb_files, desc="Processing Acquisitions to find Frequency", unit="file")
-            for i in range(nb_files):
-                #progress_bar.update(1)
-                if self.stop_event.is_set(): break
-                
-                self.log(f"--- Step {i}/{nb_files} : {larmor_Frequency_Hertz/1e6:.3f} MHz {excitation_duration_seconds/1e-6:.3f}µs ---")
-                
-                # Acquisition
+            if mode == 6 :
+                if not (self.var_chk_btn_stream.get() or getattr(session, "supports_streaming", False)):
+                    # Le mode live lance Acquisition_stream.exe (src-C), absent de l'image d'origine de la carte
+                    self.log(f"Copier {nmr.STREAM_PROGRAM} (src-C, make Acquisition_stream.exe) sur la carte puis cocher la case","ERROR")
+                    return
+                file_path = os.path.join(nameLocalFolder, f"{p['exp_name']}0")
+                self.run_live_acquisition(session, session.host, int(p['stream_port']), file_path, sample_Amount, decimation, acq_Amt,
+                                          larmor_Frequency_Hertz, excitation_duration_seconds, delay_rep, float(p['snr_target']))
+                self.log("-- Acquisition terminée --","BLUE")
+                return
+
+            nameRemoteFolder = "mesures" 
+
+            if mode == 7 :
+                self.run_larmor_search(session, nameRemoteFolder, nameLocalFolder, p['exp_name'], sample_Amount, decimation, acq_Amt,
+                                       larmor_Frequency_Hertz, excitation_duration_seconds, delay_rep, step_freq, float(p['larmor_tol']))
+                return
+            if mode == 8 :
+                self.run_p90_calibration(session, nameRemoteFolder, nameLocalFolder, p['exp_name'], sample_Amount, decimation, acq_Amt,
+                                         larmor_Frequency_Hertz, excitation_duration_seconds, delay_rep, max(nb_files, calibration.DEFAULT_MAX_ACQUISITIONS))
+                return
+            steps = pipeline.sweep_steps(nb_files, larmor_Frequency_Hertz, excitation_duration_seconds, step_freq, step_p90, p['exp_name'])
+
+            def acquire(step):
+                # Acquisition (sur la carte) de l'étape, pendant que la précédente est téléchargée
+                self.log(f"--- Step {step['index']}/{nb_files} : {step['larmor_Frequency_Hertz']/1e6:.3f} MHz {step['excitation_duration_seconds']/1e-6:.3f}µs ---")
                 if echo == True :
-                    nmr.run_acquisition_echo_command(sample_Amount, decimation, acq_Amt, "mesures.bin", larmor_Frequency_Hertz, excitation_duration_seconds, delay_rep,echoTime=echo_time_us,verbose=True)
+                    nmr.run_acquisition_echo_command(sample_Amount, decimation, acq_Amt, "mesures.bin", step['larmor_Frequency_Hertz'], step['excitation_duration_seconds'], delay_rep,echoTime=echo_time_us,verbose=True,session=session,remote_file=step['remote_file'])
                 else :    
-                    nmr.run_acquisition_fid_command(sample_Amount, decimation, acq_Amt, "mesures.bin", larmor_Frequency_Hertz, excitation_duration_seconds, delay_rep, verbose=True) 
-                
-                # Téléchargement
-                experiment_name = f"{p['exp_name']}{i}"
-                nameRemoteFolder = "mesures" 
-                nmr.download_file_sftp(experiment_name,nameRemoteFolder,nameLocalFolder)
-                
-                # Traitement
-                file_path = os.path.join(nameLocalFolder, experiment_name)
-             
-                larmor_Frequency_Hertz += step_freq
-                excitation_duration_seconds += step_p90
-            
-            #progress_bar.close()
+                    nmr.run_acquisition_fid_command(sample_Amount, decimation, acq_Amt, "mesures.bin", step['larmor_Frequency_Hertz'], step['excitation_duration_seconds'], delay_rep, verbose=True, session=session,remote_file=step['remote_file']) 
+
+            def download(step):
+                # Téléchargement, puis suppression du fichier distant seulement si le transfert a réussi
+                return nmr.fetch_remote_file(step['local_file'], nameRemoteFolder, nameLocalFolder, session, remote_file=step['remote_file'])
+
+            def process(step, local_path):
+                # Traitement (décodage + FFT) dans un thread de travail
+                return pipeline.process_file(local_path)
+
+            sweep_metadata = {
+                "mode": exp_prefix.rstrip("_"), "exp_name": p['exp_name'], "echo": echo, "sample_Amount": sample_Amount, "decimation": decimation,
+                "acq_amt": acq_Amt, "step_freq": step_freq, "step_p90": step_p90, "delay_repeat_us": delay_rep,
+                "larmor_Frequency_Hertz": larmor_Frequency_Hertz, "excitation_duration_seconds": excitation_duration_seconds,
+                "echo_time_seconds": echo_time_us*1e-6 if echo else None, "date": datetime.datetime.now().isoformat()}
+            # Index de la sweep, complété à chaque étape traitée
+            sweep_index = index.SweepIndex(nameLocalFolder, sweep_metadata).start()
+            # Conteneur (optionnel) rempli étape par étape dans les threads de traitement, sans relecture en fin de sweep.
+            # Les .bin sont conservés : l'index, le cache et open_file travaillent dessus ; le conteneur en est une copie d'archive.
+            writer = None
+            baseband = self.var_chk_btn_baseband.get()
+            if self.var_chk_btn_container.get():
+                writer = container.SweepWriter(os.path.join(nameLocalFolder, CONTAINER_FILE), dict(sweep_metadata, baseband=baseband))
+            def on_result(step, result):
+                params = {key: step[key] for key in ("larmor_Frequency_Hertz", "excitation_duration_seconds")}
+                sweep_index.add(step['index'], step['local_file'], params, index.spectrum_summary(result["freq"], result["mag"]))
+                if writer is not None:
+                    step_path = os.path.join(nameLocalFolder, step['local_file'])
+                    step_metadata = dict(params, index=step['index'], echo_time_seconds=sweep_metadata["echo_time_seconds"])
+                    if baseband:
+                        # Bande de base complexe autour de la FI : seule la bande utile est stockée
+                        fids, ddc_metadata = ddc.downconvert_step(step_path)
+                        writer.add_step(fids, {**step_metadata, **ddc_metadata})
+                    else:
+                        writer.add_bin_file(step_path, step_metadata)
+
+            # Les résultats ne servent qu'à l'index (on_result) : ils ne sont pas conservés
+            runner = pipeline.PipelinedSweep(acquire, download, process, max_pending=2, workers=2, stop_event=self.stop_event,
+                                             on_result=on_result, keep_results=False)
+            try:
+                runner.run(steps)
+            except pipeline.StepError as e:
+                self.log(f"Étape {e.step['index']} en échec ({e.stage}) : {e.error}","ERROR")
+            finally:
+                if writer is not None:
+                    writer.close()
+            if not runner.completed:
+                self.log("Aucune étape traitée","ERROR")
+                return
+            file_path = os.path.join(nameLocalFolder, runner.completed[-1]['local_file'])
+            if writer is not None:
+                self.log(f"Conteneur écrit : {writer.path}")
 
             self.log("-- Acquisition terminée --","BLUE")
             self.data_store = {"file_path" : file_path}
             print("Chemin renvoyé par l'acquisition : \n \t"+str(file_path))
-            ##self.open_file(filepath_all=file_path[:-1]) # Remove the index
+            ##self.open_file(filepath_all=file_path) # les étapes sont retrouvées par l'index du dossier
             
         except Exception as e:
             self.log(f"ERREUR: {e}")
             print(e) # Pour debug console
         finally:
             try:
-                nmr.client.close()
-                transport.close()
                 self.btn_sweep.config(state=tk.NORMAL)
                 self.btn_single.config(state=tk.NORMAL)
             except: pass
             self.is_running = False
             self.btn_stop.config(state=tk.DISABLED)
 
+    def run_live_acquisition(self, session, host, port, file_path, sample_Amount, decimation, acq_Amt, larmor_Frequency_Hertz, excitation_duration_seconds, delay_rep, snr_target):
+        """Lance l'acquisition en streaming, met à jour data_store (moyenne, TF, SNR) et l'affiche en direct pendant l'accumulation."""
+        # La commande distante tourne dans son propre thread : elle ne rend la main qu'à la fin de l'accumulation
+        remote = threading.Thread(target=nmr.run_acquisition_fid_command, daemon=True,
+                                  args=(sample_Amount, decimation, acq_Amt, "mesures.bin", larmor_Frequency_Hertz, excitation_duration_seconds, delay_rep),
+                                  kwargs={"verbose": True, "session": session, "stream_port": port})
+        remote.start()
+
+        receiver = stream.FIDStreamReceiver(host, port, save_path=file_path)
+        header = receiver.connect(wait=10)
+        dt = decimation / nmr.SAMPLING_RATE
+        self.data_store = {"time": None}
+        # Page du serveur Dash redessinée chaque seconde, indépendamment de la cadence des FID
+        url = self.get_viewer().register_live(self.live_figure, "Live", interval=1.0)
+        self.log(f"Affichage en direct sur {url}")
+        webbrowser.open(url, new=0, autoraise=True)
+        averager = live.LiveAverager(header["dsize"], dt, min_interval=1.0, on_update=self.update_live_view,
+                                     snr_target=snr_target if snr_target > 0 else None, stop_event=self.stop_event)
+        receiver.on_fid = lambda index, fid: averager.add(fid)
+        receiver.run(stop_event=self.stop_event)
+        snap = averager.publish()
+        if snap is not None and snr_target > 0 and snap["snr"] >= snr_target:
+            self.log(f"SNR cible atteint ({snap['snr']:.1f}) après {snap['iter']} FID","SUCCESS")
+        remote.join(timeout=5)
+        if remote.is_alive():
+            # Accumulation interrompue (SNR atteint ou ARRÊTER) : arrêt du programme sur la carte
+            nmr.stop_remote_acquisition(session, nmr.STREAM_PROGRAM)
+            remote.join(timeout=5)
+
+    def run_larmor_search(self, session, nameRemoteFolder, nameLocalFolder, exp_name, sample_Amount, decimation, acq_Amt, larmor_Frequency_Hertz, excitation_duration_seconds, delay_rep, coarse_step, tolerance):
+        """Recherche adaptative de la résonance ; la fréquence trouvée remplace celle du champ Larmor."""
+        counter = itertools.count()
+
+        def acquire_spectrum(freq):
+            result = self.acquire_and_process(session, nameRemoteFolder, nameLocalFolder, f"{exp_name}{next(counter)}", sample_Amount, decimation, acq_Amt,
+                                              freq, excitation_duration_seconds, delay_rep)
+            return result["freq"], result["mag"]
+
+        def on_step(entry):
+            state = "détectée" if entry["detected"] else "non détectée"
+            self.log(f"Excitation {entry['f_excitation']/1e6:.6f} MHz : raie {state}, estimation {entry['estimate']/1e6:.6f} MHz (SNR {entry['snr']:.1f})","BLUE")
+
+        search = tracking.LarmorSearch(acquire_spectrum, tolerance=tolerance, coarse_step=coarse_step, stop_event=self.stop_event, on_step=on_step)
+        try:
+            result = search.run(larmor_Frequency_Hertz)
+        except Exception as e:
+            self.log(f"Recherche interrompue après {len(search.history)} acquisitions : {e}","ERROR")
+            return
+        if result["frequency"] is None:
+            self.log(f"Résonance non trouvée après {result['acquisitions']} acquisitions","ERROR")
+            return
+        level = "SUCCESS" if result["converged"] else "WARNING"
+        self.log(f"Larmor = {result['frequency']:.1f} Hz ({result['acquisitions']} acquisitions, convergé : {result['converged']})", level)
+        def update_entry():
+            self.inputs['larmor_Frequency_Hertz'].delete(0, tk.END)
+            self.inputs['larmor_Frequency_Hertz'].insert(0, f"{result['frequency']:.0f}")
+        self.root.after(0, update_entry)
+
+    def run_p90_calibration(self, session, nameRemoteFolder, nameLocalFolder, exp_name, sample_Amount, decimation, acq_Amt, larmor_Frequency_Hertz, excitation_duration_seconds, delay_rep, max_acquisitions):
+        """Calibration adaptative du P90 (courbe de nutation) ; le P90 trouvé remplace la durée d'excitation."""
+        counter = itertools.count()
+
+        def acquire_amplitude(duration):
+            result = self.acquire_and_process(session, nameRemoteFolder, nameLocalFolder, f"{exp_name}{next(counter)}", sample_Amount, decimation, acq_Amt,
+                                              larmor_Frequency_Hertz, duration, delay_rep)
+            return index.spectrum_summary(result["freq"], result["mag"])["peak_amplitude"]
+
+        def on_step(entry, fit):
+            msg = f"Impulsion {entry['duration']/1e-6:.3f}µs : amplitude {entry['amplitude']:.4g}"
+            if fit is not None:
+                msg += f" -> P90 = {fit['t90']/1e-6:.3f} ± {fit['t90_err']/1e-6:.3f}µs"
+            self.log(msg,"BLUE")
+
+        calib = calibration.P90Calibration(acquire_amplitude, excitation_duration_seconds, max_acquisitions=max_acquisitions, stop_event=self.stop_event, on_step=on_step)
+        try:
+            result = calib.run()
+        except Exception as e:
+            self.log(f"Calibration interrompue après {len(calib.durations)} acquisitions : {e}","ERROR")
+            return
+        if result["t90"] is None:
+            self.log(f"Ajustement de la nutation impossible après {result['acquisitions']} acquisitions","ERROR")
+            return
+        level = "SUCCESS" if result["converged"] else "WARNING"
+        self.log(f"P90 = {result['t90']/1e-6:.3f} ± {result['t90_err']/1e-6:.3f}µs, P180 = {result['t180']/1e-6:.3f} ± {result['t180_err']/1e-6:.3f}µs ({result['acquisitions']} acquisitions)", level)
+        if not result["converged"]:
+            reason = "arrêt demandé" if self.stop_event.is_set() else f"budget de {max_acquisitions} acquisitions épuisé"
+            self.log(f"P90 NON CONVERGÉ ({reason}) : incertitude {100*result['t90_err']/result['t90']:.1f}% > tolérance {100*calib.rel_tol:.1f}%, "
+                     f"valeur à confirmer (augmenter le nombre de fichiers pour un budget plus grand)","WARNING")
+        def update_entry():
+            self.inputs['excitation_duration_seconds'].delete(0, tk.END)
+            self.inputs['excitation_duration_seconds'].insert(0, f"{result['t90']:.4g}")
+        self.root.after(0, update_entry)
+
+    def acquire_and_process(self, session, nameRemoteFolder, nameLocalFolder, local_file, sample_Amount, decimation, acq_Amt, larmor_Frequency_Hertz, excitation_duration_seconds, delay_rep):
+        """Une accumulation complète sur la carte, téléchargement puis décodage + FFT (modes adaptatifs)."""
+        remote_file = pipeline.remote_step_file(0)
+        nmr.run_acquisition_fid_command(sample_Amount, decimation, acq_Amt, "mesures.bin", larmor_Frequency_Hertz, excitation_duration_seconds, delay_rep, verbose=True, session=session, remote_file=remote_file)
+        # Le fichier distant n'est supprimé qu'après un téléchargement réussi (IOError sinon)
+        local_path = nmr.fetch_remote_file(local_file, nameRemoteFolder, nameLocalFolder, session, remote_file=remote_file)
+        return pipeline.process_file(local_path)
+
+    def update_live_view(self, snap):
+        """Appelée au plus une fois par intervalle par LiveAverager : publie la moyenne courante pour la page live."""
+        self.data_store = {**self.data_store, **snap}     # remplacement en bloc, lu par le thread du serveur Dash
+        self.log(f"FID {snap['iter']} : SNR = {snap['snr']:.1f}")
+
     def browse_open_file(self):
         # Ouvre l'explorateur
         self.log("Ouverture et affichage...")
@@ -455,35 +703,116 @@ class NMRApp:
         
         # Si l'utilisateur n'a pas annulé
         if filepath:
-            if self.var_chk_btn_files.get():
-                filepath = filepath[:-1]
             self.open_file(filepath_all=filepath)
             return
 
-    def open_file(self,filepath_all):
+    def start_parallel_processing(self, paths, filter_params, idx, on_done):
+        """
+        Remplit le cache (accumulation, filtre, spectre) des fichiers .bin dans un pool de processus,
+        depuis un thread ; l'interface reste réactive et on_done est rappelée dans le thread Tk.
+        """
+        self.log(f"Traitement parallèle de {len(paths)} fichiers...")
+        spec_params = {"filter": filter_params, "idx": idx, "n_fft": "fast"}
+        # Le bouton ARRÊTER annule les fichiers pas encore commencés ; le drapeau n'est rendu que s'il a été pris ici
+        owner = not self.is_running
+        if owner:
+            self.is_running = True
+            self.stop_event.clear()
+            self.btn_stop.config(state=tk.NORMAL)
+        progress_bar = tqdm(total=len(paths), desc="Processing Acquisitions in parallel", unit="file")
+        state = {"done": False, "error": None, "failed": 0}
+
+        def work():
+            try:
+                with parallel.process_sweep(paths, filter_params, idx=idx, n_fft="fast", stop_event=self.stop_event,
+                                            on_result=lambda row: progress_bar.update(1)) as results:
+                    for row, path in enumerate(paths):
+                        if not results.done[row]:
+                            continue
+                        n = results.lengths[row]
+                        # Copies : la mémoire partagée est libérée à la sortie du bloc with
+                        self.cache.put(path, "acc", {}, {"time": np.array(results.time[:n], copy=True),
+                                                         "voltage_acc": np.array(results.voltage_acc[row, :n], copy=True)})
+                        if filter_params is not None:
+                            self.cache.put(path, "filtered", filter_params, {"voltage": np.array(results.voltage[row, :n], copy=True)})
+                        self.cache.put(path, "spectrum", spec_params, {"freq": np.array(results.freq, copy=True),
+                                                                       "mag": np.array(results.mag[row], copy=True)})
+                    state["failed"] = len(results.errors)
+            except Exception as e:
+                state["error"] = e
+            finally:
+                state["done"] = True
+
+        def poll():
+            if not state["done"]:
+                self.root.after(100, poll)
+                return
+            progress_bar.close()
+            try:
+                if state["error"] is not None:
+                    self.log(f"Erreur du traitement parallèle : {state['error']}","ERROR")
+                    return
+                if self.stop_event.is_set():
+                    self.log("Traitement interrompu","WARNING")
+                    return
+                if state["failed"]:
+                    self.log(f"{state['failed']} fichier(s) en erreur, traités à nouveau un par un","WARNING")
+                on_done()
+            except Exception as e:
+                self.log(f"Erreur à l'affichage : {e}","ERROR")
+            finally:
+                # Quelle que soit l'issue (erreur, arrêt, exception de on_done), l'interface est rendue
+                if owner:
+                    self.is_running = False
+                    self.btn_stop.config(state=tk.DISABLED)
+
+        threading.Thread(target=work, daemon=True).start()
+        self.root.after(100, poll)
+
+    def open_file(self,filepath_all, parallel_pass=True):
         
         p = {k: v.get() for k, v in self.inputs.items()}
         
         graph_start = float(p['graph_start'])
-        Start_freq = float(filepath_all.split('_')[3]) - 50000
+        reader = None
+        sweep_index = None
+        if filepath_all.endswith(".nmrc"):
+            # Conteneur : paramètres lus dans les métadonnées
+            reader = container.SweepReader(filepath_all)
+            Number_of_files = len(reader)
+            # Décalage de chaque étape d'après sa propre fréquence d'excitation
+            step_offsets = [reader.step_metadata(i)["larmor_Frequency_Hertz"] - 50000 for i in range(Number_of_files)]
+            # Étapes en bande de base (NMR_DDC) : FID complexes, spectre bilatéral autour de la fréquence du NCO
+            baseband = reader.step_metadata(0).get("baseband", False)
+            f_nco = reader.step_metadata(0).get("f_nco", 0.0)
+        elif self.var_chk_btn_files.get():
+            # Fichiers .bin : étapes et paramètres lus dans l'index du dossier (reconstruit si absent ou périmé).
+            # Sans décodage ici : les résumés manquants sont calculés plus bas, sur les traces chargées une seule fois
+            sweep_index = index.SweepIndex.open(os.path.dirname(filepath_all), step_file=os.path.basename(filepath_all), summarize=False)
+            if not len(sweep_index):
+                self.log("Aucune étape trouvée dans le dossier","ERROR")
+                return
+            step_files = sweep_index.paths()
+            Number_of_files = len(step_files)
+            # Décalage par numéro d'étape (et non par position dans la liste) : robuste aux étapes manquantes
+            step_offsets = [sweep_index.step_frequency(entry) - 50000 for entry in sweep_index]
+        else:
+            step_files = [filepath_all]
+            step_offsets = [float(index.parse_folder_name(os.path.dirname(filepath_all)).get("larmor_Frequency_Hertz", 50000)) - 50000]
+            Number_of_files = 1
+        if reader is None:
+            baseband = False
+        Start_freq = step_offsets[0]
         print(f"Start freq = {Start_freq}")
-        Step_freq = float(filepath_all.split('_')[2])
-        Number_of_files = int(filepath_all.split('_')[1])
         
 
-        # Initialisation variables accumulation
-        freq_all = None
-        tf_sum = None
         if not(self.var_chk_btn_files.get()) and self.var_chk_btn_sumtf.get():
             self.log("SUM TF option requires multiple files to be enabled","ERROR")
             return
         
         # --- multiple file enabled ---
-        if self.var_chk_btn_files.get(): ## IF TICKBOX MULTIPLE FILES IS ON
-            if (Number_of_files >= 100) and (not self.var_chk_btn_dash.get()):
-                self.log("ENABLE DASH","ERROR")
-                return
-        else :
+        # (sans Dash, les traces sont décimées à downsample.DEFAULT_N_OUT points : plus de limite de fichiers)
+        if not self.var_chk_btn_files.get(): ## IF TICKBOX MULTIPLE FILES IS OFF
             Number_of_files = 1
 
         print(f"Opening {Number_of_files}")
@@ -498,54 +827,129 @@ class NMRApp:
 
         fig3 = go.Figure() # For sum TF
 
+        # --- Load, filter and cut every file (produits intermédiaires mis en cache) ---
+        def load_accumulated(path):
+            time_array, voltage_array_matrix, voltageAcc_array = nmr.open_file_bin(path, nombre_de_FID=-1)
+            return {"time": time_array, "voltage_acc": voltageAcc_array}
+
+        def load_accumulated_step(step):
+            # Lecture bloc par bloc de la seule étape demandée dans le conteneur
+            return {"time": reader.time_axis(step), "voltage_acc": nmr.accumulate_fids(reader.iter_blocks(step), baseline="full")}
+
+        filter_params = None
+        if self.var_chk_btn_filter.get():                
+            lowcut=float(p['low_freq'])
+            highcut=float(p['high_freq'])
+            if lowcut >= highcut :
+                self.log("Filtre : FREQUENCE BASSE > FREQ HAUTE","ERROR")
+                return
+            filter_params = {"low": lowcut, "high": highcut, "order": int(p['order']), "zero_phase": self.var_chk_btn_zero_phase.get()}
+            if baseband:
+                self.log("Filtre passe-bande ignoré : les étapes sont déjà filtrées en bande de base","WARNING")
+                filter_params = None
+
+        # --- Fichiers .bin absents du cache : décodage/accumulation/filtre/FFT répartis sur tous les cœurs ---
+        if parallel_pass and reader is None and Number_of_files > 1:
+            missing = [path for path in step_files[:Number_of_files] if self.cache.get(path, "acc", {}) is None]
+            if len(missing) > 1:
+                # même dt (et donc même idx / mêmes clés de spectre) que le chemin série ci-dessous
+                header = nmr.read_header_bin(step_files[0])
+                time_first = nmr.time_axis(header["dsize"], header["decimation"])
+                idx = int(graph_start/(1000*np.abs(time_first[0] - time_first[1])))
+                # Le traitement tourne dans un thread ; l'affichage reprend quand le cache est rempli
+                self.start_parallel_processing(missing, filter_params, idx, lambda: self.open_file(filepath_all, parallel_pass=False))
+                return
+
+        filepaths = []
+        step_keys = []      # étape dans le conteneur, ajoutée aux clés du cache
+        times = []
+        volts = []
         progress_bar = tqdm(total=Number_of_files, desc="Processing Acquisitions to find Frequency", unit="file")
         for i in range(Number_of_files):
             progress_bar.update(1)
             self.log(f"Chargement du fichier {i}/{Number_of_files}")
 
-            if self.var_chk_btn_files.get():
-                filepath = filepath_all+str(i)
-            else :
+            if reader is not None:
                 filepath = filepath_all
-            time_array, voltage_array_matrix, voltageAcc_array = nmr.open_file_bin(filepath, nombre_de_FID=-1)
-            
-            dt = np.abs(time_array[0] - time_array[1])
-            
-            # --- if filter is enabled ---
-            if self.var_chk_btn_filter.get():                
-                lowcut=float(p['low_freq'])
-                highcut=float(p['high_freq'])
-                if lowcut >= highcut :
-                    self.log("Filtre : FREQUENCE BASSE > FREQ HAUTE","ERROR")
-                    return
-                
-                voltageAcc_array = nmr.butter_bandpass_filter(data=voltageAcc_array, lowcut=lowcut, highcut=highcut, fs=1/dt, order=int(p['order']))
-
-            # Coupe
+                step_key = {"step": i}
+                acc = self.cache.get_or_compute(filepath, "acc", step_key, lambda: load_accumulated_step(i))
+            else:
+                filepath = step_files[i]
+                step_key = {}
+                acc = self.cache.get_or_compute(filepath, "acc", step_key, lambda: load_accumulated(filepath))
+            filepaths.append(filepath)
+            step_keys.append(step_key)
+            times.append(acc["time"])
+            volts.append(acc["voltage_acc"])
+        
+        progress_bar.close()
+        if reader is not None:
+            reader.close()
+
+        # Résumés (pic, SNR) des étapes pas encore résumées dans l'index, sur les traces brutes déjà en mémoire
+        if sweep_index is not None:
+            for i, entry in enumerate(list(sweep_index)[:Number_of_files]):
+                if "peak_frequency" not in entry:
+                    freq_i, mag_i = spectrum.batch_spectrum(volts[i], times[i][1] - times[i][0])
+                    sweep_index.set_summary(entry["index"], index.spectrum_summary(freq_i, mag_i))
+        dt = np.abs(times[0][0] - times[0][1])
             
-            idx = int(graph_start/(1000*dt))
-            volt_cut = voltageAcc_array[idx:]
-            time_cut = time_array[idx:]
-
-            # FFT
-            N = len(volt_cut)
-            freq = np.fft.fftfreq(N, dt)
-            mag = np.abs(np.fft.fft(volt_cut)) * 2 / N        
+        # --- if filter is enabled : un seul appel filtré sur la pile des fichiers non encore en cache ---
+        if filter_params is not None:
+            filtered = [self.cache.get(path, "filtered", {**key, **filter_params}) for path, key in zip(filepaths, step_keys)]
+            missing = [i for i, entry in enumerate(filtered) if entry is None]
+            # Un appel par longueur de trace : le filtre aller-retour (zero_phase) traverserait le zéro-padding d'une pile mixte
+            by_length = {}
+            for i in missing:
+                by_length.setdefault(len(volts[i]), []).append(i)
+            for group in by_length.values():
+                stack = spectrum.stack_traces([volts[i] for i in group])
+                stack = nmr.bandpass_filter(stack, filter_params["low"], filter_params["high"], fs=1/dt, order=filter_params["order"], zero_phase=filter_params["zero_phase"])
+                for row, i in enumerate(group):
+                    filtered[i] = self.cache.put(filepaths[i], "filtered", {**step_keys[i], **filter_params}, {"voltage": stack[row]})
+            volts = [entry["voltage"] for entry in filtered]
+
+        # Coupe
+        idx = int(graph_start/(1000*dt))
+        volts_cut = [volt[idx:] for volt in volts]
+        times_cut = [time_array[idx:] for time_array in times]
+
+        # FFT : spectres en cache, puis une seule rfft par longueur de trace pour les étapes manquantes
+        # (chaque étape garde son propre axe et sa propre normalisation)
+        spec_params = {"filter": filter_params, "idx": idx, "n_fft": "fast"}
+        spectra = [self.cache.get(path, "spectrum", {**key, **spec_params}) for path, key in zip(filepaths, step_keys)]
+        missing = [i for i, entry in enumerate(spectra) if entry is None]
+        by_length = {}
+        for i in missing:
+            by_length.setdefault(len(volts_cut[i]), []).append(i)
+        for group in by_length.values():
+            if baseband:
+                freq, mags = spectrum.baseband_spectrum([volts_cut[i] for i in group], dt, f_center=f_nco, n_fft="fast", workers=-1)
+            else:
+                freq, mags = spectrum.batch_spectrum([volts_cut[i] for i in group], dt, n_fft="fast", workers=-1)
+            for i, mag in zip(group, mags):
+                spectra[i] = self.cache.put(filepaths[i], "spectrum", {**step_keys[i], **spec_params}, {"freq": freq, "mag": mag})
+
+        # --- if Multiple files is enabled ==> SUM TF on one preallocated grid ---
+        # Grille couvrant l'axe propre de chaque étape (décalé ou non), au pas le plus fin
+        stitcher = None
+        if self.var_chk_btn_files.get() and self.var_chk_btn_sumtf.get():
+            offsets = step_offsets[:Number_of_files] if self.var_chk_btn_offset_freq.get() else [0] * Number_of_files
+            stitcher = spectrum.SpectrumStitcher.for_spectra([entry["freq"] for entry in spectra], offsets)
 
+        for i in range(Number_of_files):
+            time_cut = times_cut[i]
+            volt_cut = np.real(volts_cut[i])    # partie réelle (en phase) pour les étapes en bande de base
+            mag = spectra[i]["mag"]
+            offset = 0
             if self.var_chk_btn_offset_freq.get():
-                freq = freq + Start_freq + i*Step_freq  
+                offset = step_offsets[i]
+            freq_i = spectra[i]["freq"] + offset
 
             # --- if Multiple files is enabled ==> SUM TF ---    
-            if self.var_chk_btn_files.get() and self.var_chk_btn_sumtf.get():
-                # Accumulation TF
-                if freq_all is None:
-                    freq_all = freq
-                    tf_sum = mag
-                else:
-                    g0 = interp1d(freq_all, tf_sum, bounds_error=False, fill_value=0.0)
-                    freq_all = np.union1d(freq_all, freq)
-                    g1 = interp1d(freq, mag, bounds_error=False, fill_value=0.0)
-                    tf_sum = g1(freq_all) + g0(freq_all)
+            if stitcher is not None:
+                # Accumulation TF sur la grille globale
+                stitcher.add(spectra[i]["freq"], mag, offset=offset)
 
             ## --- check if dash is enabled ---
             if self.var_chk_btn_dash.get():
@@ -560,30 +964,33 @@ class NMRApp:
                     mode='lines', 
                     opacity=1, 
                     showlegend=False
-                ),hf_x = freq[:len(freq)//2], hf_y = mag[:len(mag)//2])
+                ),hf_x = freq_i, hf_y = mag)
                 
             else :
                 self.log(f"sending file {i} on the plot...")
+                # Décimation min/max + LTTB : nombre de points borné par trace (affichage et HTML)
+                time_ds, volt_ds = downsample.minmax_lttb(time_cut, volt_cut)
+                freq_ds, mag_ds = downsample.minmax_lttb(freq_i, mag)
                 fig1.add_trace(go.Scattergl( #Scattergl to use opengl
-                    x=time_cut, 
-                    y=volt_cut, 
+                    x=time_ds, 
+                    y=volt_ds, 
                     mode='lines', 
                     opacity=1,       
                     showlegend=False    # Legende désactivée car bcp de courbes
                 ))
 
                 fig2.add_trace(go.Scattergl(
-                    x=freq, 
-                    y=mag, 
+                    x=freq_ds, 
+                    y=mag_ds, 
                     mode='lines', 
                     opacity=1, 
                     showlegend=False
                 ))
-        
-        progress_bar.close()
 
       ## -- plot of sum TF if multiple files is enabled --
-        if self.var_chk_btn_sumtf.get() and self.var_chk_btn_files.get(): 
+        if stitcher is not None: 
+            freq_all, tf_sum = stitcher.result()
+            freq_all, tf_sum = downsample.minmax_lttb(freq_all, tf_sum, n_out=4*downsample.DEFAULT_N_OUT)
             fig3.add_trace(go.Scattergl( #Scattergl to use opengl
                 x=freq_all, 
                 y=tf_sum, 
@@ -595,10 +1002,8 @@ class NMRApp:
 
 
         if self.var_chk_btn_dash.get():
-            random_port_1 = random.randint(8050, 9000)
-            random_port_2 = random.randint(8050, 9000)
-            self.start_thread_dash(fig1,port = random_port_1)
-            self.start_thread_dash(fig2,port = random_port_2)
+            self.show_dash_figure(fig1, "FID")
+            self.show_dash_figure(fig2, "TF")
 
             self.log("check the console to open the plot","WARNING")
         else :
@@ -613,39 +1018,30 @@ class NMRApp:
         print(filepath)
         self.is_running = False
 
-    def show_plotly(self):
-        A = NULL
-        #self.browse_open_file()
-
-        # if d["time"] is None:
-        #     self.log("Pas de données à afficher.")
-        #     return
+    def live_figure(self):
+        """Figure de la moyenne courante et de sa TF (None tant qu'aucune FID n'est arrivée)."""
+        d = self.data_store
+        if d.get("time") is None:
+            return None
+        fig = make_subplots(rows=2, cols=1, subplot_titles=("FID moyen", "TF"))
+        time_ds, volt_ds = downsample.minmax_lttb(d['time'], d['voltage'])
+        freq_ds, mag_ds = downsample.minmax_lttb(d['freq'], d['mag'])
+        fig.add_trace(go.Scattergl(x=time_ds, y=volt_ds, name="FID", mode='lines'), row=1, col=1)
+        fig.add_trace(go.Scattergl(x=freq_ds, y=mag_ds, name="FFT", mode='lines'), row=2, col=1)
+        fig.update_xaxes(title_text="Temps (s)", row=1, col=1)
+        fig.update_xaxes(title_text="Fréquence (Hz)", row=2, col=1)
+        # uirevision : le zoom de l'utilisateur est conservé entre deux rafraîchissements
+        fig.update_layout(title=f"Accumulation de {d['iter']} FID - SNR {d.get('snr', 0):.1f}", uirevision="live")
+        return fig
 
-        # self.log("Génération du graphique Plotly...")
-        
-        # # Création de la figure avec sous-graphes
-        # fig1 = go.Figure()
-        # fig2 = go.Figure()
-        # fig3 = go.Figure()
-        # if self.var_chk_btn_offset_freq.get():
-        #     # 1. Temporel
-        #     fig1.add_trace(go.Scatter(x=d['time'], y=d['voltage'], name="FID", mode='lines', line=dict(color='blue', width=1)))
-
-        # # 2. FFT Instant
-        # fig2.add_trace(go.Scatter(x=d['freq'], y=d['mag'], name="FFT Inst.", mode='lines', line=dict(color='orange')))
-
-        # # 3. FFT Somme
-        # fig3.add_trace(go.Scatter(x=d['freq_sum'], y=d['mag_sum'], name="FFT Somme", mode='lines', line=dict(color='green')))
-
-        # # Mise en forme
-        # fig1.update_xaxes(title_text="Temps (s)")
-        # fig2.update_xaxes(title_text="Fréquence (Hz)")
-        # fig3.update_xaxes(title_text="Fréquence (Hz)")
-        
-        # # Affichage (Ouvre le navigateur)
-        # fig1.show()
-        # fig2.show()
-        # fig3.show()
+    def show_plotly(self):
+        """Affiche la moyenne courante (mise à jour pendant une acquisition live) et sa TF."""
+        fig = self.live_figure()
+        if fig is None:
+            self.log("Pas de données à afficher.")
+            return
+        self.log(f"Génération du graphique Plotly ({self.data_store['iter']} FID)...")
+        fig.show(renderer="browser", config={'scrollZoom': True})
 
 if __name__ == "__main__":
     root = tk.Tk()
@@ -0,0 +1,55 @@
+"""
+Regression test: cache entries filled from process_sweep results must stay valid
+after the shared memory of the results has been released.
+"""
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import NMR_Library as nmr
+import NMR_Parallel as parallel
+from NMR_Cache import ProcessingCache
+from NMR_Simulator import SimulatedSample
+
+def _sweep_files(folder, n_steps=4):
+    sample = SimulatedSample(noise=0.01, seed=1)
+    paths = []
+    for i in range(n_steps):
+        path = os.path.join(folder, f"Stepfreq{i}")
+        sample.write_bin(path, 4, 4096, 64, sample.larmor + 500 * i, sample.t90)
+        paths.append(path)
+    return paths
+
+def _fill_cache(cache, paths):
+    with parallel.process_sweep(paths, idx=0, workers=2) as results:
+        for row, path in enumerate(paths):
+            n = results.lengths[row]
+            cache.put(path, "acc", {}, {"time": results.time[:n], "voltage_acc": results.voltage_acc[row, :n]})
+            cache.put(path, "spectrum", {}, {"freq": results.freq, "mag": results.mag[row]})
+        assert results.done.all()
+
+def _check_cache(cache, paths):
+    for path in paths:
+        header, raw = nmr.map_file_bin(path)
+        voltage_acc = nmr.accumulate_fids(nmr.ScaledFIDs(raw), baseline="full")
+        entry = cache.get(path, "acc", {})
+        np.testing.assert_allclose(entry["voltage_acc"], voltage_acc)
+        np.testing.assert_allclose(entry["time"], nmr.time_axis(header["dsize"], header["decimation"]))
+        spectrum = cache.get(path, "spectrum", {})
+        assert spectrum["mag"].shape == spectrum["freq"].shape
+        assert np.isfinite(spectrum["mag"]).all()
+
+def test_memory_cache_outlives_shared_memory(tmp_path):
+    paths = _sweep_files(str(tmp_path))
+    cache = ProcessingCache()
+    _fill_cache(cache, paths)
+    _check_cache(cache, paths)
+
+def test_disk_cache_outlives_shared_memory(tmp_path):
+    paths = _sweep_files(str(tmp_path))
+    cache = ProcessingCache(cache_dir=str(tmp_path / "cache"))
+    _fill_cache(cache, paths)
+    _check_cache(cache, paths)
+    _check_cache(ProcessingCache(cache_dir=str(tmp_path / "cache")), paths)
@@ -0,0 +1,75 @@
+"""
+PipelinedSweep end to end over the simulated board: each step is acquired by the
+Acquisition_axi.exe command line, fetched (and removed) over the fake SFTP and
+processed in a worker thread, and its line sits where the IF convention puts it.
+A failed download keeps its slot in the results.
+"""
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import NMR_Library as nmr
+import NMR_Pipeline as pipeline
+from NMR_Simulator import FakeBoard, SimulatedSample
+from NMR_Tracking import IF_OFFSET_HZ
+
+LARMOR = 13.9e6
+DSIZE, DECIMATION = 4096, 64
+
+def test_sweep_over_fake_board(tmp_path):
+    board = FakeBoard(SimulatedSample(larmor=LARMOR, noise=0.01, seed=5))
+    steps = pipeline.sweep_steps(5, LARMOR - 10e3, 30e-6, step_freq=5e3, exp_name="Stepfreq")
+    remote_folder = nmr.REMOTE_PATH + "mesures"
+
+    def acquire(step):
+        nmr.run_acquisition_fid_command(DSIZE, DECIMATION, 8, "mesures.bin", step['larmor_Frequency_Hertz'],
+                                        step['excitation_duration_seconds'], 1000, session=board, remote_file=step['remote_file'])
+
+    def download(step):
+        return nmr.fetch_remote_file(step['local_file'], "mesures", str(tmp_path), board, remote_file=step['remote_file'])
+
+    seen = []
+    runner = pipeline.PipelinedSweep(acquire, download, lambda step, local_path: pipeline.process_file(local_path),
+                                     max_pending=2, workers=2, on_result=lambda step, result: seen.append(step['index']))
+    try:
+        results = runner.run(steps)
+        assert os.listdir(board.local_path(remote_folder)) == []     # every step fetched, then removed
+    finally:
+        board.cleanup()
+
+    assert [step['index'] for step in runner.completed] == list(range(5))
+    assert sorted(seen) == list(range(5))
+    assert [command.split()[-4] for command in board.commands] == ["mesures/" + step['remote_file'] for step in steps]
+    for step, result in zip(steps, results):
+        assert os.path.exists(tmp_path / step['local_file'])
+        expected = IF_OFFSET_HZ + LARMOR - step['larmor_Frequency_Hertz']
+        peak = result["freq"][np.argmax(result["mag"])]
+        assert abs(peak - expected) <= 2 * (result["freq"][1] - result["freq"][0])
+
+def test_failed_download_keeps_its_slot(tmp_path):
+    board = FakeBoard(SimulatedSample(noise=0.01, seed=6))
+    steps = pipeline.sweep_steps(4, LARMOR, 30e-6, step_freq=5e3)
+
+    def acquire(step):
+        nmr.run_acquisition_fid_command(1024, DECIMATION, 2, "mesures.bin", step['larmor_Frequency_Hertz'],
+                                        step['excitation_duration_seconds'], 1000, session=board, remote_file=step['remote_file'])
+
+    def download(step):
+        if step['index'] == 2:
+            raise IOError("link lost")
+        return nmr.fetch_remote_file(step['local_file'], "mesures", str(tmp_path), board, remote_file=step['remote_file'])
+
+    runner = pipeline.PipelinedSweep(acquire, download, lambda step, local_path: pipeline.process_file(local_path), max_pending=1)
+    try:
+        with pytest.raises(pipeline.StepError) as error:
+            runner.run(steps)
+    finally:
+        board.cleanup()
+    assert error.value.step is steps[2] and error.value.stage == "download"
+    # max_pending=1: the failure is seen before step 3 is acquired
+    assert [step['index'] for step in runner.completed] == [0, 1]
+    assert len(runner.results) == 3 and runner.results[2] is None
+    assert all(result is not None for result in runner.results[:2])
@@ -0,0 +1,177 @@
+"""
+PitayaSession against a local paramiko SSH/SFTP stand-in: commands on the shared
+transport, the cached SFTP client, and a single reconnection after a dropped link.
+"""
+import os
+import socket
+import sys
+import threading
+
+import paramiko
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from NMR_Session import PitayaSession
+
+HOST_KEY = paramiko.RSAKey.generate(1024)
+USER, PASSWORD = "root", "root"
+
+class _Server(paramiko.ServerInterface):
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL if (username, password) == (USER, PASSWORD) else paramiko.AUTH_FAILED
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED if kind == "session" else paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel, command):
+        def reply():
+            channel.sendall(b"ran: " + command)
+            channel.send_exit_status(0)
+            channel.close()
+        # replies once the exec request has been acknowledged (sent after this method returns)
+        timer = threading.Timer(0.1, reply)
+        timer.daemon = True
+        timer.start()
+        return True
+
+class _SFTPHandle(paramiko.SFTPHandle):
+    def stat(self):
+        return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+
+class _SFTP(paramiko.SFTPServerInterface):
+    """Serves the files of the stand-in's root directory (read-only)."""
+    def __init__(self, server, root, *args, **kwargs):
+        super().__init__(server, *args, **kwargs)
+        self.root = root
+
+    def _path(self, path):
+        return os.path.join(self.root, path.lstrip("/"))
+
+    def stat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(self._path(path)))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    lstat = stat
+
+    def open(self, path, flags, attr):
+        try:
+            handle = _SFTPHandle(flags)
+            handle.readfile = open(self._path(path), "rb")
+            return handle
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+class StandIn:
+    """SSH server on a free local port; drop() closes every open connection from the server side."""
+    def __init__(self, root):
+        self.root = root
+        self.transports = []
+        self.connections = 0
+        self.listener = socket.create_server(("127.0.0.1", 0))
+        self.port = self.listener.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                sock, _ = self.listener.accept()
+            except OSError:
+                return
+            transport = paramiko.Transport(sock)
+            transport.add_server_key(HOST_KEY)
+            transport.set_subsystem_handler("sftp", paramiko.SFTPServer, _SFTP, self.root)
+            transport.start_server(server=_Server())
+            self.transports.append(transport)
+            self.connections += 1
+
+    def drop(self):
+        for transport in self.transports:
+            transport.close()
+
+    def close(self):
+        self.drop()
+        self.listener.close()
+
+@pytest.fixture
+def stand_in(tmp_path):
+    server = StandIn(str(tmp_path))
+    yield server
+    server.close()
+
+def _session(server):
+    return PitayaSession("127.0.0.1", USER, PASSWORD, port=server.port, keepalive=0, timeout=5)
+
+def test_exec_command(stand_in):
+    with _session(stand_in) as session:
+        output, errors = session.run("./Acquisition_axi.exe 1024")
+        assert output == "ran: ./Acquisition_axi.exe 1024" and errors == ""
+        stdin, stdout, stderr = session.exec_command("pkill -f x")
+        assert stdout.read() == b"ran: pkill -f x"
+        assert stdout.channel.recv_exit_status() == 0
+        assert stand_in.connections == 1    # both commands on the one transport
+
+def test_sftp_is_cached_and_reopened(stand_in, tmp_path):
+    (tmp_path / "mesure.bin").write_bytes(b"\x01\x02" * 100)
+    with _session(stand_in) as session:
+        sftp = session.sftp
+        assert session.sftp is sftp
+        assert sftp.stat("mesure.bin").st_size == 200
+        sftp.close()
+        assert session.sftp is not sftp         # closed channel: a new client
+        local = tmp_path / "copy.bin"
+        session.get("mesure.bin", str(local))
+        assert local.read_bytes() == b"\x01\x02" * 100
+        assert stand_in.connections == 1
+
+def test_dropped_link_is_reopened(stand_in):
+    with _session(stand_in) as session:
+        session.run("first")
+        stand_in.drop()
+        session.transport.join(5)   # wait until the client side sees the closed link
+        assert not session.is_active
+        output, _ = session.run("second")
+        assert output == "ran: second"
+        assert stand_in.connections == 2
+
+def test_retry_reconnects_once(stand_in):
+    with _session(stand_in) as session:
+        attempts = []
+        def action():
+            attempts.append(session.transport)
+            if len(attempts) == 1:
+                # the link drops in the middle of the call
+                stand_in.drop()
+                session.transport.join(5)
+                return session.transport.open_session(timeout=5)
+            return session.run("again")
+        assert session._retry(action) == ("ran: again", "")
+        assert len(attempts) == 2 and attempts[0] is not attempts[1]
+        assert stand_in.connections == 2
+
+def test_retry_gives_up_after_one_reconnection(stand_in):
+    session = _session(stand_in)
+    calls = []
+    def action():
+        calls.append(session.transport)
+        stand_in.drop()
+        session.transport.join(5)
+        raise EOFError("link lost")
+    try:
+        session.ensure_connected()
+        with pytest.raises(EOFError):
+            session._retry(action)
+        assert len(calls) == 2 and calls[0] is not calls[1]
+    finally:
+        session.close()
+
+def test_genuine_error_is_not_retried(stand_in):
+    with _session(stand_in) as session:
+        with pytest.raises(IOError):
+            session.get("missing.bin", os.devnull)
+        assert stand_in.connections == 1
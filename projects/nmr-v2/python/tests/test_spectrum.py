@@ -0,0 +1,26 @@
+"""
+Spectra of records of different lengths: each one is normalized by its own length,
+and the stitcher grid covers every step's own axis.
+"""
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import NMR_Spectrum as spectrum
+
+def test_mixed_lengths():
+    dt = 1e-6
+    lengths = (4096, 1024)
+    traces = [0.5 * np.cos(2 * np.pi * 62500.0 * dt * np.arange(n)) for n in lengths]   # on a bin of both axes
+    freq, mags = spectrum.batch_spectrum(traces, dt)
+    np.testing.assert_allclose(mags.max(axis=1), 0.5, rtol=1e-6)
+    # the short record zero-padded in the stack has the peak of its own-length spectrum
+    own = [spectrum.batch_spectrum(trace, dt) for trace in traces]
+    assert own[1][1].max() == pytest.approx(mags[1].max())
+    axes = [freq_i for freq_i, _ in own]
+    stitcher = spectrum.SpectrumStitcher.for_spectra(axes, [0.0, 1e6])
+    assert stitcher.df == axes[0][1] - axes[0][0]
+    assert stitcher.freq[0] == 0.0 and np.isclose(stitcher.freq[-1], axes[1][-1] + 1e6)
@@ -0,0 +1,63 @@
+"""
+FID streaming: the receiver keeps the running sum of the FIDs and its tee file is
+the .bin file the board would have written; a streamed acquisition launched through
+run_acquisition_fid_command (FakeBoard standing for Acquisition_stream.exe) arrives whole.
+"""
+import os
+import socket
+import sys
+import threading
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import NMR_Library as nmr
+from NMR_Simulator import FakeBoard, SimulatedSample
+from NMR_Stream import FakeFIDStreamServer, FIDStreamReceiver
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def test_receiver_running_total_and_tee(tmp_path):
+    raw = SimulatedSample(noise=0.01, seed=3).fids(20, 2048, 64, 13.9e6, 30e-6)
+    server = FakeFIDStreamServer(raw, decimation=64, gain=1).start()
+    save_path = str(tmp_path / "Stream0")
+    received = []
+    receiver = FIDStreamReceiver("127.0.0.1", server.port, ring_size=4, save_path=save_path,
+                                 on_fid=lambda index, fid: received.append(index))
+    try:
+        header = receiver.connect(wait=2)
+        assert header == {"dsize": 2048, "decimation": 64, "nombre_de_FID": 20, "gain": 1}
+        for _ in range(5):
+            receiver.receive_fid()
+        np.testing.assert_array_equal(receiver.total, raw[:5].sum(axis=0, dtype=np.float64))
+        assert receiver.run() == 20
+    finally:
+        server.stop()
+    assert received == list(range(20))
+    np.testing.assert_array_equal(receiver.total, raw.sum(axis=0, dtype=np.float64))
+    np.testing.assert_allclose(receiver.running_average(), nmr.subtract_baseline(raw.mean(axis=0) / nmr.ADC_SCALE, "full"))
+
+    header, tee = nmr.map_file_bin(save_path)
+    assert header["nombre_de_FID"] == 20 and header["decimation"] == 64 and header["gain"] == 1
+    np.testing.assert_array_equal(tee, raw)
+
+def test_streamed_acquisition_command(tmp_path):
+    board = FakeBoard(SimulatedSample(noise=0.01, seed=4))
+    port = _free_port()
+    try:
+        remote = threading.Thread(target=nmr.run_acquisition_fid_command, daemon=True,
+                                  args=(4096, 64, 8, "mesures.bin", 13.9e6, 30e-6, 1000),
+                                  kwargs={"session": board, "stream_port": port})
+        remote.start()
+        receiver = FIDStreamReceiver(board.host, port, save_path=str(tmp_path / "Stream0"))
+        receiver.connect(wait=5)
+        assert receiver.run() == 8
+        remote.join(timeout=5)
+        assert not remote.is_alive()
+        assert board.commands[0].split("&&")[1].split()[0] == "./" + nmr.STREAM_PROGRAM
+        assert board.commands[0].split()[-1] == str(port)
+    finally:
+        board.cleanup()
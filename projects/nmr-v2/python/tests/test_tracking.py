@@ -0,0 +1,35 @@
+"""
+LarmorSearch against SimulatedFIDSource: convergence within the tolerance and the
+acquisition budget for lines on and off the start frequency, and a clean failure
+when the line lies outside the probed span.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from NMR_Tracking import LarmorSearch, SimulatedFIDSource
+
+F_START = 13.9e6
+
+@pytest.mark.parametrize("offset", [0.0, 5e3, -20e3])
+def test_search_converges(offset):
+    source = SimulatedFIDSource(F_START + offset, seed=int(abs(offset)))
+    search = LarmorSearch(source, tolerance=50.0, coarse_step=3000.0, max_span=100e3, max_acquisitions=12)
+    result = search.run(F_START)
+    assert result["converged"]
+    assert abs(result["frequency"] - source.larmor) <= search.tolerance
+    assert result["acquisitions"] <= search.max_acquisitions
+    assert source.calls == result["acquisitions"] == len(result["history"])
+
+def test_search_out_of_span_fails_cleanly():
+    source = SimulatedFIDSource(F_START + 500e3)
+    search = LarmorSearch(source, coarse_step=3000.0, max_span=10e3, max_acquisitions=12)
+    result = search.run(F_START)
+    assert result["frequency"] is None
+    assert not result["converged"]
+    # the coarse stage probes f_start and +/- k*coarse_step up to max_span, then stops
+    assert result["acquisitions"] == source.calls == 7
+    assert not any(entry["detected"] for entry in result["history"])
@@ -0,0 +1,159 @@
+#define _BSD_SOURCE
+
+#include <stdio.h>
+#include <stdint.h>
+#include <stdlib.h>
+#include <unistd.h>
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/ioctl.h>
+
+#include "functions.h"
+
+#define CMA_ALLOC _IOWR('Z', 0, uint32_t)
+#define CLOCK_HZ 125e+6
+
+/*
+ * Accumulation en streaming : même ligne de commande qu'Acquisition_axi.exe, plus le port TCP
+ *   ./Acquisition_stream.exe samplesNb dec FidNb filePath larmorFrequency excitationDuration delayRepeat port
+ * Chaque FID est envoyé au PC dès qu'il est acquis (en-tête .bin puis FidNb blocs de samplesNb int16,
+ * voir NMR_Stream.FIDStreamReceiver). filePath n'est pas écrit : le PC garde sa propre copie du flux.
+ * Les registres de la FSM sont ceux de FSM-nmr-v2-test.c.
+ */
+int main(int argc, char **argv)
+{
+  int fd;
+  volatile uint8_t *rst;
+  volatile void    *cfg, *sts;
+  volatile int16_t *ram;
+  volatile uint8_t *fsm_sts;
+
+  uint32_t size;
+  uint32_t nb_of_Samples, nb_of_Bytes, decimation, number_of_fids;
+  double larmor_frequency, excitation_duration, delay_repeat_us;
+  uint16_t amplitude = 1024;
+  int gainValue = 0;
+  int stream_port, sock;
+  int16_t *fid;
+
+  if (argc < 9) {
+      printf("usage : %s samplesNb dec FidNb filePath larmorFrequency excitationDuration delayRepeat port\n", argv[0]);
+      return -1;
+  }
+  nb_of_Samples = (uint32_t) atof(argv[1]);
+  decimation = (uint32_t) atoi(argv[2]);
+  number_of_fids = (uint32_t) atoi(argv[3]);
+  larmor_frequency = atof(argv[5]);
+  excitation_duration = atof(argv[6]);
+  delay_repeat_us = atof(argv[7]);
+  stream_port = atoi(argv[8]);
+  if (nb_of_Samples == 0 || stream_port <= 0) {
+      printf("nombre d'échantillons ou port invalide\n");
+      return -1;
+  }
+
+  if((fd = open("/dev/mem", O_RDWR)) < 0)
+  {
+    perror("open");
+    return EXIT_FAILURE;
+  }
+
+  cfg = mmap(NULL, sysconf(_SC_PAGESIZE), PROT_READ|PROT_WRITE, MAP_SHARED, fd, 0x40000000);
+  sts = mmap(NULL, sysconf(_SC_PAGESIZE), PROT_READ|PROT_WRITE, MAP_SHARED, fd, 0x41000000);
+
+  close(fd);
+
+  if((fd = open("/dev/cma", O_RDWR)) < 0)
+  {
+    perror("open");
+    return EXIT_FAILURE;
+  }
+
+  size = 1024*sysconf(_SC_PAGESIZE);
+
+  if(ioctl(fd, CMA_ALLOC, &size) < 0)
+  {
+    perror("ioctl");
+    return EXIT_FAILURE;
+  }
+
+  nb_of_Bytes = nb_of_Samples * 4; // *2 (16bits) *2 (2 channels)
+  if (nb_of_Bytes > size) {
+      printf("trop d'échantillons : %u octets pour un tampon de %u\n", nb_of_Bytes, size);
+      return -1;
+  }
+
+  ram = mmap(NULL, 1024*sysconf(_SC_PAGESIZE), PROT_READ|PROT_WRITE, MAP_SHARED, fd, 0);
+
+  // un seul canal (IN2, comme le gain de l'en-tête) est envoyé : FID désentrelacé dans ce tampon
+  fid = malloc(nb_of_Samples * sizeof(int16_t));
+  if (fid == NULL) {
+      perror("malloc");
+      return EXIT_FAILURE;
+  }
+
+  printf("attente du client sur le port %d\n", stream_port);
+  if ((sock = open_stream_socket(stream_port)) < 0) {
+      free(fid);
+      return -1;
+  }
+  if (send_header_to_socket(sock, nb_of_Samples, decimation, number_of_fids, gainValue)) {
+      close(sock);
+      free(fid);
+      return -1;
+  }
+
+  rst         = (uint8_t *)(cfg + 0);     //8 bits of reset
+  fsm_sts     = (uint8_t *)(sts + 0);  //8bits vector status
+
+  //amplitude
+  *(uint32_t *)(cfg + 2) = amplitude ;
+
+  // set writer address
+  *(uint32_t *)(cfg + 4) = size;
+
+  // set number of samples
+  *(uint32_t *)(cfg + 8) = nb_of_Bytes - 1;
+
+  // phase step of the 32-bit NCO: f * 2^32 / 125 MHz
+  *(uint32_t *)(cfg + 12) = (uint32_t) (larmor_frequency / CLOCK_HZ * 4294967296.0 + 0.5);
+
+  // excitation time
+  *(uint32_t *)(cfg + 16) = (uint32_t) (excitation_duration * CLOCK_HZ);
+
+  // acquisition time
+  *(uint32_t *)(cfg + 20) = nb_of_Samples * decimation;
+
+  for (uint32_t n = 0; n < number_of_fids; ++n)
+  {
+    *rst |= 1;
+    *rst &= ~1;
+    *rst &= ~2;
+    usleep(100);
+    *rst |= 1;
+
+    usleep(100);
+    *rst |= 2;
+    usleep(100);
+    *rst &= ~2;
+
+    while (((*fsm_sts) & 1) == 0) {
+      usleep(200);
+    }
+    for (uint32_t i = 0; i < nb_of_Samples; ++i) {
+      fid[i] = ram[2 * i + 1];
+    }
+    if (send_to_socket(sock, fid, nb_of_Samples)) {
+      // client parti (arrêt anticipé côté PC) : fin de l'accumulation
+      printf("client déconnecté après %u FID\n", n);
+      break;
+    }
+    if (delay_repeat_us > 0) {
+      usleep((useconds_t) delay_repeat_us);
+    }
+  }
+
+  close(sock);
+  free(fid);
+  return EXIT_SUCCESS;
+}
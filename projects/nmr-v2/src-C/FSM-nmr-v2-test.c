@@ -33,12 +33,17 @@ int main(int argc, char **argv)
   uint32_t acquisition_time = 125e+6*2;
 
   char nomFichier[64] = "test1.bin";
+  int stream_port = 0; // > 0 : envoie les FID sur un socket TCP au lieu du fichier
+  int sock = -1;
 
   int phase_step = atoi(argv[1]);
   if (phase_step == NULL) {
       printf("Veuillez fournir un argument pour phase_step\n");
       return -1;
   }
+  if (argc > 2) {
+      stream_port = atoi(argv[2]);
+  }
 
   if((fd = open("/dev/mem", O_RDWR)) < 0)
   {
@@ -69,8 +74,10 @@ int main(int argc, char **argv)
 
   ram = mmap(NULL, 1024*sysconf(_SC_PAGESIZE), PROT_READ|PROT_WRITE, MAP_SHARED, fd, 0);
   
-  ////Create file
-  FILE *fichier = fopen(nomFichier, "wb+");
+  ////Create file (pas de fichier en mode streaming)
+  FILE *fichier = NULL;
+  if (stream_port <= 0) {
+    fichier = fopen(nomFichier, "wb+");
     printf("fichier crée : ");
     puts(nomFichier);
     if (fichier == NULL) {
@@ -79,8 +86,18 @@ int main(int argc, char **argv)
     }
     if (build_file(fichier, nb_of_Samples, decimation, number_of_files, gainValue)){
         perror("Erreur de creation fichier\n");
+        fclose(fichier);
         return -1;
     }
+  }
+  
+  if (stream_port > 0) {
+      printf("attente du client sur le port %d\n", stream_port);
+      if ((sock = open_stream_socket(stream_port)) < 0) {
+          return -1;
+      }
+      send_header_to_socket(sock, nb_of_Samples, decimation, number_of_files, gainValue);
+  }
   
   nb_of_Bytes = nb_of_Samples * 4; // *2 (16bits) *2 (2 channels) 
   rst         = (uint8_t *)(cfg + 0);     //8 bits of reset
@@ -129,7 +146,13 @@ int main(int argc, char **argv)
     value[1] = ram[2 * i + 1];
     printf("%5d, %5d, %5d\n", value[0], value[1],i);
   }
-  add_to_file(fichier, ram, nb_of_Samples);
+  if (sock >= 0) {
+      send_to_socket(sock, (int16_t *)ram, nb_of_Samples);
+      close(sock);
+  } else {
+      add_to_file(fichier, (int16_t *)ram, nb_of_Samples);
+      fclose(fichier);
+  }
   
   return EXIT_SUCCESS;
 }
\ No newline at end of file
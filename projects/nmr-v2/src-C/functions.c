@@ -2,6 +2,7 @@
 #include <stdint.h>
 #include <stdlib.h>
 #include <unistd.h>
+#include <string.h>
 
 #include "functions.h"
 
@@ -57,4 +58,57 @@ int add_to_file(FILE *file, int16_t *ram, int nb_of_Samples){
         perror("error open file to add samples");
         return -1;
     }
-}
\ No newline at end of file
+}
+
+int open_stream_socket(int port){
+    int sock_server, sock_client, yes = 1;
+    struct sockaddr_in addr;
+
+    if((sock_server = socket(AF_INET, SOCK_STREAM, 0)) < 0){
+        perror("socket");
+        return -1;
+    }
+    setsockopt(sock_server, SOL_SOCKET, SO_REUSEADDR, (void *)&yes , sizeof(yes));
+
+    memset(&addr, 0, sizeof(addr));
+    addr.sin_family = AF_INET;
+    addr.sin_addr.s_addr = htonl(INADDR_ANY);
+    addr.sin_port = htons(port);
+
+    if(bind(sock_server, (struct sockaddr *)&addr, sizeof(addr)) < 0){
+        perror("bind");
+        close(sock_server);
+        return -1;
+    }
+    listen(sock_server, 1);
+
+    sock_client = accept(sock_server, NULL, NULL);
+    if(sock_client < 0){
+        perror("accept");
+    }
+    close(sock_server);
+    return sock_client;
+}
+
+static int send_all(int sock, const char *data, size_t size){
+    ssize_t sent;
+    while(size > 0){
+        sent = send(sock, data, size, MSG_NOSIGNAL);
+        if(sent < 0){
+            perror("send");
+            return -1;
+        }
+        data += sent;
+        size -= sent;
+    }
+    return 0;
+}
+
+int send_header_to_socket(int sock, int dsize, int dec, int number_of_files, int gainValue){
+    int header[4] = {dsize, dec, number_of_files, gainValue};
+    return send_all(sock, (const char *)header, sizeof(header));
+}
+
+int send_to_socket(int sock, int16_t *ram, int nb_of_Samples){
+    return send_all(sock, (const char *)ram, sizeof(int16_t) * nb_of_Samples);
+}
@@ -2,6 +2,9 @@
 #include <stdint.h>
 #include <stdlib.h>
 #include <unistd.h>
+#include <sys/socket.h>
+#include <netinet/in.h>
+#include <arpa/inet.h>
 
 
 
@@ -27,3 +30,27 @@ int create_file(char* file_name, FILE *fp, int dsize, int dec, int number_of_fil
 
 int add_to_file(FILE *file, int16_t *ram, int nb_of_Samples);
 
+/**
+ * @brief Ouvre un socket TCP en écoute sur le port donné et attend un client (mode streaming).
+ *
+ * @param port              Port TCP d'écoute.
+ *
+ * @return int              Descripteur du socket client, -1 si erreur.
+ */
+int open_stream_socket(int port);
+
+/**
+ * @brief Envoie l'en-tête de 16 octets (identique à build_file) sur le socket de streaming.
+ *
+ * @return int              0 si succès, -1 si erreur d'envoi.
+ */
+int send_header_to_socket(int sock, int dsize, int dec, int number_of_files, int gainValue);
+
+/**
+ * @brief Envoie un FID (nb_of_Samples échantillons int16) sur le socket, comme add_to_file le fait pour un fichier.
+ *
+ * Le flux reçu par le PC est ainsi identique octet pour octet à un fichier .bin.
+ *
+ * @return int              0 si succès, -1 si erreur d'envoi (client déconnecté).
+ */
+int send_to_socket(int sock, int16_t *ram, int nb_of_Samples);
@@ -0,0 +1,114 @@
+"""
+Co-addition of successive pulsed-nmr frames with receiver phase cycling.
+
+Each frame (size samples of 4 int32, as received by PulsedNMR) is converted to
+complex I/Q, rotated by the receiver phase of its scan and added in place to a
+float64 complex accumulator. All buffers are allocated once, so averaging any
+number of scans uses constant memory and no per-frame allocation; the running
+average, its envelope and an SNR estimate are computed on demand.
+"""
+
+import numpy as np
+
+from sequences import CYCLOPS
+
+FULL_SCALE = 1 << 30
+
+
+class CoAdder:
+    """
+    Phase-cycled signal averager.
+    Parameters:
+      size    : samples per frame
+      cycle   : receiver phases in degrees applied to successive scans (None = no cycling);
+                use the transmitter phase offsets of the sequence (CYCLOPS by default)
+      channel : receiver channel (0 or 1)
+      noise   : (start, stop) fractions of the frame used as noise region for the SNR
+    Attributes:
+      count      : scans accumulated since the last reset
+      scans      : scans received since the last restart (drives the phase cycle)
+      first_scan : frames of earlier scans are skipped (in flight when reset was called)
+    """
+
+    def __init__(self, size, cycle=CYCLOPS, channel=0, noise=(0.8, 1.0)):
+        self.size = size
+        self.channel = channel
+        self.noise = noise
+        phases = np.zeros(1) if cycle is None else np.asarray(cycle, np.float64)
+        self.rotations = np.exp(-1j * np.deg2rad(phases))
+        self.total = np.zeros(size, np.complex128)
+        self.frame = np.zeros(size, np.complex128)
+        self.mean = np.zeros(size, np.complex128)
+        self.envelope = np.zeros(size, np.float64)
+        self.count = 0
+        self.scans = 0
+        self.first_scan = 0
+
+    @property
+    def cycle_length(self):
+        return len(self.rotations)
+
+    def phase(self, scan=None):
+        """Transmitter/receiver phase offset in degrees of a scan (default: the next one)."""
+        scan = self.scans if scan is None else scan
+        return float(np.rad2deg(-np.angle(self.rotations[scan % len(self.rotations)])) % 360.0)
+
+    def add(self, data):
+        """
+        Add one frame: int32 array (size, 4) or any array reshapable to it.
+        Returns False if the frame was skipped (scan before first_scan).
+        """
+        if self.scans < self.first_scan:
+            self.scans += 1
+            return False
+        data = data.reshape(self.size, 4)
+        self.frame.real[:] = data[:, 2 * self.channel]
+        self.frame.imag[:] = data[:, 2 * self.channel + 1]
+        self.frame *= self.rotations[self.scans % len(self.rotations)]
+        self.total += self.frame
+        self.count += 1
+        self.scans += 1
+        return True
+
+    def average(self):
+        """Running average (complex, full scale = 1) in a reused buffer."""
+        if self.count:
+            np.multiply(self.total, 1.0 / (self.count * FULL_SCALE), out=self.mean)
+        else:
+            self.mean[:] = 0
+        return self.mean
+
+    def average_envelope(self):
+        """Magnitude of the running average in a reused buffer."""
+        np.abs(self.average(), out=self.envelope)
+        return self.envelope
+
+    def snr(self):
+        """Peak of the averaged envelope over the standard deviation of the complex noise region."""
+        mean = self.average()
+        start, stop = int(self.noise[0] * self.size), int(self.noise[1] * self.size)
+        noise = mean[start:stop]
+        sigma = np.sqrt(np.mean(np.abs(noise - noise.mean()) ** 2)) if stop - start > 1 else 0.0
+        peak = np.abs(mean[:start]).max() if start > 0 else np.abs(mean).max()
+        return float(peak / sigma) if sigma > 0 else float("inf")
+
+    def complete_cycles(self):
+        """Number of complete phase cycles in the accumulation."""
+        return self.count // len(self.rotations)
+
+    def reset(self, first_scan=None):
+        """
+        Clear the accumulation; the phase cycle continues (frames in flight stay in step).
+        first_scan : number of the first scan to accumulate, e.g. the number of sequences
+                     sent so far after a frequency or rate change: the frames still in flight
+                     were acquired with the old settings and are skipped
+        """
+        self.total[:] = 0
+        self.count = 0
+        if first_scan is not None:
+            self.first_scan = first_scan
+
+    def restart(self):
+        """Clear the accumulation and restart the phase cycle at its first phase."""
+        self.reset(0)
+        self.scans = 0
@@ -0,0 +1,252 @@
+"""
+Local stand-in for the pulsed-nmr server (port 1001) for offline tests and benchmarks.
+
+It speaks the same protocol as server/pulsed-nmr.c (commands 0/1/2/7/8/9/10/11,
+uint64 code << 60 | data) and answers a start command with the requested number
+of I/Q samples (4 int32 per sample, sent in blocks of 2048 like the server).
+The samples come from a simple Bloch model of the sample: a set of isochromats
+with a Lorentzian distribution of offsets (T2*), T2 and T1 relaxation, pulses as
+rotations about an axis at the pulse phase (flip angle proportional to
+width * level, 90 degrees for t90 at full level), so FIDs, spin echoes, CPMG
+trains and inversion recovery come out of the pulse program itself. Channel 1
+carries the signal plus noise, channel 2 noise only.
+
+    python fake_pulsed_nmr.py --port 1001 --larmor 19e6 --t2 20e-3
+
+then connect PulsedNMR to 127.0.0.1.
+"""
+
+import argparse
+import socketserver
+import struct
+import time
+
+import numpy as np
+
+from pulse_sequence import CLOCK, MAX_LEVEL, MAX_PULSES
+
+FULL_SCALE = 1 << 30
+BLOCK = 2048
+
+
+class SpinSystem:
+    """
+    Isochromat model of the sample.
+    Parameters:
+      larmor      : resonance frequency in Hz
+      t90         : 90 degree pulse length at full level, in seconds
+      t1, t2      : longitudinal and transverse relaxation times in seconds
+      t2_star     : FID decay time in seconds (sets the spread of the isochromats)
+      amplitude   : signal of the full magnetization, as a fraction of the ADC full scale
+      noise       : noise standard deviation, as a fraction of the full scale
+      isochromats : number of isochromats
+    """
+
+    def __init__(self, larmor=19.0e6, t90=10.0e-6, t1=50.0e-3, t2=20.0e-3, t2_star=1.0e-3, amplitude=0.01,
+                 noise=0.001, isochromats=256, seed=0):
+        self.larmor = larmor
+        self.t90 = t90
+        self.t1 = t1
+        self.t2 = t2
+        self.amplitude = amplitude
+        self.noise = noise
+        self.rng = np.random.default_rng(seed)
+        # Lorentzian quantiles: the ensemble decays as exp(-t / t2_star)
+        quantiles = (np.arange(isochromats) + 0.5) / isochromats
+        self.offsets = np.tan(np.pi * (quantiles - 0.5)) / (2 * np.pi * t2_star)
+        self.reset()
+
+    def reset(self):
+        """Magnetization at equilibrium (along z)."""
+        self.mxy = np.zeros(len(self.offsets), np.complex128)
+        self.mz = np.ones(len(self.offsets))
+
+    def rotate(self, angle, phase):
+        """Pulse of flip angle `angle` about the transverse axis at `phase` (radians)."""
+        # in the frame of the rotation axis the pulse is a rotation about x
+        axis = np.exp(1j * phase)
+        m = self.mxy * np.conj(axis)
+        x, y = m.real, m.imag
+        c, s = np.cos(angle), np.sin(angle)
+        y, z = y * c - self.mz * s, y * s + self.mz * c
+        self.mxy = (x + 1j * y) * axis
+        self.mz = z
+
+    def evolve(self, duration, detuning, times=None):
+        """
+        Free precession for duration seconds with the excitation detuned by detuning Hz.
+        Returns the mean transverse magnetization at `times` (seconds from the start), if given.
+        """
+        signal = None
+        if times is not None and len(times):
+            phases = np.exp(2j * np.pi * np.outer(times, self.offsets + detuning))
+            signal = phases @ self.mxy / len(self.mxy) * np.exp(-times / self.t2)
+        self.mxy *= np.exp(2j * np.pi * (self.offsets + detuning) * duration - duration / self.t2)
+        self.mz = 1.0 - (1.0 - self.mz) * np.exp(-duration / self.t1)
+        return signal
+
+
+class FakePulsedNMR:
+    """State of one server connection: frequencies, sample rate and pulse program."""
+
+    def __init__(self, spins, realtime=False):
+        self.spins = spins
+        self.realtime = realtime
+        self.rx_freq = 19.0e6
+        self.tx_freq = 19.0e6
+        self.rate = 500
+        self.pulses = np.zeros((MAX_PULSES, 2), np.uint64)
+        self.size = 0
+
+    @property
+    def sample_rate(self):
+        return CLOCK / 2 / self.rate
+
+    def samples(self, count):
+        """I/Q record of count samples for the current pulse program, int32 (count, 4)."""
+        fs = self.sample_rate
+        detuning = self.spins.larmor - self.tx_freq
+        signal = np.zeros(count, np.complex128)
+        self.spins.reset()
+        t = 0.0
+        records = self.pulses[:self.size]
+        widths = (records[:, 0].astype(np.float64) + 1) / CLOCK
+        words = records[:, 1]
+        for width, word in zip(widths, words):
+            if t * fs >= count:
+                break
+            level = int(word >> np.uint64(32)) & 0xffff
+            gate = int(word >> np.uint64(48)) & 1
+            if gate and level:
+                phase = 2 * np.pi * (int(word) & ((1 << 30) - 1)) / (1 << 30)
+                angle = 0.5 * np.pi * width / self.spins.t90 * level / MAX_LEVEL
+                self.spins.rotate(angle, phase)
+            else:
+                self._record(signal, t, width, detuning, fs)
+            t += width
+        if t * fs < count:
+            self._record(signal, t, count / fs - t, detuning, fs)
+        # the receiver demodulates at rx_freq, the spins are driven at tx_freq
+        time_axis = np.arange(count) / fs
+        signal *= self.spins.amplitude * np.exp(2j * np.pi * (self.tx_freq - self.rx_freq) * time_axis)
+        data = self.spins.rng.normal(0.0, self.spins.noise, (count, 4))
+        data[:, 0] += signal.real
+        data[:, 1] += signal.imag
+        return np.clip(np.rint(data * FULL_SCALE), -FULL_SCALE, FULL_SCALE - 1).astype(np.int32)
+
+    def _record(self, signal, start, duration, detuning, fs):
+        first = int(np.ceil(start * fs))
+        last = min(int(np.ceil((start + duration) * fs)), len(signal))
+        times = np.arange(first, last) / fs - start if last > first else None
+        values = self.spins.evolve(duration, detuning, times)
+        if values is not None:
+            signal[first:last] = values
+
+    def handle(self, code, data, connection):
+        """Execute one command; returns False when the connection must be closed."""
+        if code == 0 and data <= 62500000:
+            self.rx_freq = float(data)
+        elif code == 1 and data <= 62500000:
+            self.tx_freq = float(data)
+        elif code == 2 and 50 <= data <= 2500:
+            self.rate = data
+        elif code == 7:
+            self.size = 0
+        elif code == 8 and self.size < MAX_PULSES:
+            self.pulses[self.size] = (data, 0)
+            self.size += 1
+        elif code == 9 and self.size > 0:
+            self.pulses[self.size - 1, 1] = data
+        elif code == 10:
+            return self.send_samples(data, connection)
+        elif code == 11:
+            block = recv_exact(connection, data * 16)
+            if block is None:
+                return False
+            if self.size + data <= MAX_PULSES:
+                self.pulses[self.size:self.size + data] = np.frombuffer(block, "<u8").reshape(-1, 2)
+                self.size += data
+        return True
+
+    def send_samples(self, count, connection):
+        data = self.samples(count)
+        start = time.monotonic()
+        for first in range(0, count, BLOCK):
+            if self.realtime:
+                delay = start + (first + BLOCK) / self.sample_rate - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            try:
+                connection.sendall(data[first:first + BLOCK].tobytes())
+            except OSError:
+                return False
+        return True
+
+
+def recv_exact(connection, size):
+    """Receive exactly size bytes (None if the connection is closed first)."""
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        n = connection.recv_into(view[received:], size - received)
+        if n == 0:
+            return None
+        received += n
+    return bytes(buffer)
+
+
+class Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        state = FakePulsedNMR(self.server.spins_factory(), self.server.realtime)
+        while True:
+            command = recv_exact(self.request, 8)
+            if command is None:
+                break
+            (value,) = struct.unpack("<Q", command)
+            if not state.handle(value >> 60, value & ((1 << 60) - 1), self.request):
+                break
+
+
+class FakeServer(socketserver.ThreadingTCPServer):
+    """
+    Threaded TCP server; every connection gets its own server state and spin system.
+    Parameters:
+      address       : (host, port); port 0 picks a free port (see server_address)
+      spins_factory : callable returning a SpinSystem
+      realtime      : pace the samples at the receiver sample rate
+    """
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 1001), spins_factory=SpinSystem, realtime=False):
+        super().__init__(address, Handler)
+        self.spins_factory = spins_factory
+        self.realtime = realtime
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated pulsed-nmr server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1001)
+    parser.add_argument("--larmor", type=float, default=19.0e6, help="resonance frequency in Hz")
+    parser.add_argument("--t90", type=float, default=10.0e-6, help="90 degree pulse at full level, seconds")
+    parser.add_argument("--t1", type=float, default=50.0e-3)
+    parser.add_argument("--t2", type=float, default=20.0e-3)
+    parser.add_argument("--t2-star", type=float, default=1.0e-3)
+    parser.add_argument("--amplitude", type=float, default=0.01, help="fraction of full scale")
+    parser.add_argument("--noise", type=float, default=0.001, help="fraction of full scale")
+    parser.add_argument("--realtime", action="store_true", help="pace the samples at the receiver rate")
+    args = parser.parse_args()
+
+    def spins():
+        return SpinSystem(args.larmor, args.t90, args.t1, args.t2, args.t2_star, args.amplitude, args.noise)
+
+    with FakeServer((args.host, args.port), spins, args.realtime) as server:
+        print(f"simulated pulsed-nmr server on {args.host}:{server.server_address[1]}")
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
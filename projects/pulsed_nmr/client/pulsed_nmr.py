@@ -5,6 +5,9 @@ import struct
 
 import numpy as np
 
+from coadd import CoAdder
+from pulse_sequence import PulseSequence
+
 import matplotlib
 
 from matplotlib.figure import Figure
@@ -42,15 +45,24 @@ class PulsedNMR(QMainWindow, Ui_PulsedNMR):
         self.idle = True
         # number of samples to show on the plot
         self.size = 50000
-        # buffer and offset for the incoming samples
-        self.buffer = bytearray(16 * self.size)
+        # preallocated buffer and offset for the incoming samples (4 int32 per sample)
+        self.data = np.zeros((self.size, 4), np.int32)
+        self.buffer = memoryview(self.data).cast("B")
         self.offset = 0
-        self.data = np.frombuffer(self.buffer, np.int32)
+        # reusable output buffer for the signal envelope
+        self.envelope = np.zeros(self.size, np.float32)
+        # phase-cycled co-addition of the successive frames and number of sequences sent
+        self.coadder = CoAdder(self.size)
+        self.sent = 0
+        # line artist and background of the axes for blitting
+        self.curve = None
+        self.background = None
         # create figure
         figure = Figure()
         figure.set_facecolor("none")
         self.axes = figure.add_subplot(111)
         self.canvas = FigureCanvas(figure)
+        self.canvas.mpl_connect("draw_event", self.save_background)
         self.plotLayout.addWidget(self.canvas)
         # create navigation toolbar
         self.toolbar = NavigationToolbar(self.canvas, self.plotWidget, False)
@@ -101,6 +113,8 @@ class PulsedNMR(QMainWindow, Ui_PulsedNMR):
     def connected(self):
         self.startTimer.stop()
         self.idle = False
+        self.coadder.restart()
+        self.sent = 0
         self.set_freq(self.freqValue.value())
         self.set_rate(self.rateValue.currentIndex())
         self.start_sequence()
@@ -109,16 +123,39 @@ class PulsedNMR(QMainWindow, Ui_PulsedNMR):
         self.startButton.setEnabled(True)
 
     def read_data(self):
-        size = self.socket.bytesAvailable()
-        if self.offset + size < 16 * self.size:
-            self.buffer[self.offset : self.offset + size] = self.socket.read(size)
-            self.offset += size
-        else:
-            self.buffer[self.offset : 16 * self.size] = self.socket.read(16 * self.size - self.offset)
-            self.offset = 0
-            # plot the signal envelope
-            self.curve.set_ydata(np.abs(self.data.astype(np.float32).view(np.complex64)[0::2] / (1 << 30)))
+        complete = False
+        while self.socket.bytesAvailable() > 0:
+            # never read past the end of the current frame
+            size = min(self.socket.bytesAvailable(), 16 * self.size - self.offset)
+            chunk = self.socket.read(size)
+            self.buffer[self.offset : self.offset + len(chunk)] = chunk
+            self.offset += len(chunk)
+            if self.offset == 16 * self.size:
+                self.offset = 0
+                # add the frame to the running average (in place), unless it predates the last reset
+                if self.coadder.add(self.data):
+                    complete = True
+        # only the last state is drawn
+        if complete:
+            # envelope of the running average, computed into the preallocated buffer
+            np.copyto(self.envelope, self.coadder.average_envelope(), casting="same_kind")
+            self.update_plot()
+            self.statusBar().showMessage("scans: %d, SNR: %.1f" % (self.coadder.count, self.coadder.snr()))
+
+    def save_background(self, event):
+        self.background = self.canvas.copy_from_bbox(self.axes.bbox)
+        if self.curve is not None:
+            self.axes.draw_artist(self.curve)
+
+    def update_plot(self):
+        self.curve.set_ydata(self.envelope)
+        if self.background is None:
             self.canvas.draw()
+            return
+        # redraw only the line on top of the saved background
+        self.canvas.restore_region(self.background)
+        self.axes.draw_artist(self.curve)
+        self.canvas.blit(self.axes.bbox)
 
     def display_error(self, socketError):
         self.startTimer.stop()
@@ -131,6 +168,8 @@ class PulsedNMR(QMainWindow, Ui_PulsedNMR):
     def set_freq(self, value):
         if self.idle:
             return
+        # frames of the sequences already sent were acquired at the old frequency
+        self.coadder.reset(self.sent)
         self.socket.write(struct.pack("<Q", 0 << 60 | int(1.0e6 * value)))
         self.socket.write(struct.pack("<Q", 1 << 60 | int(1.0e6 * value)))
 
@@ -145,7 +184,7 @@ class PulsedNMR(QMainWindow, Ui_PulsedNMR):
         self.axes.clear()
         self.axes.grid()
         # plot zeros and get store the returned Line2D object
-        (self.curve,) = self.axes.plot(time, np.zeros(self.size))
+        (self.curve,) = self.axes.plot(time, np.zeros(self.size), animated=True)
         x1, x2, y1, y2 = self.axes.axis()
         # set y axis limits
         self.axes.axis((x1, x2, -0.1, 1.1))
@@ -153,6 +192,8 @@ class PulsedNMR(QMainWindow, Ui_PulsedNMR):
         self.canvas.draw()
         if self.idle:
             return
+        # frames of the sequences already sent were acquired at the old rate
+        self.coadder.reset(self.sent)
         self.socket.write(struct.pack("<Q", 2 << 60 | int(125.0e6 / rate / 2)))
 
     def set_delta(self, value):
@@ -161,36 +202,18 @@ class PulsedNMR(QMainWindow, Ui_PulsedNMR):
         self.timer.stop()
         self.timer.start(value)
 
-    def clear_pulses(self):
-        if self.idle:
-            return
-        self.socket.write(struct.pack("<Q", 7 << 60))
-
-    def add_delay(self, gate, width):
-        if self.idle:
-            return
-        self.socket.write(struct.pack("<Q", 8 << 60 | int(width - 1)))
-        self.socket.write(struct.pack("<Q", 9 << 60 | int(gate << 48)))
-
-    def add_pulse(self, level, phase, width):
-        if self.idle:
-            return
-        phase = int(np.floor(phase / 360.0 * (1 << 30) + 0.5))
-        self.socket.write(struct.pack("<Q", 8 << 60 | int(width - 1)))
-        self.socket.write(struct.pack("<Q", 9 << 60 | int(1 << 48 | level << 32 | phase)))
-
     def start_sequence(self):
         if self.idle:
             return
-        awidth = np.floor(125 * self.awidthValue.value() + 0.5)
-        bwidth = np.floor(125 * self.bwidthValue.value() + 0.5)
-        delay = np.floor(125 * self.delayValue.value() + 0.5)
-        size = self.size
-        self.clear_pulses()
-        self.add_pulse(32766, 0, awidth)
-        self.add_delay(0, delay)
-        self.add_pulse(32766, 0, bwidth)
-        self.socket.write(struct.pack("<Q", 10 << 60 | int(size)))
+        sequence = PulseSequence()
+        sequence.pulse(self.awidthValue.value())
+        sequence.delay(self.delayValue.value())
+        sequence.pulse(self.bwidthValue.value())
+        # transmitter phase of this scan in the phase cycle (the receiver phase is applied by the co-adder)
+        sequence = sequence.phase_shifted(self.coadder.phase(self.sent))
+        self.sent += 1
+        # whole program (clear, pulses, start) in one write
+        self.socket.write(sequence.compile(self.size).tobytes())
 
 
 app = QApplication(sys.argv)
@@ -0,0 +1,134 @@
+"""
+Library of pulse sequences for the pulsed-nmr server and echo-train analysis.
+
+The generators return a PulseSequence (see pulse_sequence.py) together with the
+times, from the start of the sequence, at which the signal of interest is
+expected (echo centers, FID starts). compile() turns a sequence into one command
+array; compile(bulk=False) uses only the original 7/8/9/10 commands.
+
+echo_train() takes the received I/Q stream of one shot and integrates every
+echo window at once, so a complete T2 decay is obtained from a single CPMG
+shot instead of one single-echo acquisition per echo time.
+"""
+
+import numpy as np
+
+from pulse_sequence import MAX_LEVEL, PulseSequence
+
+# receiver/transmitter phase offsets of the CYCLOPS cycle, in degrees
+CYCLOPS = (0.0, 90.0, 180.0, 270.0)
+
+
+def cpmg(p90, echo_time, n_echoes, phase90=0.0, phase180=90.0, level=MAX_LEVEL):
+    """
+    Carr-Purcell-Meiboom-Gill train: 90(phase90) - TE/2 - [180(phase180) - TE] x n_echoes.
+    Parameters:
+      p90       : 90 degree pulse length in microseconds (the 180 pulse is 2 * p90)
+      echo_time : echo spacing TE in microseconds
+      n_echoes  : number of refocusing pulses / echoes
+    Returns:
+      sequence     : PulseSequence
+      echo_centers : (n_echoes,) echo centers in microseconds from the sequence start
+    """
+    p180 = 2 * p90
+    if echo_time <= p90 + p180:
+        raise ValueError("echo time too short for the pulses")
+    sequence = PulseSequence().pulse(p90, phase90, level)
+    sequence.delay(echo_time / 2 - p90 / 2 - p180 / 2)
+    block = PulseSequence().pulse(p180, phase180, level).delay(echo_time - p180)
+    sequence.extend(block, n_echoes)
+    echo_centers = p90 / 2 + echo_time * np.arange(1, n_echoes + 1)
+    return sequence, echo_centers
+
+
+def inversion_recovery(p90, recovery_times, repetition_delay, level=MAX_LEVEL):
+    """
+    Inversion recovery for several recovery times in one program:
+    [180 - tau_k - 90 - repetition_delay] for every tau_k.
+    Parameters:
+      p90              : 90 degree pulse length in microseconds
+      recovery_times   : tau values in microseconds
+      repetition_delay : delay after each read pulse (FID acquisition + T1 recovery), microseconds
+    Returns:
+      sequence   : PulseSequence
+      fid_starts : (n,) end of each read pulse in microseconds from the sequence start
+    """
+    recovery_times = np.asarray(recovery_times, np.float64)
+    sequence = PulseSequence()
+    fid_starts = np.empty(len(recovery_times))
+    elapsed = 0.0
+    for k, tau in enumerate(recovery_times):
+        sequence.pulse(2 * p90, 0.0, level).delay(tau).pulse(p90, 0.0, level).delay(repetition_delay)
+        elapsed += 3 * p90 + tau
+        fid_starts[k] = elapsed
+        elapsed += repetition_delay
+    return sequence, fid_starts
+
+
+def phase_cycled(sequence, repetition_delay, cycle=CYCLOPS):
+    """
+    One program running the sequence once per phase offset of the cycle,
+    separated by repetition_delay microseconds. Returns (sequence, shot_starts in microseconds).
+    """
+    shot = sequence.copy().delay(repetition_delay)
+    shot_starts = shot.duration() * np.arange(len(cycle))
+    return shot.phase_cycle(cycle), shot_starts
+
+
+def decode_samples(data, channel=0):
+    """
+    Received int32 stream (4 int32 per sample, as PulsedNMR.data) -> complex128 I/Q of one channel,
+    scaled like the envelope plot (full scale = 1).
+    """
+    data = np.asarray(data).reshape(-1, 4)
+    return (data[:, 2 * channel] + 1j * data[:, 2 * channel + 1]) / (1 << 30)
+
+
+def echo_train(samples, rate, echo_centers, window, offset=0.0, coherent=False):
+    """
+    Integrate every echo of a multi-echo shot in one pass.
+    Parameters:
+      samples      : complex I/Q samples of the shot (see decode_samples), or a (n_shots, n) stack
+      rate         : receiver sample rate in Hz
+      echo_centers : echo centers in microseconds from the sequence start
+      window       : width of the integration window in microseconds, centered on each echo
+      offset       : receiver start relative to the sequence start in microseconds
+      coherent     : integrate the complex signal (phase-sensitive) instead of its magnitude
+    Returns:
+      times      : echo times in microseconds (windows falling outside the record are dropped)
+      amplitudes : mean magnitude of each echo window, shape (n_echoes,) or (n_shots, n_echoes)
+    """
+    samples = np.asarray(samples)
+    n = samples.shape[-1]
+    half = window * 1.0e-6 * rate / 2
+    centers = (np.asarray(echo_centers, np.float64) - offset) * 1.0e-6 * rate
+    starts = np.floor(centers - half + 0.5).astype(np.int64)
+    stops = np.floor(centers + half + 0.5).astype(np.int64)
+    keep = (starts >= 0) & (stops <= n) & (stops > starts)
+    starts, stops = starts[keep], stops[keep]
+    times = np.asarray(echo_centers, np.float64)[keep]
+    if len(starts) == 0:
+        return times, np.zeros(samples.shape[:-1] + (0,))
+    if np.any(starts[1:] < stops[:-1]):
+        raise ValueError("echo windows overlap: window must be shorter than the echo spacing")
+    values = samples if coherent else np.abs(samples)
+    # windows as [start0, stop0, start1, stop1, ...]: every other reduceat sum is an echo
+    edges = np.stack([starts, stops], axis=1).ravel()
+    if edges[-1] == n:
+        edges = edges[:-1]
+    sums = np.add.reduceat(values, edges, axis=-1)[..., 0::2]
+    amplitudes = np.abs(sums) / (stops - starts)
+    return times, amplitudes
+
+
+def fit_t2(times, amplitudes):
+    """
+    Mono-exponential fit A * exp(-t / T2) of an echo train by weighted linear least squares on log(A).
+    Returns (A, T2) with T2 in the unit of times.
+    """
+    times = np.asarray(times, np.float64)
+    amplitudes = np.asarray(amplitudes, np.float64)
+    valid = amplitudes > 0
+    weights = amplitudes[valid]
+    slope, intercept = np.polyfit(times[valid], np.log(amplitudes[valid]), 1, w=weights)
+    return float(np.exp(intercept)), float(-1.0 / slope)
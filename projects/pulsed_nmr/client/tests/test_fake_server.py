@@ -0,0 +1,70 @@
+"""
+PulseSequence.compile against the simulated pulsed-nmr server: the bulk upload
+(command code 11) and the sample framing of the start command (count * 16 bytes,
+4 int32 per sample).
+"""
+import os
+import socket
+import sys
+import threading
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_pulsed_nmr import FULL_SCALE, SpinSystem, FakeServer
+from pulse_sequence import PulseSequence
+
+COUNT = 5000    # not a multiple of the 2048-sample blocks of the server
+
+@pytest.fixture
+def server():
+    with FakeServer(("127.0.0.1", 0)) as fake:
+        threading.Thread(target=fake.serve_forever, daemon=True).start()
+        yield fake
+        fake.shutdown()
+
+def _recv_exact(sock, size):
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:], size - received)
+        assert n, "connection closed after %d of %d bytes" % (received, size)
+        received += n
+    return bytes(buffer)
+
+def _acquire(server, program):
+    """Send one compiled program on a fresh connection; returns the samples as int32 (COUNT, 4)."""
+    with socket.create_connection(server.server_address, timeout=10) as sock:
+        sock.sendall(program.tobytes())
+        data = _recv_exact(sock, COUNT * 16)
+        sock.settimeout(0.2)
+        with pytest.raises(socket.timeout):
+            sock.recv(1)    # nothing after the requested samples
+    return np.frombuffer(data, np.int32).reshape(COUNT, 4)
+
+def _fid():
+    # 90 degree pulse at full level (t90 of the default SpinSystem)
+    return PulseSequence().pulse(SpinSystem().t90 * 1e6)
+
+def test_bulk_upload_frames_the_fid(server):
+    program = _fid().compile(COUNT, bulk=True)
+    assert program.dtype == np.dtype("<u8")
+    assert program[1] >> np.uint64(60) == 11 and program[1] & np.uint64((1 << 60) - 1) == 1
+    samples = _acquire(server, program)
+    signal = samples[:, 0] + 1j * samples[:, 1].astype(np.float64)
+    expected = SpinSystem().amplitude * FULL_SCALE
+    # full transverse magnetization right after the pulse on channel 1, noise only on channel 2
+    assert abs(signal[2]) == pytest.approx(expected, rel=0.2)
+    assert abs(signal[-100:]).mean() < 0.2 * expected
+    assert samples[:, 2].std() < 0.2 * expected
+
+def test_bulk_and_pairs_upload_the_same_program(server):
+    sequence = _fid().delay(200.0).pulse(20.0, phase=90.0)
+    bulk = sequence.compile(COUNT, bulk=True)
+    pairs = sequence.compile(COUNT, bulk=False)
+    assert len(bulk) == 1 + 1 + 2 * len(sequence) + 1
+    # every connection starts from the same seeded spin system: identical records
+    np.testing.assert_array_equal(_acquire(server, bulk), _acquire(server, pairs))
@@ -37,7 +37,7 @@ int main(int argc, char *argv[])
   struct sockaddr_in addr;
   uint64_t command, code, data, counter;
   uint32_t *buffer, *pulses;
-  int i, n, position, size, yes = 1;
+  int i, n, position, size, closed, yes = 1;
 
   size = 0;
   pulses = malloc(16777216);
@@ -125,7 +125,8 @@ int main(int argc, char *argv[])
       perror("accept");
       return EXIT_FAILURE;
     }
-    while(1)
+    closed = 0;
+    while(!closed)
     {
       if(recv(sock_client, (char *)&command, 8, MSG_WAITALL) <= 0) break;
       code = command >> 60;
@@ -226,6 +227,32 @@ int main(int argc, char *argv[])
           *rx_rst &= ~2;
           *tx_rst &= ~1;
           break;
+        case 11:
+          /* add pulses in one block: data records of 16 bytes (width - 1, gate/level/phase) */
+          if(size + data > 1048576)
+          {
+            /* too many pulses: drain the block */
+            counter = data * 16;
+            while(counter > 0)
+            {
+              n = counter > 32768 ? 32768 : counter;
+              if(recv(sock_client, (char *)buffer, n, MSG_WAITALL) < n)
+              {
+                /* connection lost: close it like a failed command read */
+                closed = 1;
+                break;
+              }
+              counter -= n;
+            }
+            break;
+          }
+          if(recv(sock_client, (char *)(pulses + size * 4), data * 16, MSG_WAITALL) < (ssize_t)(data * 16))
+          {
+            closed = 1;
+            break;
+          }
+          size += data;
+          break;
       }
     }
 